@@ -0,0 +1,153 @@
+import asyncio
+import math
+import time
+from collections import deque
+from http import HTTPStatus
+
+from .utils import error_response
+
+# Пределы для заголовка Retry-After, секунд
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+# Вес нового замера в скользящем среднем времени на единицу стоимости
+EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Допуск запросов к дорогому маршруту. estimate(scope) оценивает стоимость
+    запроса (для вычислений - число цифр результата по n). Запросы не дороже
+    cheap_cost проходят без ограничений, остальные выполняются не более чем
+    по max_concurrency одновременно, следующие ждут в очереди FIFO длиной до
+    max_queue не дольше queue_timeout. Когда очередь полна или ожидание
+    истекло, запрос получает 503 с Retry-After - оценкой времени, за которое
+    освободится место, по среднему времени на единицу стоимости.
+    """
+
+    def __init__(self, estimate, max_concurrency, max_queue, queue_timeout, cheap_cost=0):
+        self.estimate = estimate
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.cheap_cost = cheap_cost
+        self.running = 0
+        self.running_cost = 0
+        self.queued_cost = 0
+        self.stats = {"admitted": 0, "bypassed": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+        # Среднее время выполнения на единицу стоимости, секунд
+        self.seconds_per_cost = 0.0
+        # (future, cost); future получает True, когда место передано, False по таймауту
+        self._waiters = deque()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def snapshot(self):
+        return dict(
+            self.stats,
+            running=self.running,
+            queue_depth=self.queue_depth,
+            queued_cost=self.queued_cost,
+            max_concurrency=self.max_concurrency,
+            max_queue=self.max_queue,
+        )
+
+    def wrap(self, handler):
+        """Обработчик маршрута, который выполняется только после допуска."""
+
+        async def admitted(scope, receive, send):
+            cost = self.estimate(scope)
+            if cost <= self.cheap_cost:
+                self.stats["bypassed"] += 1
+                await handler(scope, receive, send)
+                return
+            try:
+                await self.acquire(cost)
+            except AdmissionRejected as exc:
+                await error_response(
+                    send,
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    headers=((b"retry-after", b"%d" % exc.retry_after),),
+                )
+                return
+            started = time.perf_counter()
+            try:
+                await handler(scope, receive, send)
+            finally:
+                self.release(cost, time.perf_counter() - started)
+
+        return admitted
+
+    async def acquire(self, cost):
+        """Ждет места; AdmissionRejected, если очередь полна или ожидание истекло."""
+        if self.running < self.max_concurrency and not self._waiters:
+            self._start(cost)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(self.retry_after(cost))
+        loop = asyncio.get_running_loop()
+        entry = (loop.create_future(), cost)
+        self._waiters.append(entry)
+        self.queued_cost += cost
+        self.stats["queued"] += 1
+        timer = loop.call_later(self.queue_timeout, self._expire, entry)
+        try:
+            granted = await entry[0]
+        except asyncio.CancelledError:
+            # Клиент отключился: место, которое уже успели передать, возвращается
+            future = entry[0]
+            if future.done() and not future.cancelled() and future.result():
+                self.release(cost)
+            else:
+                self._forget(entry)
+            raise
+        finally:
+            timer.cancel()
+        if not granted:
+            self.stats["timed_out"] += 1
+            raise AdmissionRejected(self.retry_after(cost))
+
+    def release(self, cost, elapsed=None):
+        self.running -= 1
+        self.running_cost -= cost
+        if elapsed is not None and cost > 0:
+            sample = elapsed / cost
+            self.seconds_per_cost += EWMA_ALPHA * (sample - self.seconds_per_cost)
+        while self._waiters and self.running < self.max_concurrency:
+            future, queued = self._waiters.popleft()
+            self.queued_cost -= queued
+            if future.done():
+                continue
+            self._start(queued)
+            future.set_result(True)
+
+    def retry_after(self, cost):
+        # Вся работа впереди запроса делится между max_concurrency местами
+        pending = self.running_cost + self.queued_cost + cost
+        seconds = pending * self.seconds_per_cost / max(self.max_concurrency, 1)
+        return min(max(math.ceil(seconds), MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def _start(self, cost):
+        self.running += 1
+        self.running_cost += cost
+        self.stats["admitted"] += 1
+
+    def _expire(self, entry):
+        if not entry[0].done():
+            self._forget(entry)
+            entry[0].set_result(False)
+
+    def _forget(self, entry):
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        self.queued_cost -= entry[1]
@@ -0,0 +1,93 @@
+"""
+Бенчмарк допуска к вычислениям под перегрузкой: --burst одновременных
+запросов /factorial с разными большими n (без кэша и объединения), пока
+отдельная задача раз в 10 мс шлет дешевый запрос на несуществующий путь.
+Сравнивается работа без ограничений (очередь пула не ограничена) и с
+AdmissionController маршрута: время ответа на вычисления, число 503 и
+задержка дешевых запросов.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.admission_benchmark --n 20000 --burst 64
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from task_1.main import app, compute
+
+
+async def call(path, query_string=b""):
+    request = {"type": "http.request", "body": b"", "more_body": False}
+    status = None
+
+    async def receive():
+        return request
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string, "headers": []}
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return status, time.perf_counter() - started
+
+
+async def probe(stop, latencies):
+    # Задержка считается от момента, когда запрос должен был прийти: в нее
+    # входит и время, на которое event loop был занят
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        await call("/missing")
+        latencies.append(time.perf_counter() - started - 0.01)
+
+
+def p99(values):
+    return statistics.quantiles(values, n=100)[98] if len(values) > 1 else values[0]
+
+
+async def measure(name, n, burst):
+    compute.cache.clear()
+    stop, latencies = asyncio.Event(), []
+    prober = asyncio.create_task(probe(stop, latencies))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call("/factorial", b"n=%d" % (n + i)) for i in range(burst)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    served = [seconds for status, seconds in results if status == 200]
+    rejected = sum(status == 503 for status, _ in results)
+    print(
+        f"{name:14} всего {elapsed:6.2f} с, 200: {len(served):3}, 503: {rejected:3}, "
+        f"p99 ответа 200 {p99(served) * 1e3:8.0f} мс, p99 дешевого {p99(latencies) * 1e3:6.1f} мс"
+    )
+
+
+async def run(n, burst, max_queue):
+    controller = app.admission["/factorial"]
+    # Пул запускается заранее, старт процессов в замер не входит
+    await compute.warm_up()
+    try:
+        limits = controller.max_concurrency, controller.max_queue
+        controller.max_concurrency = controller.max_queue = burst
+        await measure("без допуска", n, burst)
+        controller.max_concurrency, controller.max_queue = limits[0], max_queue
+        controller.queue_timeout = 30.0
+        controller.stats = dict.fromkeys(controller.stats, 0)
+        await measure("с допуском", n, burst)
+        print("счетчики:", controller.snapshot())
+    finally:
+        compute.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--burst", type=int, default=64)
+    parser.add_argument("--max-queue", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.n, args.burst, args.max_queue))
@@ -0,0 +1,69 @@
+"""
+Бенчмарк /factorial под нагрузкой: --requests одновременных запросов
+n = --n, из них --distinct разных. Во время вычислений отдельная задача
+замеряет задержку event loop, как ее увидел бы дешевый запрос. Сравнивается
+прежний вариант (math.factorial и json.dumps прямо в обработчике) и
+ComputeService с пулом процессов, кэшем и объединением одинаковых запросов.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.factorial_benchmark --n 100000 --requests 8 --distinct 2
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+
+from task_1.calculations import factorial_digits
+from task_1.compute import ComputeService
+from task_1.settings import MathSettings
+
+
+async def legacy_factorial(n):
+    """Прежний обработчик: вычисление и сериализация в event loop."""
+    return json.dumps({"result": math.factorial(n)}).encode("utf-8")
+
+
+async def probe(stop, lags):
+    # Задержка пробуждения относительно запрошенного sleep - время, на которое заблокирован loop
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def measure(name, factorial, values):
+    stop, lags = asyncio.Event(), []
+    prober = asyncio.create_task(probe(stop, lags))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(factorial(n) for n in values))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    print(f"{name:10} все запросы {elapsed * 1e3:9.1f} мс, макс. задержка loop {max(lags) * 1e3:9.1f} мс")
+
+
+async def run(n, requests, distinct, workers):
+    sys.set_int_max_str_digits(0)
+    values = [n + i % distinct for i in range(requests)]
+    await measure("прежний", legacy_factorial, values)
+    service = ComputeService(MathSettings(workers=workers))
+    # Пул запускается заранее, старт процессов в замер не входит
+    await service.factorial(3000, service.settings.inline_max_digits + 1)
+    try:
+        await measure("пул", lambda value: service.factorial(value, factorial_digits(value)), values)
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--distinct", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.n, args.requests, args.distinct, args.workers))
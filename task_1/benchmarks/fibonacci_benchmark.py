@@ -0,0 +1,61 @@
+"""
+Бенчмарк /fibonacci: прежний цикл O(n) против быстрого удвоения для
+n = 10^2..10^7, отдельно время перевода результата в десятичную запись:
+str(int) против to_decimal. Прежний цикл запускается только до
+--legacy-max-n, а str - до --str-max-n: дальше они идут минутами.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.fibonacci_benchmark --max-power 7
+"""
+
+import argparse
+import sys
+import time
+
+from task_1.calculations import calculate_fibonacci, to_decimal
+
+
+def legacy_fibonacci(n):
+    """Прежняя реализация из calculations.py."""
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def run(max_power, legacy_max_n, str_max_n):
+    sys.set_int_max_str_digits(0)
+    print(
+        f"{'n':>10} {'прежний, мс':>12} {'удвоение, мс':>13} {'str, мс':>10} "
+        f"{'to_decimal, мс':>15} {'цифр':>10}"
+    )
+    for power in range(2, max_power + 1):
+        n = 10**power
+        result, fast = timed(calculate_fibonacci, n)
+        legacy = "-"
+        if n <= legacy_max_n:
+            expected, elapsed = timed(legacy_fibonacci, n)
+            assert expected == result
+            legacy = f"{elapsed * 1e3:.2f}"
+        decimal, converted = timed(to_decimal, result)
+        to_str = "-"
+        if n <= str_max_n:
+            expected, elapsed = timed(str, result)
+            assert expected == decimal
+            to_str = f"{elapsed * 1e3:.2f}"
+        print(f"{n:>10} {legacy:>12} {fast * 1e3:>13.2f} {to_str:>10} {converted * 1e3:>15.2f} {len(decimal):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-power", type=int, default=7)
+    parser.add_argument("--legacy-max-n", type=int, default=10**5)
+    parser.add_argument("--str-max-n", type=int, default=10**6)
+    args = parser.parse_args()
+    run(args.max_power, args.legacy_max_n, args.str_max_n)
@@ -0,0 +1,70 @@
+"""
+Бенчмарк поиска маршрута MathAPI: прежний перебор словаря маршрутов со
+строковой подстановкой {n} на каждый запрос против дерева Router. Кроме
+маршрутов task_1 регистрируется --extra дополнительных пар маршрутов
+/extra{i} и /extra{i}/{n}, чтобы показать зависимость от их числа.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.router_benchmark --lookups 200000 --extra 50
+"""
+
+import argparse
+import time
+
+from task_1.routing import Router
+
+PATHS = ["/factorial", "/fibonacci/10", "/mean", "/not_found"]
+
+
+def legacy_resolve(routes, path):
+    """Прежняя логика MathAPI.__call__ без вызова обработчика."""
+    for route_path, handler in routes.items():
+        if "{n}" in route_path:
+            base_route = route_path.replace("/{n}", "")
+            if path.startswith(base_route):
+                return handler, {"n": path[len(base_route) + 1 :]}
+    if path in routes:
+        return routes[path], {}
+    return None
+
+
+def route_table(extra):
+    paths = ["/factorial", "/mean"]
+    for i in range(extra):
+        paths += [f"/extra{i}", f"/extra{i}/{{n}}"]
+    # Параметрический маршрут task_1 последним: прежний цикл проверяет его после всех
+    return paths + ["/fibonacci/{n}"]
+
+
+def measure(name, resolve, lookups):
+    started = time.perf_counter()
+    for i in range(lookups):
+        resolve(PATHS[i % len(PATHS)])
+    elapsed = time.perf_counter() - started
+    print(f"{name:8} {elapsed / lookups * 1e9:8.0f} нс на поиск")
+
+
+def run(lookups, extra):
+    paths = route_table(extra)
+    routes = {path: path for path in paths}
+    router = Router()
+    for path in paths:
+        router.add(path, path)
+
+    # Оба варианта находят одни и те же маршруты task_1
+    for path in PATHS:
+        legacy, route = legacy_resolve(routes, path), router.resolve(path)
+        assert (legacy is None) == (route is None)
+
+    print(f"маршрутов: {len(paths)}")
+    measure("прежний", lambda path: legacy_resolve(routes, path), lookups)
+    measure("Router", router.resolve, lookups)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--extra", type=int, default=50)
+    args = parser.parse_args()
+    for extra in sorted({0, args.extra}):
+        run(args.lookups, extra)
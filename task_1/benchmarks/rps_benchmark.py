@@ -0,0 +1,63 @@
+"""
+Бенчмарк пропускной способности MathAPI без сети: приложение вызывается
+напрямую как ASGI (scope, receive, send) в одном event loop, так что замер
+показывает накладные расходы маршрутизации, разбора запроса и сборки ответа.
+Для каждого маршрута выполняется --requests последовательных запросов.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.rps_benchmark --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+
+from task_1.main import app
+
+CASES = [
+    ("GET", "/factorial", b"n=20", b""),
+    ("GET", "/fibonacci/30", b"", b""),
+    ("POST", "/mean", b"", b"[1, 2.5, 3, 4, 5.5, 6, 7, 8]"),
+    ("POST", "/stats", b"percentiles=50%2C99", b"[1, 2.5, 3, 4, 5.5, 6, 7, 8]"),
+    ("GET", "/factorial", b"n=abc", b""),
+    ("GET", "/missing", b"", b""),
+]
+
+
+async def measure(method, path, query_string, body, requests):
+    statuses = []
+    request = {"type": "http.request", "body": body, "more_body": False}
+
+    async def receive():
+        return request
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    headers = [(b"host", b"localhost"), (b"content-type", b"application/json")]
+    started = time.perf_counter()
+    for _ in range(requests):
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query_string,
+            "headers": headers,
+        }
+        await app(scope, receive, send)
+    elapsed = time.perf_counter() - started
+    target = path + ("?" + query_string.decode() if query_string else "")
+    print(f"{method:4} {target:28} {statuses[-1]:3} {requests / elapsed:10.0f} запросов/с")
+
+
+async def run(requests):
+    for case in CASES:
+        await measure(*case, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
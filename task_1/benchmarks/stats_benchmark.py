@@ -0,0 +1,48 @@
+"""
+Бенчмарк /stats: разбор тела и расчет статистик для --samples чисел в виде
+JSON-массива и в виде application/octet-stream float64. Расчет идет через
+numpy, если он установлен, иначе через запасной вариант на чистом Python.
+
+Запуск из корня репозитория:
+    python -m task_1.benchmarks.stats_benchmark --samples 1000000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from array import array
+
+from task_1 import stats
+from task_1.stats import calculate_stats, parse_float64, parse_json_numbers
+
+
+def measure(name, parse, body):
+    started = time.perf_counter()
+    values = parse(body)
+    parsed = time.perf_counter()
+    calculate_stats(values)
+    finished = time.perf_counter()
+    print(
+        f"{name:8} {len(body) / 1e6:7.1f} МБ: разбор {(parsed - started) * 1e3:8.1f} мс, "
+        f"статистики {(finished - parsed) * 1e3:8.1f} мс"
+    )
+
+
+def run(samples):
+    numbers = [random.gauss(0, 1) for _ in range(samples)]
+    json_body = json.dumps(numbers).encode()
+    binary = array("d", numbers)
+    if sys.byteorder == "big":
+        binary.byteswap()
+    print("numpy" if stats.np is not None else "без numpy (чистый Python)")
+    measure("JSON", parse_json_numbers, json_body)
+    measure("float64", parse_float64, binary.tobytes())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(args.samples)
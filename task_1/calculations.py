@@ -1,16 +1,78 @@
+import decimal
 import math
 
+# Числа длиннее стольких бит переводятся в десятичную запись через decimal
+DECIMAL_SPLIT_BITS = 3000
+
 
 def calculate_factorial(n):
     return math.factorial(n)
 
 
+def factorial_digits(n):
+    """Оценка числа десятичных цифр n! через lgamma, без вычисления."""
+    if n < 2:
+        return 1
+    return int(math.lgamma(n + 1) / math.log(10)) + 1
+
+
+def factorial_decimal(n):
+    """Десятичная запись n! в байтах."""
+    return to_decimal(calculate_factorial(n)).encode("ascii")
+
+
 def calculate_fibonacci(n):
+    """F(n) быстрым удвоением: O(log n) умножений длинных чисел."""
+    # Пара (F(k), F(k+1)), k растет по битам n от старшего
     a, b = 0, 1
-    for _ in range(n):
-        a, b = b, a + b
+    for bit in bin(n)[2:]:
+        # F(2k) = F(k) * (2F(k+1) - F(k)), F(2k+1) = F(k)^2 + F(k+1)^2
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if bit == "1" else (c, d)
     return a
 
 
+def fibonacci_digits(n):
+    """Оценка числа десятичных цифр F(n) без вычисления."""
+    if n < 2:
+        return 1
+    # F(n) ~ phi^n / sqrt(5)
+    return int(n * 0.20898764024997873 - 0.3494850021680094) + 1
+
+
+def to_decimal(n):
+    """
+    Десятичная запись неотрицательного целого. str(int) квадратичен по длине
+    числа, поэтому длинное число делится пополам по битам, а половины
+    собираются умножением на 2^k в decimal, где умножение длинных чисел
+    быстрое.
+    """
+    if n.bit_length() <= DECIMAL_SPLIT_BITS:
+        return str(n)
+    context = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    powers = {}
+
+    def power_of_two(bits):
+        if bits not in powers:
+            powers[bits] = context.power(decimal.Decimal(2), bits)
+        return powers[bits]
+
+    def convert(n, bits):
+        if bits <= DECIMAL_SPLIT_BITS:
+            return decimal.Decimal(n)
+        low_bits = bits >> 1
+        high = n >> low_bits
+        low = n - (high << low_bits)
+        return context.add(convert(low, low_bits), context.multiply(convert(high, bits - low_bits), power_of_two(low_bits)))
+
+    return context.to_sci_string(convert(n, n.bit_length()))
+
+
+def fibonacci_decimal(n):
+    """Десятичная запись F(n) в байтах."""
+    return to_decimal(calculate_fibonacci(n)).encode("ascii")
+
+
 def calculate_mean(numbers):
     return sum(numbers) / len(numbers)
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .calculations import factorial_decimal, fibonacci_decimal
+from .settings import MathSettings
+from .stats import summarize
+
+
+class ResultCache:
+    """LRU-кэш результатов в байтах, ограничен числом записей и их объемом."""
+
+    def __init__(self, max_items, max_bytes):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_items <= 0 or len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+class ComputeService:
+    """
+    Вычисления для обработчиков MathAPI. Результат возвращается готовой
+    десятичной записью и запоминается в ResultCache. Стоимость оценивается
+    заранее по числу цифр результата: короткие (не длиннее inline_max_digits)
+    считаются прямо в event loop, длинные уходят в пул процессов вместе с
+    переводом в десятичную запись, чтобы не блокировать остальные запросы.
+    Одновременные запросы одного и того же результата ждут одно вычисление.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.cache = ResultCache(settings.cache_max_items, settings.cache_max_bytes)
+        self.stats = {"hits": 0, "inline": 0, "offloaded": 0, "deduplicated": 0}
+        self._pool = None
+        # Ключ -> задача вычисления в пуле, которую ждут все запросы ключа
+        self._inflight = {}
+
+    @property
+    def pool_size(self):
+        return self.settings.workers or os.cpu_count() or 1
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # spawn: форк процесса с потоками event loop небезопасен
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def warm_up(self):
+        """
+        Запускает процессы пула и импортирует в них вычисления заранее, чтобы
+        первый тяжелый запрос не ждал старта процессов (spawn - сотни мс).
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, factorial_decimal, 1) for _ in range(self.pool_size)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def cost(self, func, n, digits):
+        """Оценка стоимости запроса в цифрах результата; 0, если он в кэше или уже считается."""
+        key = (func.__name__, n)
+        if key in self.cache or key in self._inflight:
+            return 0
+        return digits
+
+    async def factorial(self, n, digits):
+        return await self._run(factorial_decimal, n, digits)
+
+    async def fibonacci(self, n, digits):
+        return await self._run(fibonacci_decimal, n, digits)
+
+    async def statistics(self, body, binary, percentiles):
+        """
+        Статистики набора из тела /stats. Разбор и расчет для 1M чисел
+        занимают около секунды, поэтому тела длиннее stats_inline_max_bytes
+        уходят в пул процессов целиком, а не блокируют event loop.
+        """
+        if len(body) <= self.settings.stats_inline_max_bytes:
+            self.stats["inline"] += 1
+            return summarize(body, binary, percentiles)
+        self.stats["offloaded"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, summarize, body, binary, percentiles)
+
+    async def _run(self, func, n, digits):
+        key = (func.__name__, n)
+        result = self.cache.get(key)
+        if result is not None:
+            self.stats["hits"] += 1
+            return result
+        if digits <= self.settings.inline_max_digits:
+            self.stats["inline"] += 1
+            result = func(n)
+            self.cache.put(key, result)
+            return result
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["offloaded"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._offload(key, func, n))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["deduplicated"] += 1
+        # Отмена одного запроса (клиент отключился) не отменяет вычисление для остальных
+        return await asyncio.shield(task)
+
+    async def _offload(self, key, func, n):
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.pool, func, n)
+        self.cache.put(key, result)
+        return result
+
+
+settings = MathSettings.from_env()
+
+compute = ComputeService(settings)
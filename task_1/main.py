@@ -1,53 +1,156 @@
+import os
 from http import HTTPStatus
-from .utils import json_response, get_request_body, get_query_params
-from .validation import validate_factorial, validate_fibonacci, validate_mean
-from .calculations import calculate_factorial, calculate_fibonacci, calculate_mean
+from .utils import (
+    RequestBodyTooLarge,
+    error_response,
+    get_content_length,
+    get_content_type,
+    get_query_params,
+    iter_request_body,
+    json_body_response,
+    json_response,
+    result_body,
+)
+from .validation import validate_factorial, validate_fibonacci, validate_percentiles
+from .admission import AdmissionController
+from .calculations import factorial_decimal, factorial_digits, fibonacci_decimal, fibonacci_digits
+from .compute import compute, settings
+from .stats import DEFAULT_PERCENTILES
+from .streaming import EmptyArrayError, StreamingMean
 from .math_api import MathAPI
 
 app = MathAPI()
 
 
-@app.route("/factorial")
+def factorial_cost(scope):
+    n = validate_factorial(get_query_params(scope).get("n"), settings.max_result_digits)
+    if isinstance(n, HTTPStatus):
+        return 0
+    return compute.cost(factorial_decimal, n, factorial_digits(n))
+
+
+def fibonacci_cost(scope):
+    n = validate_fibonacci(scope["path_params"].get("n"), settings.fibonacci_max_n, settings.max_result_digits)
+    if isinstance(n, HTTPStatus):
+        return 0
+    return compute.cost(fibonacci_decimal, n, fibonacci_digits(n))
+
+
+def stats_cost(scope):
+    # Стоимость - размер тела в байтах; тело без Content-Length считается большим
+    length = get_content_length(scope)
+    return settings.stats_inline_max_bytes + 1 if length is None else length
+
+
+def compute_admission(estimate, cheap_cost):
+    # Дешевые запросы (считаются в обработчике, из кэша, уже в работе) идут без очереди
+    return AdmissionController(
+        estimate,
+        max_concurrency=settings.max_concurrency or compute.pool_size,
+        max_queue=settings.max_queue,
+        queue_timeout=settings.queue_timeout,
+        cheap_cost=cheap_cost,
+    )
+
+
+@app.on_startup()
+async def warm_up():
+    if settings.warm_up:
+        await compute.warm_up()
+
+
+@app.on_shutdown()
+async def close_compute():
+    compute.close()
+
+
+@app.route("/health")
+async def health(scope, receive, send):
+    # В многопроцессном режиме отвечает тот воркер, которому ядро отдало соединение
+    await json_response(
+        send,
+        {
+            "status": "ok",
+            "pid": os.getpid(),
+            "cache_items": len(compute.cache),
+            "compute": compute.stats,
+            "admission": {path: controller.snapshot() for path, controller in app.admission.items()},
+        },
+    )
+
+
+@app.route("/factorial", admission=compute_admission(factorial_cost, settings.inline_max_digits))
 async def factorial(scope, receive, send):
     params = get_query_params(scope)
-    n = validate_factorial(params.get("n"))
+    n = validate_factorial(params.get("n"), settings.max_result_digits)
     if isinstance(n, HTTPStatus):
-        await json_response(send, {"error": n.phrase}, status=n.value)
+        await error_response(send, n)
         return
-    result = {"result": calculate_factorial(n)}
-    await json_response(send, result)
+    decimal = await compute.factorial(n, factorial_digits(n))
+    await json_body_response(send, result_body(decimal))
 
 
-@app.route("/fibonacci/{n}")
+@app.route("/fibonacci/{n}", admission=compute_admission(fibonacci_cost, settings.inline_max_digits))
 async def fibonacci(scope, receive, send):
     path_params = scope.get("path_params", {})
     n_str = path_params.get("n")
-    n = validate_fibonacci(n_str)
+    n = validate_fibonacci(n_str, settings.fibonacci_max_n, settings.max_result_digits)
     if isinstance(n, HTTPStatus):
-        await json_response(send, {"error": n.phrase}, status=n.value)
+        await error_response(send, n)
         return
-    result = {"result": calculate_fibonacci(n)}
-    await json_response(send, result)
+    decimal = await compute.fibonacci(n, fibonacci_digits(n))
+    await json_body_response(send, result_body(decimal))
 
 
-@app.route("/mean")
+@app.route("/mean", methods=("GET", "POST"))
 async def mean(scope, receive, send):
-    body = await get_request_body(receive)
-    if body is None:
-        await json_response(
-            send,
-            {"error": "Unprocessable Entity"},
-            status=HTTPStatus.UNPROCESSABLE_ENTITY,
-        )
+    # Массив разбирается по мере чтения тела, без списка чисел в памяти
+    accumulator = StreamingMean()
+    try:
+        async for chunk in iter_request_body(scope, receive, settings.max_body_bytes):
+            accumulator.feed(chunk)
+        result = {"result": accumulator.result()}
+    except RequestBodyTooLarge:
+        status = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    except EmptyArrayError:
+        status = HTTPStatus.BAD_REQUEST
+    except ValueError:
+        status = HTTPStatus.UNPROCESSABLE_ENTITY
+    else:
+        await json_response(send, result)
+        return
+    await error_response(send, status)
+
+
+@app.route(
+    "/stats",
+    methods=("GET", "POST"),
+    admission=compute_admission(stats_cost, settings.stats_inline_max_bytes),
+)
+async def stats(scope, receive, send):
+    # ?percentiles=50,90 и ?percentiles=50&percentiles=90 равнозначны
+    raw = ",".join(get_query_params(scope).getlist("percentiles")) or None
+    percentiles = validate_percentiles(raw, DEFAULT_PERCENTILES)
+    if isinstance(percentiles, HTTPStatus):
+        await error_response(send, percentiles)
         return
-    numbers = validate_mean(body)
-    if isinstance(numbers, HTTPStatus):
-        await json_response(send, {"error": numbers.phrase}, status=numbers.value)
+    try:
+        body = b"".join([chunk async for chunk in iter_request_body(scope, receive, settings.max_body_bytes)])
+        # Бинарное тело разбирается без копирования, JSON - через json
+        binary = get_content_type(scope) == b"application/octet-stream"
+        result = await compute.statistics(body, binary, percentiles)
+    except RequestBodyTooLarge:
+        status = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    except EmptyArrayError:
+        status = HTTPStatus.BAD_REQUEST
+    except ValueError:
+        status = HTTPStatus.UNPROCESSABLE_ENTITY
+    else:
+        await json_response(send, result)
         return
-    result = {"result": calculate_mean(numbers)}
-    await json_response(send, result)
+    await error_response(send, status)
 
 
 @app.default()
 async def not_found(scope, receive, send):
-    await json_response(send, {"error": "Not Found"}, status=HTTPStatus.NOT_FOUND.value)
+    await error_response(send, HTTPStatus.NOT_FOUND)
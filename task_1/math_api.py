@@ -1,14 +1,26 @@
 from http import HTTPStatus
 
+from .routing import Router
+from .utils import error_response, json_response
+
 
 class MathAPI:
     def __init__(self):
-        self.routes = {}
+        self.router = Router()
         self.default_handler = None
+        # Путь -> AdmissionController маршрута
+        self.admission = {}
+        # Корутины без аргументов, вызываются при lifespan startup/shutdown по порядку
+        self.startup_handlers = []
+        self.shutdown_handlers = []
 
-    def route(self, path):
+    def route(self, path, methods=("GET",), admission=None):
         def wrapper(func):
-            self.routes[path] = func
+            handler = func
+            if admission is not None:
+                handler = admission.wrap(func)
+                self.admission[path] = admission
+            self.router.add(path, handler, methods)
             return func
 
         return wrapper
@@ -20,6 +32,20 @@ class MathAPI:
 
         return wrapper
 
+    def on_startup(self):
+        def wrapper(func):
+            self.startup_handlers.append(func)
+            return func
+
+        return wrapper
+
+    def on_shutdown(self):
+        def wrapper(func):
+            self.shutdown_handlers.append(func)
+            return func
+
+        return wrapper
+
     async def __call__(self, scope, receive, send):
         if scope["type"] == "http":
             # Обработка HTTP запросов, проверка наличия 'path' и 'method'
@@ -27,58 +53,50 @@ class MathAPI:
             method = scope.get("method")
 
             if path is None or method is None:
-                await self._send_response(
-                    send, {"error": "Invalid request"}, HTTPStatus.BAD_REQUEST
+                await json_response(
+                    send, {"error": "Invalid request"}, status=HTTPStatus.BAD_REQUEST.value
                 )
                 return
 
-            # Проверка маршрутов с параметрами {n}
-            for route_path, handler in self.routes.items():
-                if "{n}" in route_path:
-                    base_route = route_path.replace("/{n}", "")
-                    if path.startswith(base_route):
-                        path_param = path[len(base_route) + 1 :]
-                        scope["path_params"] = {"n": path_param}
-                        await handler(scope, receive, send)
-                        return
-
-            # Обработка маршрутов без параметров
-            if path in self.routes:
-                await self.routes[path](scope, receive, send)
+            match = self.router.resolve(path)
+            if match is not None:
+                node, params = match
+                handler = node.handlers.get(method)
+                if handler is None:
+                    await error_response(
+                        send, HTTPStatus.METHOD_NOT_ALLOWED, headers=((b"allow", node.allow),)
+                    )
+                    return
+                scope["path_params"] = params
+                await handler(scope, receive, send)
             elif self.default_handler is not None:
                 await self.default_handler(scope, receive, send)
             else:
-                await self._send_response(
-                    send, {"error": "Not Found"}, HTTPStatus.NOT_FOUND
-                )
+                await error_response(send, HTTPStatus.NOT_FOUND)
         elif scope["type"] == "lifespan":
             # Обработка жизненного цикла приложения
             while True:
                 message = await receive()
                 if message["type"] == "lifespan.startup":
-                    await send({"type": "lifespan.startup.complete"})
+                    if not await self._run_hooks(send, self.startup_handlers, "lifespan.startup"):
+                        break
                 elif message["type"] == "lifespan.shutdown":
-                    await send({"type": "lifespan.shutdown.complete"})
+                    await self._run_hooks(send, self.shutdown_handlers, "lifespan.shutdown")
                     break
         else:
-            await self._send_response(
+            await json_response(
                 send,
                 {"error": f"Unsupported scope type: {scope['type']}"},
-                HTTPStatus.BAD_REQUEST,
+                status=HTTPStatus.BAD_REQUEST.value,
             )
 
-    async def _send_response(self, send, data, status):
-        """Функция для отправки ответа с заданным статусом."""
-        await send(
-            {
-                "type": "http.response.start",
-                "status": status,
-                "headers": [(b"content-type", b"application/json")],
-            }
-        )
-        await send(
-            {
-                "type": "http.response.body",
-                "body": bytes(str(data), "utf-8"),
-            }
-        )
+    async def _run_hooks(self, send, handlers, event):
+        # Ошибка в обработчике сообщается серверу как *.failed, а не роняет задачу lifespan
+        try:
+            for handler in handlers:
+                await handler()
+        except Exception as exc:
+            await send({"type": f"{event}.failed", "message": repr(exc)})
+            return False
+        await send({"type": f"{event}.complete"})
+        return True
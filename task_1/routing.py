@@ -0,0 +1,113 @@
+def _to_str(segment):
+    return segment or None
+
+
+def _to_int(segment):
+    digits = segment[1:] if segment[:1] == "-" else segment
+    if not digits.isascii() or not digits.isdigit():
+        return None
+    return int(segment)
+
+
+# Конвертеры параметров пути: сегмент -> значение или None, если не подходит
+CONVERTERS = {"str": _to_str, "int": _to_int}
+
+
+class _Node:
+    """Узел дерева маршрутов: один сегмент пути и обработчики по методам."""
+
+    __slots__ = ("static", "param", "handlers", "allow")
+
+    def __init__(self):
+        # Сегмент -> узел для постоянных частей пути
+        self.static = {}
+        # (имя, конвертер, узел) для параметра на этой позиции
+        self.param = None
+        # Метод -> обработчик, если на узле заканчивается маршрут
+        self.handlers = {}
+        # Готовое значение заголовка Allow для ответа 405
+        self.allow = b""
+
+
+class Router:
+    """
+    Дерево маршрутов по сегментам пути. Шаблоны вида /fibonacci/{n:int}
+    разбираются один раз при регистрации; поиск проходит путь по сегментам
+    за время, линейное по длине пути, и не собирает строк заново.
+    Постоянный сегмент имеет приоритет над параметром, а пути без
+    параметров находятся одним поиском в словаре.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        # Полный путь -> узел для маршрутов без параметров
+        self._static = {}
+
+    def add(self, path, handler, methods=("GET",)):
+        if not path.startswith("/"):
+            raise ValueError(f"Путь маршрута должен начинаться с '/': {path}")
+        node = self.root
+        static = True
+        for segment in path[1:].split("/"):
+            if segment.startswith("{") and segment.endswith("}"):
+                name, _, kind = segment[1:-1].partition(":")
+                converter = CONVERTERS.get(kind or "str")
+                if not name or converter is None:
+                    raise ValueError(f"Некорректный параметр пути {segment} в {path}")
+                if node.param is None:
+                    node.param = (name, converter, _Node())
+                elif node.param[:2] != (name, converter):
+                    raise ValueError(f"Параметр {segment} в {path} конфликтует с уже добавленным")
+                node = node.param[2]
+                static = False
+            else:
+                node = node.static.setdefault(segment, _Node())
+        for method in methods:
+            method = method.upper()
+            if method in node.handlers:
+                raise ValueError(f"Маршрут {method} {path} уже зарегистрирован")
+            node.handlers[method] = handler
+        node.allow = ", ".join(sorted(node.handlers)).encode("latin-1")
+        if static:
+            self._static[path] = node
+
+    def resolve(self, path):
+        """(узел, параметры пути) или None, если путь не найден."""
+        node = self._static.get(path)
+        if node is not None:
+            return node, {}
+        if path[:1] != "/":
+            return None
+        segments = path[1:].split("/")
+        count = len(segments)
+        node, index, params = self.root, 0, {}
+        # Точки возврата, где кроме постоянного сегмента подходил и параметр
+        alternatives = None
+        while True:
+            if index < count:
+                segment = segments[index]
+                child = node.static.get(segment)
+                param = node.param
+                if param is not None:
+                    value = param[1](segment)
+                    if value is not None:
+                        if child is None:
+                            params[param[0]] = value
+                            node = param[2]
+                            index += 1
+                            continue
+                        if alternatives is None:
+                            alternatives = []
+                        alternatives.append((index, param, value, dict(params)))
+                if child is not None:
+                    node = child
+                    index += 1
+                    continue
+            elif node.handlers:
+                return node, params
+            if not alternatives:
+                return None
+            index, param, value, params = alternatives.pop()
+            params[param[0]] = value
+            node = param[2]
+            index += 1
@@ -0,0 +1,230 @@
+"""
+Запуск MathAPI в нескольких процессах на одном порту.
+
+Каждый воркер - отдельный процесс uvicorn со своим event loop и своим пулом
+вычислений. Воркеры открывают собственные сокеты с SO_REUSEPORT, и ядро
+распределяет между ними входящие соединения. Где SO_REUSEPORT нет, сокет
+открывает родительский процесс и передает его воркерам.
+
+Родительский процесс следит за воркерами: воркер раз в секунду отмечает
+heartbeat из своего event loop, и воркер, который умер или не отмечался
+дольше --health-timeout (например, loop заблокирован вычислением), заменяется
+новым. По SIGHUP воркеры перезапускаются по одному: старый останавливается
+(SIGTERM, uvicorn дорабатывает начатые запросы) только после того, как новый
+начал принимать соединения. SIGTERM и SIGINT останавливают все воркеры.
+
+Запуск из корня репозитория:
+    python -m task_1.server --workers 4 --port 8000
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 1.0
+CHECK_INTERVAL = 1.0
+
+
+def bind_socket(host, port, reuse_port):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(options, heartbeat, shared_socket=None):
+    """Точка входа процесса-воркера."""
+    if hasattr(os, "setpgrp"):
+        # Своя группа процессов вместе с пулом вычислений: после SIGKILL
+        # воркера родитель добивает и процессы пула, иначе они осиротеют
+        os.setpgrp()
+    from .main import app
+
+    beating = None
+
+    async def beat():
+        # Отметка ставится из event loop: если loop заблокирован, она устаревает
+        while True:
+            heartbeat.value = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    # Регистрируется последним: воркер считается готовым после прогрева
+    @app.on_startup()
+    async def start_heartbeat():
+        nonlocal beating
+        beating = asyncio.create_task(beat())
+
+    @app.on_shutdown()
+    async def stop_heartbeat():
+        if beating is not None:
+            beating.cancel()
+
+    sock = shared_socket or bind_socket(options.host, options.port, reuse_port=True)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_level=options.log_level,
+        timeout_graceful_shutdown=options.graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Worker:
+    def __init__(self, context, options, shared_socket):
+        # Время последней отметки (time.monotonic), 0 - воркер еще не готов
+        self.heartbeat = context.Value("d", 0.0, lock=False)
+        self.started = time.monotonic()
+        self.process = context.Process(
+            target=serve_worker,
+            args=(options, self.heartbeat, shared_socket),
+            daemon=False,
+        )
+        self.process.start()
+
+    @property
+    def ready(self):
+        return self.heartbeat.value > 0
+
+    def healthy(self, timeout):
+        if not self.process.is_alive():
+            return False
+        last = self.heartbeat.value or self.started
+        return time.monotonic() - last <= timeout
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def join(self, timeout):
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning("Воркер %s не остановился за %.0f с, SIGKILL", self.process.pid, timeout)
+            self.process.kill()
+            self.process.join()
+        self.kill_group()
+
+    def kill_group(self):
+        # Процессы пула, оставшиеся от убитого воркера; при штатной остановке группы уже нет
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+class Supervisor:
+    def __init__(self, options):
+        self.options = options
+        # spawn: воркеры не наследуют состояние родителя (потоки, открытые пулы)
+        self.context = multiprocessing.get_context("spawn")
+        self.shared_socket = None
+        if not hasattr(socket, "SO_REUSEPORT"):
+            self.shared_socket = bind_socket(options.host, options.port, reuse_port=False)
+        self.workers = []
+        self.should_exit = False
+        self.should_restart = False
+
+    def spawn(self):
+        return Worker(self.context, self.options, self.shared_socket)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._handle_restart)
+        self.workers = [self.spawn() for _ in range(self.options.workers)]
+        logger.info("Запущено воркеров: %d", len(self.workers))
+        try:
+            while not self.should_exit:
+                time.sleep(CHECK_INTERVAL)
+                if self.should_restart:
+                    self.should_restart = False
+                    self.restart_all()
+                self.check_health()
+        finally:
+            self.stop_all()
+
+    def check_health(self):
+        for index, worker in enumerate(self.workers):
+            if self.should_exit:
+                return
+            if not worker.healthy(self.options.health_timeout):
+                logger.warning(
+                    "Воркер %s не отвечает (exitcode=%s), замена",
+                    worker.process.pid,
+                    worker.process.exitcode,
+                )
+                worker.terminate()
+                worker.join(self.options.graceful_timeout)
+                self.workers[index] = self.spawn()
+
+    def restart_all(self):
+        """Плавный перезапуск: по одному воркеру, старый живет, пока новый не готов."""
+        for index, old in enumerate(self.workers):
+            if self.should_exit:
+                return
+            new = self.spawn()
+            if not self._wait_ready(new):
+                logger.error("Новый воркер %s не стал готов, перезапуск прерван", new.process.pid)
+                new.terminate()
+                new.join(self.options.graceful_timeout)
+                return
+            self.workers[index] = new
+            old.terminate()
+            old.join(self.options.graceful_timeout)
+        logger.info("Воркеры перезапущены")
+
+    def stop_all(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join(self.options.graceful_timeout)
+        self.workers = []
+
+    def _wait_ready(self, worker):
+        deadline = time.monotonic() + self.options.health_timeout
+        while not worker.ready:
+            if not worker.process.is_alive() or time.monotonic() > deadline or self.should_exit:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _handle_exit(self, signum, frame):
+        self.should_exit = True
+
+    def _handle_restart(self, signum, frame):
+        self.should_restart = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--health-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", default="info")
+    options = parser.parse_args()
+    logging.basicConfig(level=options.log_level.upper(), format="%(asctime)s %(process)d %(message)s")
+
+    # Пулы вычислений воркеров делят ядра между собой, а не берут каждый по всем
+    os.environ.setdefault("MATH_WORKERS", str(max(1, (os.cpu_count() or 1) // options.workers)))
+    os.environ.setdefault("MATH_WARM_UP", "1")
+    Supervisor(options).run()
+
+
+if __name__ == "__main__":
+    main()
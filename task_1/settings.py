@@ -0,0 +1,47 @@
+import os
+from dataclasses import dataclass, fields
+
+
+@dataclass(frozen=True)
+class MathSettings:
+    """Настройки вычислений MathAPI, читаются из переменных окружения MATH_*."""
+
+    # Наибольшее n для /fibonacci
+    fibonacci_max_n: int = 10_000_000
+    # Наибольшее число десятичных цифр результата
+    max_result_digits: int = 2_100_000
+    # Результаты не длиннее стольких цифр считаются прямо в обработчике
+    inline_max_digits: int = 4000
+    # Кэш последних результатов: записей и суммарный объем, байт
+    cache_max_items: int = 256
+    cache_max_bytes: int = 64 * 1024 * 1024
+    # Наибольший размер тела запроса, байт
+    max_body_bytes: int = 128 * 1024 * 1024
+    # Тела /stats не больше стольких байт разбираются прямо в обработчике
+    stats_inline_max_bytes: int = 64 * 1024
+    # Процессов в пуле для тяжелых вычислений (0 - по числу ядер)
+    workers: int = 0
+    # Допуск к /factorial и /fibonacci для результатов длиннее inline_max_digits:
+    # одновременных вычислений на маршрут (0 - по размеру пула), длина очереди
+    # ожидания и наибольшее время в ней, секунд
+    max_concurrency: int = 0
+    max_queue: int = 32
+    queue_timeout: float = 10.0
+    # Запускать процессы пула при старте приложения, а не на первом тяжелом запросе
+    warm_up: bool = False
+
+    @classmethod
+    def from_env(cls):
+        values = {}
+        for field in fields(cls):
+            raw = os.environ.get(f"MATH_{field.name.upper()}")
+            if raw is not None:
+                values[field.name] = _parse(field.type, raw)
+        return cls(**values)
+
+
+def _parse(type_, raw):
+    # bool("0") истинно, поэтому флаги разбираются отдельно
+    if type_ is bool:
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    return type_(raw)
@@ -0,0 +1,125 @@
+import math
+import operator
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy необязателен
+    np = None
+
+from .streaming import EmptyArrayError
+from .utils import loads
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 95.0, 99.0)
+
+# Тело application/octet-stream: подряд идущие float64 little-endian
+FLOAT64_SIZE = 8
+# bool - подкласс int, но в массиве чисел недопустим
+NUMBER_TYPES = {int, float}
+
+
+def parse_float64(body):
+    """
+    Числа из тела float64 little-endian без копирования: numpy.frombuffer
+    или memoryview.cast поверх самого тела. Копия нужна только на машине с
+    порядком байт big-endian.
+    """
+    if len(body) % FLOAT64_SIZE:
+        raise ValueError("Длина тела не кратна 8 байтам")
+    if np is not None:
+        return np.frombuffer(body, dtype="<f8")
+    if sys.byteorder == "little":
+        return memoryview(body).cast("d")
+    values = array("d", body)
+    values.byteswap()
+    return values
+
+
+def parse_json_numbers(body):
+    """
+    Числа из JSON-массива (через orjson, если он установлен); ValueError,
+    если это не массив чисел или целое не помещается во float.
+    """
+    numbers = loads(body)
+    # Типы проверяются одним проходом map, а не генератором на Python
+    if not isinstance(numbers, list) or not set(map(type, numbers)) <= NUMBER_TYPES:
+        raise ValueError("Ожидался массив чисел")
+    if np is not None:
+        try:
+            return np.asarray(numbers, dtype=np.float64)
+        except OverflowError:
+            raise ValueError("Число вне диапазона float") from None
+    return numbers
+
+
+def calculate_stats(values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Среднее, дисперсия (генеральная), минимум, максимум и перцентили
+    (линейная интерполяция, как numpy.percentile по умолчанию).
+    EmptyArrayError для пустого набора, ValueError для NaN и бесконечностей.
+    """
+    if len(values) == 0:
+        raise EmptyArrayError("Пустой набор чисел")
+    try:
+        if np is not None:
+            result = _numpy_stats(np.asarray(values, dtype=np.float64), percentiles)
+        else:
+            result = _python_stats(values, percentiles)
+    except OverflowError:
+        raise ValueError("Сумма вне диапазона float") from None
+    if not all(math.isfinite(result[key]) for key in ("mean", "variance", "min", "max")):
+        raise ValueError("Набор содержит NaN или бесконечность")
+    return result
+
+
+def summarize(body, binary, percentiles=DEFAULT_PERCENTILES):
+    """Разбор тела (float64 или JSON) и статистики одним вызовом, в том числе в пуле процессов."""
+    values = parse_float64(body) if binary else parse_json_numbers(body)
+    return calculate_stats(values, percentiles)
+
+
+def _numpy_stats(values, percentiles):
+    result = {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "variance": float(values.var()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+    ranks = np.percentile(values, percentiles) if percentiles else []
+    result["percentiles"] = {_label(q): float(rank) for q, rank in zip(percentiles, ranks)}
+    return result
+
+
+def _python_stats(values, percentiles):
+    # Без numpy: точные суммы math.fsum, дисперсия вторым проходом по отклонениям.
+    # memoryview и array один раз превращаются в список, а не на каждом проходе
+    if not isinstance(values, list):
+        values = values.tolist()
+    count = len(values)
+    mean = math.fsum(values) / count
+    deviations = [value - mean for value in values]
+    result = {
+        "count": count,
+        "mean": mean,
+        "variance": math.fsum(map(operator.mul, deviations, deviations)) / count,
+        "min": float(min(values)),
+        "max": float(max(values)),
+    }
+    ordered = sorted(values) if percentiles else []
+    result["percentiles"] = {_label(q): _percentile(ordered, q) for q in percentiles}
+    return result
+
+
+def _percentile(ordered, q):
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    fraction = position - lower
+    return float(ordered[lower] + (ordered[upper] - ordered[lower]) * fraction)
+
+
+def _label(q):
+    # 50.0 -> "50", 99.9 -> "99.9"
+    return f"{q:g}"
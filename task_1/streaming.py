@@ -0,0 +1,101 @@
+import json
+import math
+
+
+def _reject_constant(name):
+    raise ValueError(f"Недопустимое значение {name}")
+
+
+# NaN и Infinity не входят в JSON, хотя json их принимает по умолчанию
+JSON_DECODER = json.JSONDecoder(parse_constant=_reject_constant)
+_WHITESPACE = b" \t\n\r"
+
+# Самое длинное число, которое может ждать продолжения на границе чанков
+MAX_NUMBER_BYTES = 4096
+
+
+class EmptyArrayError(ValueError):
+    pass
+
+
+class StreamingMean:
+    """
+    Среднее JSON-массива чисел, который приходит чанками. Законченные числа
+    чанка разбираются одним вызовом json и суммируются math.fsum, суммы
+    чанков накапливаются с компенсацией ошибки округления (Kahan-Babuska,
+    вариант Ноймайера). Память не зависит от длины массива: хранится только
+    незаконченное число на границе чанков.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._total = 0.0
+        self._compensation = 0.0
+        self._tail = b""
+        self._opened = False
+        self._closed = False
+
+    def feed(self, chunk):
+        """Обрабатывает очередной чанк тела; ValueError при некорректном JSON."""
+        buffer = self._tail + chunk if self._tail else chunk
+        self._tail = b""
+        if self._closed:
+            if buffer.strip(_WHITESPACE):
+                raise ValueError("Данные после конца массива")
+            return
+        if not self._opened:
+            buffer = buffer.lstrip(_WHITESPACE)
+            if not buffer:
+                return
+            if buffer[:1] != b"[":
+                raise ValueError("Ожидался массив чисел")
+            self._opened = True
+            buffer = buffer[1:]
+        end = buffer.find(b"]")
+        if end != -1:
+            if buffer[end + 1 :].strip(_WHITESPACE):
+                raise ValueError("Данные после конца массива")
+            self._closed = True
+            values = buffer[:end]
+            if self.count == 0 and not values.strip(_WHITESPACE):
+                return
+            self._add(values)
+            return
+        cut = buffer.rfind(b",")
+        if cut == -1:
+            if len(buffer) > MAX_NUMBER_BYTES:
+                raise ValueError("Слишком длинное число")
+            self._tail = buffer
+            return
+        self._add(buffer[:cut])
+        self._tail = buffer[cut + 1 :]
+
+    def result(self):
+        """Среднее; ValueError для незаконченного массива, EmptyArrayError для пустого."""
+        if not self._closed:
+            raise ValueError("Ожидался массив чисел")
+        if self.count == 0:
+            raise EmptyArrayError("Пустой массив")
+        return (self._total + self._compensation) / self.count
+
+    def _add(self, values):
+        numbers = JSON_DECODER.decode("[" + values.decode("ascii") + "]")
+        if not numbers or not all(type(number) is float or type(number) is int for number in numbers):
+            raise ValueError("Ожидался массив чисел")
+        self.count += len(numbers)
+        try:
+            chunk_total = math.fsum(numbers)
+        except OverflowError:
+            raise ValueError("Число вне диапазона float") from None
+        self._accumulate(chunk_total)
+        # 1e400 разбирается в inf, а суммы чанков могут переполниться вместе
+        if not math.isfinite(self._total):
+            raise ValueError("Сумма вне диапазона float")
+
+    def _accumulate(self, value):
+        total = self._total + value
+        if abs(self._total) >= abs(value):
+            self._compensation += (self._total - total) + value
+        else:
+            self._compensation += (value - total) + self._total
+        self._total = total
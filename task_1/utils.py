@@ -1,35 +1,182 @@
 import json
+from http import HTTPStatus
+from urllib.parse import unquote_plus
 
+from .streaming import JSON_DECODER
 
-async def json_response(send, data, status=200):
-    response = {
-        "type": "http.response.start",
-        "status": status,
-        "headers": [(b"content-type", b"application/json")],
-    }
-    await send(response)
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+# Заголовки собраны в байты один раз при импорте, а не на каждый ответ
+CONTENT_TYPE_JSON = (b"content-type", b"application/json")
+_STDLIB_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(data):
+    """
+    JSON в байтах: через orjson, если он установлен, иначе через json.
+    Оба варианта пишут компактно и в UTF-8; запись чисел с плавающей точкой
+    может отличаться (1e16 против 1e+16, null против NaN).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # Целые длиннее 64 бит orjson не сериализует
+            pass
+    return _STDLIB_ENCODER.encode(data).encode("utf-8")
+
+
+def loads(body):
+    """
+    JSON из байтов: через orjson, если он установлен, иначе через json.
+    Оба варианта отвергают NaN и Infinity; ValueError при некорректном JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return JSON_DECODER.decode(body.decode("utf-8"))
+
+
+def json_headers(body, headers=None):
+    headers_list = [CONTENT_TYPE_JSON, (b"content-length", b"%d" % len(body))]
+    if headers:
+        headers_list.extend(headers)
+    return headers_list
+
+
+async def json_response(send, data, status=200, headers=None):
+    await json_body_response(send, dumps(data), status, headers)
+
+
+async def json_body_response(send, body, status=200, headers=None):
+    """Ответ с уже сериализованным JSON-телом."""
+    await send({"type": "http.response.start", "status": status, "headers": json_headers(body, headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _prepared_error(status):
+    body = dumps({"error": status.phrase})
+    return body, (CONTENT_TYPE_JSON, (b"content-length", b"%d" % len(body)))
+
+
+# Тела и заголовки частых ошибок сериализуются один раз
+ERROR_RESPONSES = {
+    status: _prepared_error(status)
+    for status in (
+        HTTPStatus.BAD_REQUEST,
+        HTTPStatus.NOT_FOUND,
+        HTTPStatus.METHOD_NOT_ALLOWED,
+        HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        HTTPStatus.UNPROCESSABLE_ENTITY,
+        HTTPStatus.SERVICE_UNAVAILABLE,
+    )
+}
+
+
+async def error_response(send, status, headers=None):
+    """Ответ {"error": <фраза статуса>}; для частых статусов тело берется готовым."""
+    cached = ERROR_RESPONSES.get(status)
+    if cached is None:
+        await json_response(send, {"error": status.phrase}, status=status.value, headers=headers)
+        return
+    body, static_headers = cached
     await send(
         {
-            "type": "http.response.body",
-            "body": json.dumps(data).encode("utf-8"),
+            "type": "http.response.start",
+            "status": status.value,
+            "headers": static_headers + tuple(headers) if headers else static_headers,
         }
     )
+    await send({"type": "http.response.body", "body": body})
+
+
+def result_body(decimal):
+    """Тело {"result": ...} из готовой десятичной записи числа."""
+    return b'{"result":' + decimal + b"}"
+
+
+class RequestBodyTooLarge(Exception):
+    pass
 
 
-async def get_request_body(receive):
-    body = await receive()
-    if not body.get("body"):
+async def iter_request_body(scope, receive, max_size=None):
+    """
+    Чанки тела запроса по мере поступления, включая сообщения с more_body.
+    RequestBodyTooLarge, если тело (или заявленный Content-Length) больше max_size.
+    """
+    if max_size is not None:
+        length = get_content_length(scope)
+        if length is not None and length > max_size:
+            raise RequestBodyTooLarge()
+    received = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        chunk = message.get("body", b"")
+        received += len(chunk)
+        if max_size is not None and received > max_size:
+            raise RequestBodyTooLarge()
+        if chunk:
+            yield chunk
+        if not message.get("more_body", False):
+            return
+
+
+async def get_request_body(receive, scope=None, max_size=None):
+    chunks = [chunk async for chunk in iter_request_body(scope or {}, receive, max_size)]
+    if not chunks:
         return None
-    return json.loads(body["body"].decode("utf-8"))
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+
+class QueryParams(dict):
+    """
+    Параметры строки запроса. Как dict отдает последнее значение ключа,
+    все значения повторяющегося ключа - через getlist.
+    """
+
+    def __init__(self, items):
+        super().__init__(items)
+        self._items = items
+
+    def getlist(self, key):
+        return [value for name, value in self._items if name == key]
+
+
+def _unquote(value):
+    # Большинство параметров без экранирования, unquote_plus для них не нужен
+    if "%" in value or "+" in value:
+        return unquote_plus(value)
+    return value
 
 
 def get_query_params(scope):
-    query_string = scope["query_string"].decode("utf-8")
-    params = {}
-    for param in query_string.split("&"):
-        if "=" in param:
-            key, value = param.split("=", 1)
-            params[key] = value
-        else:
-            params[param] = None
-    return params
+    """Разбор query string с percent-декодированием ("+" - пробел) и повторяющимися ключами."""
+    query_string = scope.get("query_string", b"")
+    items = []
+    if query_string:
+        for param in query_string.decode("utf-8", "replace").split("&"):
+            if not param:
+                continue
+            key, sep, value = param.partition("=")
+            items.append((_unquote(key), _unquote(value) if sep else None))
+    return QueryParams(items)
+
+
+def get_content_length(scope):
+    """Заявленный Content-Length или None, если его нет или он некорректен."""
+    for name, value in scope.get("headers", ()):
+        if name == b"content-length":
+            return int(value) if value.isascii() and value.isdigit() else None
+    return None
+
+
+def get_content_type(scope):
+    """Тип содержимого запроса без параметров (charset и т.п.)."""
+    for name, value in scope.get("headers", ()):
+        if name == b"content-type":
+            return value.split(b";", 1)[0].strip().lower()
+    return None
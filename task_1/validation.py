@@ -1,22 +1,64 @@
+import sys
+from functools import lru_cache
 from http import HTTPStatus
 
+from .calculations import factorial_digits, fibonacci_digits
 
-def validate_factorial(n):
-    if n is None or not n.lstrip("-").isdigit():
+
+def parse_n(raw, max_n=None):
+    """
+    Неотрицательное целое из строки запроса или HTTPStatus: 422 для не-числа
+    (в том числе не-ASCII цифр вроде "²"), 400 для отрицательного или
+    большего max_n. Длина строки сверяется с max_n до int(), так что
+    длинный ввод не доходит ни до преобразования, ни до оценок через float.
+    """
+    if raw is None:
+        return HTTPStatus.UNPROCESSABLE_ENTITY
+    negative = raw[:1] == "-"
+    digits = raw[1:] if negative else raw
+    if not digits.isascii() or not digits.isdigit():
         return HTTPStatus.UNPROCESSABLE_ENTITY
-    n = int(n)
-    if n < 0:
+    digits = digits.lstrip("0")
+    if negative and digits:
+        return HTTPStatus.BAD_REQUEST
+    # Без max_n действует предел длины int(str), иначе int() бросит ValueError
+    max_length = sys.get_int_max_str_digits() if max_n is None else len(str(max_n))
+    if max_length and len(digits) > max_length:
+        return HTTPStatus.BAD_REQUEST
+    n = int(digits or "0")
+    if max_n is not None and n > max_n:
         return HTTPStatus.BAD_REQUEST
     return n
 
 
-def validate_fibonacci(n_str):
-    if n_str is None or not n_str.lstrip("-").isdigit():
-        return HTTPStatus.UNPROCESSABLE_ENTITY
-    n = int(n_str)
-    if n < 0:
-        return HTTPStatus.BAD_REQUEST
-    return n
+@lru_cache(maxsize=None)
+def max_n_for_digits(digits_of, max_digits):
+    """Наибольшее n, для которого digits_of(n) <= max_digits (digits_of не убывает)."""
+    low, high = 0, 1
+    while digits_of(high) <= max_digits:
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if digits_of(middle) <= max_digits:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def validate_factorial(n, max_digits=None):
+    # Предел длины результата заранее переведен в наибольшее n: lgamma в
+    # factorial_digits не вызывается для n, которое не влезает во float
+    max_n = None if max_digits is None else max_n_for_digits(factorial_digits, max_digits)
+    return parse_n(n, max_n)
+
+
+def validate_fibonacci(n_str, max_n=None, max_digits=None):
+    # Ограничения на n и на длину результата сводятся к одному наибольшему n
+    if max_digits is not None:
+        digits_max_n = max_n_for_digits(fibonacci_digits, max_digits)
+        max_n = digits_max_n if max_n is None else min(max_n, digits_max_n)
+    return parse_n(n_str, max_n)
 
 
 def validate_mean(numbers):
@@ -29,3 +71,15 @@ def validate_mean(numbers):
     if not numbers:
         return HTTPStatus.BAD_REQUEST
     return numbers
+
+
+def validate_percentiles(raw, default):
+    if raw is None:
+        return default
+    try:
+        percentiles = tuple(float(item) for item in raw.split(",") if item)
+    except ValueError:
+        return HTTPStatus.UNPROCESSABLE_ENTITY
+    if not all(0 <= q <= 100 for q in percentiles):
+        return HTTPStatus.UNPROCESSABLE_ENTITY
+    return percentiles
@@ -0,0 +1,64 @@
+"""
+Бенчмарк импорта товаров: POST /item/ на каждый товар (create_item с
+отдельным commit) против пакетного create_items_bulk (executemany в одной
+транзакции). Валидация ItemCreateRequest входит в замер обоих вариантов.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.bulk_import_benchmark --items 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+
+from task_2.rest_example.db.crud import create_item, create_items_bulk
+from task_2.rest_example.db.db_engine import configure_connection
+from task_2.rest_example.db.item_cache import item_cache
+from task_2.rest_example.db.migrations import run_migrations
+from task_2.rest_example.models.item import ItemCreateRequest
+
+
+def payload(count: int):
+    return [{"name": f"Item {i}", "price": 1.0 + i % 1000} for i in range(count)]
+
+
+async def run(items: int, single_items: int) -> None:
+    item_cache.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        async with aiosqlite.connect(os.path.join(tmp, "bench.db")) as conn:
+            await configure_connection(conn)
+            await run_migrations(conn)
+
+            started = time.perf_counter()
+            for row in payload(single_items):
+                await create_item(conn, ItemCreateRequest.model_validate(row))
+            single = time.perf_counter() - started
+            per_item = single / single_items
+            print(
+                f"create_item:       {single_items} товаров за {single:.2f} с "
+                f"({per_item * 1e6:.0f} мкс/товар, 1M ~ {per_item * 1e6 / 60:.1f} мин)"
+            )
+
+            started = time.perf_counter()
+            rows = []
+            for row in payload(items):
+                item = ItemCreateRequest.model_validate(row)
+                rows.append((item.name, item.price))
+            ids = await create_items_bulk(conn, rows)
+            bulk = time.perf_counter() - started
+            print(
+                f"create_items_bulk: {len(ids)} товаров за {bulk:.2f} с "
+                f"({bulk / len(ids) * 1e6:.1f} мкс/товар)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--single-items", type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.single_items))
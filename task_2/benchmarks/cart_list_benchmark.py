@@ -0,0 +1,142 @@
+"""
+Бенчмарк получения списка корзин: число SQL-запросов и задержка
+старой реализации (запрос товаров на каждую корзину) против текущей.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.cart_list_benchmark --carts 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from task_2.rest_example.db.crud import get_cart_list
+from task_2.rest_example.db.migrations import run_migrations
+from task_2.rest_example.db.utils import fetch_all
+from task_2.rest_example.models.cart import CartItem, CartResponse
+from task_2.rest_example.models.item import ItemResponse
+
+SCENARIOS = {
+    "first page": dict(offset=0, limit=10),
+    "page of 100": dict(offset=0, limit=100),
+    "price filter": dict(offset=0, limit=20, min_price=50.0, max_price=500.0),
+    "quantity filter": dict(offset=0, limit=20, min_quantity=5, max_quantity=15),
+}
+
+
+async def legacy_get_cart_list(
+    conn, offset=0, limit=10, min_price=None, max_price=None, min_quantity=None, max_quantity=None
+):
+    """Исходная реализация: отдельный запрос товаров для каждой корзины."""
+    query = "SELECT * FROM carts WHERE 1=1"
+    params = []
+    if min_price is not None:
+        query += " AND price >= ?"
+        params.append(min_price)
+    if max_price is not None:
+        query += " AND price <= ?"
+        params.append(max_price)
+    query += " LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    carts = []
+    for cart_row in await fetch_all(conn, query, tuple(params)):
+        items_rows = await fetch_all(
+            conn,
+            """
+            SELECT cart_items.quantity, cart_items.available, items.id, items.name, items.price, items.deleted
+            FROM cart_items
+            JOIN items ON cart_items.item_id = items.id
+            WHERE cart_items.cart_id = ?
+            """,
+            (cart_row["id"],),
+        )
+        items = [
+            CartItem(
+                item=ItemResponse(
+                    id=row["id"], name=row["name"], price=row["price"], deleted=row["deleted"]
+                ),
+                quantity=row["quantity"],
+                available=row["available"],
+            )
+            for row in items_rows
+        ]
+        total_quantity = sum(item.quantity for item in items)
+        if (min_quantity is not None and total_quantity < min_quantity) or (
+            max_quantity is not None and total_quantity > max_quantity
+        ):
+            continue
+        carts.append(CartResponse(id=cart_row["id"], items=items, price=cart_row["price"]))
+    return carts
+
+
+def build_database(path: str, carts: int, items: int, seed: int = 42) -> None:
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    prices = [round(rnd.uniform(1.0, 100.0), 2) for _ in range(items)]
+    conn.executemany(
+        "INSERT INTO items (id, name, price) VALUES (?, ?, ?)",
+        ((i + 1, f"Item {i + 1}", price) for i, price in enumerate(prices)),
+    )
+    cart_rows, cart_item_rows = [], []
+    for cart_id in range(1, carts + 1):
+        total = 0.0
+        for item_id in rnd.sample(range(1, items + 1), rnd.randint(0, 6)):
+            quantity = rnd.randint(1, 5)
+            price = prices[item_id - 1] * quantity
+            total += price
+            cart_item_rows.append((cart_id, item_id, quantity, price))
+        cart_rows.append((cart_id, total))
+    conn.executemany("INSERT INTO carts (id, price) VALUES (?, ?)", cart_rows)
+    conn.executemany(
+        "INSERT INTO cart_items (cart_id, item_id, quantity, price) VALUES (?, ?, ?, ?)",
+        cart_item_rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+async def measure(conn, func, kwargs, repeat: int):
+    statements = []
+    await conn.set_trace_callback(statements.append)
+    timings = []
+    for _ in range(repeat):
+        statements.clear()
+        started = time.perf_counter()
+        carts = await func(conn, **kwargs)
+        if isinstance(carts, tuple):
+            carts, _ = carts
+        timings.append(time.perf_counter() - started)
+    await conn.set_trace_callback(None)
+    return len(statements), statistics.median(timings), len(carts)
+
+
+async def run(carts: int, items: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        async with aiosqlite.connect(path) as conn:
+            await run_migrations(conn)
+        build_database(path, carts, items)
+        async with aiosqlite.connect(path) as conn:
+            print(f"{carts} корзин, {items} товаров, медиана из {repeat} запусков")
+            print(f"{'сценарий':<16} {'реализация':<8} {'запросов':>8} {'мс':>9} {'корзин':>7}")
+            for name, kwargs in SCENARIOS.items():
+                for label, func in (("legacy", legacy_get_cart_list), ("batched", get_cart_list)):
+                    queries, median, count = await measure(conn, func, kwargs, repeat)
+                    print(f"{name:<16} {label:<8} {queries:>8} {median * 1000:>9.2f} {count:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--carts", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.carts, args.items, args.repeat))
@@ -0,0 +1,95 @@
+"""
+Бенчмарк рассылки чата: прежний Broadcaster (последовательный await send_text
+по списку подписчиков) против шардированного Broadcaster с очередью и
+писателем на подписчика. В комнате N подписчиков-заглушек, один из них
+медленный: каждый send занимает --slow-ms миллисекунд.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.chat_broadcast_benchmark --subscribers 10000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from task_2.rest_example.broadcast import Broadcaster
+
+
+class StubWebSocket:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.received = 0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send(self, message) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def send_text(self, data: str) -> None:
+        await self.send({"type": "websocket.send", "text": data})
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+class LegacyBroadcaster:
+    """Прежняя реализация из routers/chat.py."""
+
+    def __init__(self):
+        self.subscribers: List[StubWebSocket] = []
+
+    async def subscribe(self, ws):
+        await ws.accept()
+        self.subscribers.append(ws)
+
+    async def publish(self, message: str):
+        for ws in self.subscribers:
+            try:
+                await ws.send_text(message)
+            except Exception:
+                pass
+
+    async def close(self):
+        pass
+
+
+async def measure(name: str, broadcaster, subscribers: int, messages: int, slow_delay: float) -> None:
+    sockets = [StubWebSocket() for _ in range(subscribers - 1)] + [StubWebSocket(slow_delay)]
+    for ws in sockets:
+        await broadcaster.subscribe(ws)
+
+    publish_times = []
+    started = time.perf_counter()
+    for i in range(messages):
+        before = time.perf_counter()
+        await broadcaster.publish(f"message {i}")
+        publish_times.append(time.perf_counter() - before)
+    # Доставка всем быстрым подписчикам
+    while any(ws.received < messages for ws in sockets[:-1]):
+        await asyncio.sleep(0.001)
+    delivered = time.perf_counter() - started
+    await broadcaster.close()
+
+    publish_times.sort()
+    print(
+        f"{name:14} publish p50 {publish_times[len(publish_times) // 2] * 1e3:8.3f} мс, "
+        f"max {publish_times[-1] * 1e3:8.3f} мс; доставка быстрым {delivered * 1e3:8.1f} мс"
+    )
+
+
+async def run(subscribers: int, messages: int, slow_ms: float) -> None:
+    await measure("прежний", LegacyBroadcaster(), subscribers, messages, slow_ms / 1000)
+    await measure("шардированный", Broadcaster(), subscribers, messages, slow_ms / 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.messages, args.slow_ms))
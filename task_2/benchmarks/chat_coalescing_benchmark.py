@@ -0,0 +1,80 @@
+"""
+Бенчмарк объединения сообщений чата: в комнате --subscribers подписчиков,
+--publishers клиентов публикуют по сообщению раз в --interval-ms. Для
+каждого окна объединения считаются кадры (вызовы send), отправленные
+подписчикам, и задержка доставки последнего сообщения.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.chat_coalescing_benchmark --subscribers 1000 --publishers 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from task_2.rest_example.broadcast import Broadcaster
+
+
+class CountingWebSocket:
+    def __init__(self) -> None:
+        self.frames = 0
+        self.last_frame_at = 0.0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send(self, message) -> None:
+        self.frames += 1
+        self.last_frame_at = time.perf_counter()
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def measure(window_ms: float, subscribers: int, publishers: int, messages: int, interval: float) -> None:
+    broadcaster = Broadcaster(queue_size=100_000, coalesce_window=window_ms / 1000)
+    sockets = [CountingWebSocket() for _ in range(subscribers)]
+    for ws in sockets:
+        await broadcaster.subscribe(ws)
+
+    last_published = 0.0
+
+    async def publisher(index: int) -> None:
+        nonlocal last_published
+        for i in range(messages):
+            await broadcaster.publish(f"клиент {index}: сообщение {i}")
+            last_published = time.perf_counter()
+            await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(publisher(index) for index in range(publishers)))
+    # Ждем, пока поток кадров не затихнет
+    while True:
+        frames = sum(ws.frames for ws in sockets)
+        await asyncio.sleep(window_ms / 1000 + 0.05)
+        if sum(ws.frames for ws in sockets) == frames:
+            break
+    lag = max(ws.last_frame_at for ws in sockets) - last_published
+    await broadcaster.close()
+
+    total = publishers * messages
+    print(
+        f"окно {window_ms:5.1f} мс: кадров на подписчика {frames / subscribers:8.1f} "
+        f"({total / max(frames / subscribers, 1):5.1f} сообщ/кадр), "
+        f"время {(last_published - started) * 1e3:7.1f} мс, хвост доставки {lag * 1e3:7.1f} мс"
+    )
+
+
+async def run(subscribers: int, publishers: int, messages: int, interval_ms: float) -> None:
+    for window_ms in (0.0, 5.0, 20.0, 50.0):
+        await measure(window_ms, subscribers, publishers, messages, interval_ms / 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--publishers", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.publishers, args.messages, args.interval_ms))
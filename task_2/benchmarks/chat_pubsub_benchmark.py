@@ -0,0 +1,131 @@
+"""
+Бенчмарк пропускной способности backend чата: InMemoryBackend в одном
+процессе против SQLiteBackend, где публикует один процесс, а сообщения
+получают --workers процессов-подписчиков через общий файл шины.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.chat_pubsub_benchmark --messages 20000 --workers 4 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from uuid import UUID
+
+from task_2.rest_example.chat_hub import ChatHub
+from task_2.rest_example.pubsub import InMemoryBackend, SQLiteBackend
+from task_2.rest_example.settings import ChatSettings
+
+SETTINGS = ChatSettings(queue_size=100_000, shards=1)
+
+
+class CountingWebSocket:
+    def __init__(self) -> None:
+        self.received = 0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send(self, message) -> None:
+        self.received += 1
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def wait_for(ws: CountingWebSocket, messages: int) -> None:
+    while ws.received < messages:
+        await asyncio.sleep(0.001)
+
+
+async def publish_all(hub: ChatHub, room_id: UUID, messages: int, concurrency: int) -> float:
+    # concurrency публикаторов, как одновременные запросы POST /chat/publish
+    async def publisher(offset: int) -> None:
+        for i in range(offset, messages, concurrency):
+            await hub.publish(room_id, f"message {i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(publisher(offset) for offset in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def in_memory(messages: int, concurrency: int) -> None:
+    hub = ChatHub(InMemoryBackend(), SETTINGS)
+    await hub.start()
+    room_id = await hub.create_room()
+    ws = CountingWebSocket()
+    await hub.subscribe(room_id, ws)
+    started = time.perf_counter()
+    published = await publish_all(hub, room_id, messages, concurrency)
+    await wait_for(ws, messages)
+    delivered = time.perf_counter() - started
+    await hub.close()
+    report("memory", messages, published, delivered)
+
+
+def subscriber_process(path: str, room_id: str, messages: int, ready, results) -> None:
+    async def main() -> None:
+        hub = ChatHub(SQLiteBackend(path, SETTINGS.bus_poll_interval), SETTINGS)
+        await hub.start()
+        ws = CountingWebSocket()
+        await hub.subscribe(UUID(room_id), ws)
+        ready.release()
+        await wait_for(ws, 1)
+        # Отсчет от первого полученного сообщения до последнего
+        started = time.perf_counter()
+        await wait_for(ws, messages)
+        results.put(time.perf_counter() - started)
+        await hub.close()
+
+    asyncio.run(main())
+
+
+async def sqlite(messages: int, workers: int, concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bus.db")
+        hub = ChatHub(SQLiteBackend(path), SETTINGS)
+        await hub.start()
+        room_id = await hub.create_room()
+
+        context = multiprocessing.get_context("spawn")
+        ready, results = context.Semaphore(0), context.Queue()
+        processes = [
+            context.Process(target=subscriber_process, args=(path, str(room_id), messages, ready, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            await asyncio.to_thread(ready.acquire)
+
+        started = time.perf_counter()
+        published = await publish_all(hub, room_id, messages, concurrency)
+        receive_times = [await asyncio.to_thread(results.get) for _ in processes]
+        delivered = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        await hub.close()
+        report(f"sqlite x{workers}", messages, published, delivered)
+        print(f"{'':16} прием в воркере: до {messages / min(receive_times):,.0f} сообщ/с")
+
+
+def report(name: str, messages: int, published: float, delivered: float) -> None:
+    print(
+        f"{name:16} публикация {messages / published:10,.0f} сообщ/с, "
+        f"доставка всем {messages / delivered:10,.0f} сообщ/с"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(in_memory(args.messages, args.concurrency))
+    for concurrency in sorted({1, args.concurrency}):
+        print(f"одновременных публикаторов: {concurrency}")
+        asyncio.run(sqlite(args.messages, args.workers, concurrency))
@@ -0,0 +1,180 @@
+"""
+Микробенчмарк накладных расходов инструментирования на запрос: прежний стек
+(PrometheusMiddleware на BaseHTTPMiddleware с перебором маршрутов, плюс
+Instrumentator и FastAPIInstrumentor) против единой InstrumentationMiddleware
+в режимах только метрики, метрики и трассировка, трассировка с сэмплированием.
+Span экспортируются в пустой exporter, сеть в замер не попадает.
+
+Приложение повторяет набор маршрутов магазина с пустыми обработчиками,
+запросы подаются напрямую в ASGI без HTTP-клиента, так что в замер попадает
+только маршрутизация и middleware.
+
+Запуск из корня репозитория:
+    python -m task_2.benchmarks.instrumentation_benchmark --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Tuple
+
+from fastapi import FastAPI
+from opentelemetry import trace
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from prometheus_fastapi_instrumentator import Instrumentator
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+from task_2.rest_example.utils import (
+    INSTRUMENTATION_OVERHEAD,
+    REQUESTS,
+    REQUESTS_IN_PROGRESS,
+    REQUESTS_PROCESSING_TIME,
+    RESPONSES,
+    InstrumentationMiddleware,
+)
+
+PATHS = ["/item/{}", "/cart/{}", "/item/", "/cart/", "/cart/{}/add/{}"]
+
+
+class LegacyPrometheusMiddleware(BaseHTTPMiddleware):
+    """Прежняя реализация (без подсчета исключений) для сравнения."""
+
+    def __init__(self, app, app_name: str) -> None:
+        super().__init__(app)
+        self.app_name = app_name
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        method = request.method
+        path, is_handled_path = self.get_path(request)
+        if not is_handled_path:
+            return await call_next(request)
+
+        REQUESTS_IN_PROGRESS.labels(method=method, path=path, app_name=self.app_name).inc()
+        REQUESTS.labels(method=method, path=path, app_name=self.app_name).inc()
+        before_time = time.perf_counter()
+        response = await call_next(request)
+        span = trace.get_current_span()
+        trace_id = trace.format_trace_id(span.get_span_context().trace_id)
+        REQUESTS_PROCESSING_TIME.labels(method=method, path=path, app_name=self.app_name).observe(
+            time.perf_counter() - before_time, exemplar={"TraceID": trace_id}
+        )
+        RESPONSES.labels(method=method, path=path, status_code=response.status_code, app_name=self.app_name).inc()
+        REQUESTS_IN_PROGRESS.labels(method=method, path=path, app_name=self.app_name).dec()
+        return response
+
+    @staticmethod
+    def get_path(request: Request) -> Tuple[str, bool]:
+        for route in request.app.routes:
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                return route.path, True
+        return request.url.path, False
+
+
+class NullExporter(SpanExporter):
+    def export(self, spans) -> SpanExportResult:
+        return SpanExportResult.SUCCESS
+
+
+def tracer_provider(sampler) -> TracerProvider:
+    provider = TracerProvider(sampler=sampler)
+    provider.add_span_processor(SimpleSpanProcessor(NullExporter()))
+    return provider
+
+
+def build_app(setup) -> FastAPI:
+    app = FastAPI()
+
+    async def handler() -> dict:
+        return {}
+
+    for path in ["/item/", "/item/{item_id}", "/cart/", "/cart/{cart_id}", "/cart/{cart_id}/add/{item_id}"]:
+        app.add_api_route(path, handler, methods=["GET"])
+    # Остальные маршруты магазина: их тоже перебирает get_path
+    for path in ["/item/bulk", "/cart/{cart_id}/add-bulk", "/chat/publish/{chat_id}", "/metrics"]:
+        app.add_api_route(path, handler, methods=["POST"])
+    setup(app)
+    return app
+
+
+def legacy(app: FastAPI) -> None:
+    app.add_middleware(LegacyPrometheusMiddleware, app_name="legacy-benchmark")
+    Instrumentator().instrument(app)
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider(ALWAYS_ON))
+
+
+def unified(name: str, tracing: bool, sampler=ALWAYS_ON):
+    def setup(app: FastAPI) -> None:
+        app.add_middleware(
+            InstrumentationMiddleware,
+            app_name=name,
+            tracing=tracing,
+            tracer_provider=tracer_provider(sampler),
+        )
+    return setup
+
+
+async def drive(app: FastAPI, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scopes = []
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)].format(i, i + 1)
+        scopes.append({
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "headers": [],
+            "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        })
+
+    started = time.perf_counter()
+    for scope in scopes:
+        await app(scope, receive, send)
+    return time.perf_counter() - started
+
+
+async def run(requests: int, rounds: int) -> None:
+    variants = [
+        ("без инструментирования", None, lambda app: None),
+        ("прежний стек (3 слоя)", None, legacy),
+        ("метрики", "bench-metrics", unified("bench-metrics", tracing=False)),
+        ("метрики + span", "bench-tracing", unified("bench-tracing", tracing=True)),
+        ("метрики + span 10%", "bench-sampled", unified("bench-sampled", True, ParentBased(TraceIdRatioBased(0.1)))),
+    ]
+    apps = [build_app(setup) for _, _, setup in variants]
+    for app in apps:
+        await drive(app, 500)
+    # Варианты чередуются по раундам, берется лучший раунд
+    best = [float("inf")] * len(apps)
+    for _ in range(rounds):
+        for i, app in enumerate(apps):
+            best[i] = min(best[i], await drive(app, requests) / requests * 1e6)
+
+    baseline = best[0]
+    for (name, app_name, _), per_request in zip(variants, best):
+        line = f"{name:24} {per_request:7.1f} мкс/запрос"
+        if per_request is not baseline:
+            line += f" (накладные {per_request - baseline:6.1f} мкс)"
+        if app_name is not None:
+            overhead = INSTRUMENTATION_OVERHEAD.labels(app_name=app_name)._value.get()
+            total = requests * rounds + 500
+            line += f", самооценка {overhead / total * 1e6:5.1f} мкс"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.rounds))
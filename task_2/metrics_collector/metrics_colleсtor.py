@@ -10,8 +10,8 @@ GRAFANA_API_KEY = ""
 OUTPUT_FILE = "./metrics_report.json"  # Изменил путь на локальный для проверки
 
 # Запросы к метрикам Prometheus
-QUERY_RPS = 'rate(http_requests_total[5m])'
-QUERY_SUCCESS_RATE = 'sum(rate(http_requests_total{status=~"2.."}[5m])) / sum(rate(http_requests_total[5m])) * 100'
+QUERY_RPS = 'rate(fastapi_requests_total[5m])'
+QUERY_SUCCESS_RATE = 'sum(rate(fastapi_responses_total{status_code=~"2.."}[5m])) / sum(rate(fastapi_responses_total[5m])) * 100'
 
 
 def get_prometheus_metric(query):
@@ -0,0 +1,335 @@
+import asyncio
+import itertools
+import json
+from collections import deque
+from typing import Any, Deque, Dict, List, Literal, Optional, Set, Tuple
+
+from starlette.websockets import WebSocket
+
+from .utils import (
+    CHAT_LIMIT_REJECTIONS,
+    CHAT_MESSAGES_DROPPED,
+    CHAT_SLOW_CONSUMER_DISCONNECTS,
+    CHAT_SUBSCRIBERS,
+)
+
+SlowConsumerPolicy = Literal["drop_oldest", "disconnect"]
+
+# Код закрытия websocket для отключенного медленного подписчика (Try Again Later):
+# клиент переподключается с ?since= и получает пропущенное из истории.
+# 1008 занят под неизвестную комнату, после него клиент не переподключается
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Код закрытия websocket, если в комнате нет мест (Try Again Later)
+ROOM_FULL_CLOSE_CODE = 1013
+
+Frame = Dict[str, Any]
+
+# Оценка накладных расходов на одно сообщение истории в памяти, байт
+HISTORY_OVERHEAD_BYTES = 150
+
+# Сообщений в одном объединенном кадре: при достижении кадр уходит до конца окна
+COALESCE_MAX_MESSAGES = 1000
+
+
+def encode_frame(seq: int, message: str) -> Frame:
+    """ASGI-кадр сообщения: {"seq": ..., "text": ...} в JSON."""
+    return {"type": "websocket.send", "text": json.dumps({"seq": seq, "text": message}, ensure_ascii=False)}
+
+
+def merge_frames(frames: List[Frame]) -> Frame:
+    """Один кадр из нескольких: JSON-массив их сообщений без повторного кодирования."""
+    if len(frames) == 1:
+        return frames[0]
+    return {"type": "websocket.send", "text": "[" + ",".join(frame["text"] for frame in frames) + "]"}
+
+
+class RoomHistory:
+    """
+    Кольцевой буфер последних сообщений комнаты. Хранит уже закодированные
+    кадры и ограничен числом сообщений и оценочным объемом в байтах: при
+    переполнении вытесняются самые старые сообщения.
+    """
+
+    def __init__(self, max_messages: int = 1000, max_bytes: int = 1024 * 1024) -> None:
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._entries: Deque[Tuple[int, Frame, int]] = deque()
+        self._bytes = 0
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def first_seq(self) -> Optional[int]:
+        return self._entries[0][0] if self._entries else None
+
+    def append(self, seq: int, frame: Frame) -> None:
+        self.last_seq = max(self.last_seq, seq)
+        if self.max_messages <= 0:
+            return
+        size = HISTORY_OVERHEAD_BYTES + len(frame["text"])
+        self._entries.append((seq, frame, size))
+        self._bytes += size
+        while len(self._entries) > self.max_messages or self._bytes > self.max_bytes:
+            _, _, evicted = self._entries.popleft()
+            self._bytes -= evicted
+
+    def since(self, seq: int) -> List[Tuple[int, Frame]]:
+        """Сообщения с номером больше seq, в порядке публикации."""
+        replay = []
+        for entry_seq, frame, _ in reversed(self._entries):
+            if entry_seq <= seq:
+                break
+            replay.append((entry_seq, frame))
+        replay.reverse()
+        return replay
+
+
+class Subscriber:
+    """
+    Подписчик комнаты: ограниченная очередь исходящих кадров и собственная
+    задача-писатель, поэтому медленный клиент не задерживает остальных.
+    """
+
+    __slots__ = (
+        "websocket", "queue_size", "policy", "dropped", "closed", "last_seq", "_queue", "_wakeup", "_writer"
+    )
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: SlowConsumerPolicy) -> None:
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        # Номер последнего поставленного в очередь сообщения
+        self.last_seq = 0
+        self._queue: Deque[Frame] = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def preload(self, replay: List[Tuple[int, Frame]]) -> None:
+        """Ставит в очередь сообщения из истории; размер ограничен самой историей."""
+        for seq, frame in replay:
+            self._queue.append(frame)
+            self.last_seq = seq
+        if replay:
+            self._wakeup.set()
+
+    def offer(self, seq: int, frame: Frame) -> bool:
+        """Ставит кадр в очередь; False означает, что подписчика надо отключить."""
+        if seq <= self.last_seq:
+            # Уже отправлено из истории при подписке
+            return True
+        self.last_seq = seq
+        if len(self._queue) >= self.queue_size:
+            if self.policy == "disconnect":
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+            CHAT_MESSAGES_DROPPED.labels(policy=self.policy).inc()
+        self._queue.append(frame)
+        self._wakeup.set()
+        return True
+
+    def start(self, broadcaster: "Broadcaster") -> None:
+        self._writer = asyncio.create_task(self._write(broadcaster))
+
+    async def stop(self) -> None:
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+
+    async def _write(self, broadcaster: "Broadcaster") -> None:
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                await self.websocket.send(self._queue.popleft())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Соединение разорвано: подписчик больше не получает сообщений
+            await broadcaster.unsubscribe(self)
+
+
+class _Shard:
+    """Часть подписчиков комнаты со своей задачей рассылки."""
+
+    def __init__(self) -> None:
+        self.subscribers: Set[Subscriber] = set()
+        self.inbox: "asyncio.Queue[Tuple[int, Frame]]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+
+class Broadcaster:
+    """
+    Рассылка сообщений подписчикам комнаты чата.
+
+    Подписчики разбиты на шарды, у каждого шарда своя задача рассылки.
+    publish кодирует ASGI-кадр один раз и кладет его во входные очереди
+    шардов, поэтому его время не зависит от числа подписчиков. Шард
+    раскладывает кадр по очередям подписчиков, а отправкой в сокет занимается
+    задача-писатель каждого подписчика. Переполненная очередь подписчика
+    обрабатывается по политике: drop_oldest вытесняет самый старый кадр,
+    disconnect закрывает соединение.
+
+    Опубликованные сообщения попадают в RoomHistory комнаты; подписчик с
+    since сначала получает из нее сообщения с номерами больше since.
+    При max_subscribers подписчиках новые соединения закрываются с кодом
+    ROOM_FULL_CLOSE_CODE.
+
+    С coalesce_window больше нуля сообщения, опубликованные в пределах окна,
+    уходят подписчикам одним кадром-массивом (merge_frames), а в историю
+    по-прежнему записываются по одному.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 256,
+        policy: SlowConsumerPolicy = "drop_oldest",
+        shards: int = 4,
+        history: Optional[RoomHistory] = None,
+        max_subscribers: int = 0,
+        coalesce_window: float = 0.0,
+    ) -> None:
+        if queue_size < 1 or shards < 1:
+            raise ValueError("Размер очереди и число шардов должны быть положительными.")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_subscribers = max_subscribers
+        self.coalesce_window = coalesce_window
+        # Кадры текущего окна объединения и таймер его отправки
+        self._coalesced: List[Frame] = []
+        self._coalesced_seq = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.history = history if history is not None else RoomHistory(max_messages=0)
+        self._shards: List[_Shard] = [_Shard() for _ in range(shards)]
+        self._next_shard = itertools.cycle(self._shards)
+        self._by_websocket: Dict[WebSocket, Subscriber] = {}
+        # Ссылки на фоновые отключения, чтобы задачи не собрал GC
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._by_websocket)
+
+    @property
+    def subscribers(self) -> List[Subscriber]:
+        return list(self._by_websocket.values())
+
+    async def subscribe(self, ws: WebSocket, since: Optional[int] = None) -> Optional[Subscriber]:
+        """Подписывает websocket; None, если комната заполнена и соединение закрыто."""
+        await ws.accept()
+        # Проверка после accept: между ней и добавлением подписчика нет await
+        if self.max_subscribers and len(self._by_websocket) >= self.max_subscribers:
+            CHAT_LIMIT_REJECTIONS.labels(limit="subscribers").inc()
+            await ws.close(code=ROOM_FULL_CLOSE_CODE)
+            return None
+        subscriber = Subscriber(ws, self.queue_size, self.policy)
+        # Между снимком истории и добавлением в шард нет await: сообщения,
+        # еще лежащие во входной очереди шарда, отсекаются по last_seq.
+        # Незавершенное окно отправляется сразу, чтобы его кадр целиком
+        # состоял из сообщений до подписки
+        self._flush_coalesced()
+        if since is not None:
+            subscriber.preload(self.history.since(since))
+        subscriber.last_seq = max(subscriber.last_seq, self.history.last_seq)
+        shard = next(self._next_shard)
+        if shard.task is None:
+            shard.task = asyncio.create_task(self._fan_out(shard))
+        shard.subscribers.add(subscriber)
+        self._by_websocket[ws] = subscriber
+        CHAT_SUBSCRIBERS.inc()
+        subscriber.start(self)
+        return subscriber
+
+    async def unsubscribe(self, ws_or_subscriber) -> None:
+        subscriber = ws_or_subscriber
+        if not isinstance(subscriber, Subscriber):
+            subscriber = self._by_websocket.get(ws_or_subscriber)
+        if subscriber is None or self._by_websocket.get(subscriber.websocket) is not subscriber:
+            return
+        del self._by_websocket[subscriber.websocket]
+        CHAT_SUBSCRIBERS.dec()
+        for shard in self._shards:
+            shard.subscribers.discard(subscriber)
+        await subscriber.stop()
+
+    async def publish(self, message: str, seq: Optional[int] = None) -> None:
+        """Рассылает сообщение; seq задает backend, иначе номер локальный."""
+        if seq is None:
+            seq = self.history.last_seq + 1
+        # Кадр общий для всех подписчиков и кодируется один раз
+        frame = encode_frame(seq, message)
+        self.history.append(seq, frame)
+        if not self.coalesce_window:
+            self._dispatch(seq, frame)
+            return
+        self._coalesced.append(frame)
+        self._coalesced_seq = seq
+        if len(self._coalesced) >= COALESCE_MAX_MESSAGES:
+            self._flush_coalesced()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.coalesce_window, self._flush_coalesced)
+
+    def _flush_coalesced(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._coalesced:
+            frames, self._coalesced = self._coalesced, []
+            # Кадр отсекается по seq последнего сообщения окна
+            self._dispatch(self._coalesced_seq, merge_frames(frames))
+
+    def _dispatch(self, seq: int, frame: Frame) -> None:
+        for shard in self._shards:
+            if shard.subscribers:
+                shard.inbox.put_nowait((seq, frame))
+
+    async def close(self) -> None:
+        """Отключает подписчиков и останавливает задачи рассылки."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._coalesced.clear()
+        for subscriber in self.subscribers:
+            await self.unsubscribe(subscriber)
+        for shard in self._shards:
+            if shard.task is not None:
+                shard.task.cancel()
+                try:
+                    await shard.task
+                except asyncio.CancelledError:
+                    pass
+                shard.task = None
+
+    async def _fan_out(self, shard: _Shard) -> None:
+        while True:
+            seq, frame = await shard.inbox.get()
+            slow = [subscriber for subscriber in shard.subscribers if not subscriber.offer(seq, frame)]
+            for subscriber in slow:
+                CHAT_SLOW_CONSUMER_DISCONNECTS.inc()
+                shard.subscribers.discard(subscriber)
+                task = asyncio.create_task(self._disconnect(subscriber))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _disconnect(self, subscriber: Subscriber) -> None:
+        await self.unsubscribe(subscriber)
+        try:
+            await subscriber.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
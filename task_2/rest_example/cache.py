@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+from .utils import CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    In-process LRU-кэш с TTL и ограничением по числу записей и по
+    оценочному объему в байтах. Не потокобезопасен: рассчитан на event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 10_000,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 60.0,
+        sizeof: Callable[[Any], int] = lambda value: 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        # Значение хранится вместе со сроком годности и оценкой размера
+        self._entries: "OrderedDict[Hashable, Tuple[V, float, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            CACHE_MISSES.labels(cache=self.name).inc()
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= self._clock():
+            self._remove(key, reason="ttl")
+            CACHE_MISSES.labels(cache=self.name).inc()
+            return None
+        self._entries.move_to_end(key)
+        CACHE_HITS.labels(cache=self.name).inc()
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, self._clock() + self.ttl, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest, reason="lru")
+
+    def invalidate(self, key: Hashable) -> None:
+        if key in self._entries:
+            self._remove(key, reason="invalidation")
+
+    def clear(self) -> None:
+        if self._entries:
+            CACHE_EVICTIONS.labels(cache=self.name, reason="invalidation").inc(
+                len(self._entries)
+            )
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable, reason: Optional[str] = None) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        if reason is not None:
+            CACHE_EVICTIONS.labels(cache=self.name, reason=reason).inc()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+from uuid import UUID, uuid4
+
+from starlette.websockets import WebSocket
+
+from .broadcast import Broadcaster, RoomHistory, Subscriber
+from .pubsub import PubSubBackend, create_backend
+from .settings import ChatSettings
+from .utils import CHAT_LIMIT_REJECTIONS, CHAT_LOCAL_ROOMS, CHAT_ROOMS, CHAT_ROOMS_EVICTED
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHub:
+    """
+    Комнаты чата. Реестр комнат и доставка сообщений между процессами идут
+    через PubSubBackend, а подписчики этого процесса обслуживаются локальным
+    Broadcaster комнаты. Broadcaster создается при первом сообщении или
+    подписке и хранит историю комнаты, поэтому существует и без подписчиков.
+
+    Раз в room_sweep_interval хаб отмечает в реестре комнаты с подписчиками
+    или сообщениями в этом процессе, после чего backend удаляет комнаты без
+    активности дольше room_idle_ttl во всех процессах. Локальный Broadcaster
+    без подписчиков освобождается вместе с историей, когда комната удалена
+    из реестра или простаивает в этом процессе дольше room_idle_ttl.
+    """
+
+    def __init__(self, backend: PubSubBackend, settings: ChatSettings) -> None:
+        self.backend = backend
+        self.settings = settings
+        # Рассылка и история комнат, известных этому процессу
+        self.local_rooms: Dict[UUID, Broadcaster] = {}
+        # Последняя активность комнаты в этом процессе по time.monotonic
+        self._last_active: Dict[UUID, float] = {}
+        self._last_sweep = time.monotonic()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.backend.start(self._deliver)
+        self._last_sweep = time.monotonic()
+        self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for broadcaster in self.local_rooms.values():
+            await broadcaster.close()
+        self.local_rooms.clear()
+        self._last_active.clear()
+        CHAT_LOCAL_ROOMS.set(0)
+        await self.backend.close()
+
+    async def create_room(self) -> Optional[UUID]:
+        """Создает комнату; None, если в реестре уже max_rooms комнат."""
+        room_id = uuid4()
+        if not await self.backend.create_room(room_id, self.settings.max_rooms):
+            CHAT_LIMIT_REJECTIONS.labels(limit="rooms").inc()
+            return None
+        return room_id
+
+    async def has_room(self, room_id: UUID) -> bool:
+        return await self.backend.room_exists(room_id)
+
+    async def list_rooms(self, after: Optional[UUID] = None, limit: Optional[int] = None) -> List[UUID]:
+        """Страница комнат по возрастанию id, начиная после after."""
+        return await self.backend.list_rooms(after, limit)
+
+    async def publish(self, room_id: UUID, message: str) -> None:
+        await self.backend.publish(room_id, message)
+
+    async def publish_many(self, room_id: UUID, messages: List[str]) -> None:
+        await self.backend.publish_many(room_id, messages)
+
+    async def subscribe(self, room_id: UUID, ws: WebSocket, since: Optional[int] = None) -> Optional[Subscriber]:
+        """
+        Подписывает websocket; при since сначала отдаются сообщения из истории.
+        None, если в комнате этого процесса уже max_subscribers_per_room
+        подписчиков: соединение закрыто с кодом ROOM_FULL_CLOSE_CODE.
+        """
+        return await self._room(room_id).subscribe(ws, since)
+
+    async def unsubscribe(self, room_id: UUID, subscriber: Subscriber) -> None:
+        broadcaster = self.local_rooms.get(room_id)
+        if broadcaster is not None:
+            self._last_active[room_id] = time.monotonic()
+            await broadcaster.unsubscribe(subscriber)
+
+    async def sweep(self) -> List[UUID]:
+        """Одна проверка простаивающих комнат; возвращает удаленные из реестра."""
+        now = time.monotonic()
+        ttl = self.settings.room_idle_ttl
+        evicted: List[UUID] = []
+        if ttl:
+            await self.backend.touch_rooms(
+                room_id
+                for room_id, broadcaster in self.local_rooms.items()
+                if len(broadcaster) or self._last_active[room_id] >= self._last_sweep
+            )
+            evicted = await self.backend.evict_idle_rooms(ttl)
+            CHAT_ROOMS_EVICTED.inc(len(evicted))
+            removed = set(evicted)
+            for room_id, broadcaster in list(self.local_rooms.items()):
+                # Проверка и удаление без await между ними: подписчик не
+                # попадет в уже освобожденный Broadcaster
+                if len(broadcaster) or (room_id not in removed and now - self._last_active[room_id] <= ttl):
+                    continue
+                del self.local_rooms[room_id]
+                del self._last_active[room_id]
+                await broadcaster.close()
+        self._last_sweep = now
+        CHAT_LOCAL_ROOMS.set(len(self.local_rooms))
+        CHAT_ROOMS.set(await self.backend.count_rooms())
+        return evicted
+
+    async def _sweep_periodically(self) -> None:
+        interval = self.settings.room_sweep_interval
+        if self.settings.room_idle_ttl:
+            # Комнату с подписчиками успевают отметить до истечения ttl
+            interval = min(interval, self.settings.room_idle_ttl / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Ошибка очистки простаивающих комнат чата")
+
+    def _room(self, room_id: UUID) -> Broadcaster:
+        broadcaster = self.local_rooms.get(room_id)
+        if broadcaster is None:
+            broadcaster = self.local_rooms[room_id] = Broadcaster(
+                queue_size=self.settings.queue_size,
+                policy=self.settings.slow_consumer_policy,
+                shards=self.settings.shards,
+                history=RoomHistory(self.settings.history_max_messages, self.settings.history_max_bytes),
+                max_subscribers=self.settings.max_subscribers_per_room,
+                coalesce_window=self.settings.coalesce_window_ms / 1000,
+            )
+            CHAT_LOCAL_ROOMS.set(len(self.local_rooms))
+        self._last_active[room_id] = time.monotonic()
+        return broadcaster
+
+    async def _deliver(self, room_id: UUID, seq: int, message: str) -> None:
+        await self._room(room_id).publish(message, seq)
+
+
+settings = ChatSettings.from_env()
+
+# Запускается и останавливается в lifespan приложения
+hub = ChatHub(create_backend(settings), settings)
@@ -1,9 +1,15 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 from aiosqlite import Connection
+from ..errors import CartNotFoundException, ItemNotFoundException
 from ..models.cart import CartResponse, CartItem
 from ..models.item import ItemResponse, ItemCreateRequest, ItemUpdateRequest
+from ..models.pagination import PageCursor
+from .item_cache import item_cache
+from .pagination import keyset_condition, next_cursor, order_by, sort_key
 from .utils import fetch_one, fetch_all
 
+MAX_SQL_PARAMS = 900
+
 
 async def create_cart(conn: Connection) -> CartResponse:
     cursor = await conn.execute("INSERT INTO carts (price) VALUES (0.0)")
@@ -21,29 +27,89 @@ async def create_item(conn: Connection, item_data: ItemCreateRequest) -> ItemRes
         (item_data.name, item_data.price),
     )
     await conn.commit()
+    item_cache.invalidate_lists()
     item_id = cursor.lastrowid
     return ItemResponse(
         id=item_id, name=item_data.name, price=item_data.price, deleted=False
     )
 
 
-async def get_item(conn: Connection, item_id: int) -> Optional[ItemResponse]:
-    """Получение товара по id с проверкой на удаление."""
+async def create_items_bulk(
+    conn: Connection, rows: Sequence[Tuple[str, float]]
+) -> List[int]:
+    """
+    Пакетное создание товаров из уже провалидированных пар (name, price)
+    одним executemany в одной транзакции. Возвращает id в порядке строк.
+    """
+    if not rows:
+        return []
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Под блокировкой записи id назначаются явно, подряд после текущего максимума
+        row = await fetch_one(conn, "SELECT COALESCE(MAX(id), 0) AS max_id FROM items")
+        first_id = row["max_id"] + 1
+        await conn.executemany(
+            "INSERT INTO items (id, name, price) VALUES (?, ?, ?)",
+            ((first_id + i, name, price) for i, (name, price) in enumerate(rows)),
+        )
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    item_cache.invalidate_lists()
+    return list(range(first_id, first_id + len(rows)))
+
+
+async def get_item(
+    conn: Connection, item_id: int, use_cache: bool = True
+) -> Optional[ItemResponse]:
+    """
+    Получение товара по id с проверкой на удаление (через кэш товаров).
+    Проверки перед записью передают use_cache=False: кэш может отставать
+    от изменений, сделанных другим процессом.
+    """
+    item = item_cache.get_item(item_id) if use_cache else None
+    if item is not None:
+        return item
+    generation = item_cache.generation
     row = await fetch_one(conn, "SELECT * FROM items WHERE id = ?", (item_id,))
     if row is None:
         return None
-    return ItemResponse(**row)
+    item = ItemResponse(**row)
+    item_cache.put_item(item, generation)
+    return item
+
+
+def _items_page_key(
+    offset: int,
+    limit: int,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    show_deleted: bool,
+    after: Optional[PageCursor],
+) -> tuple:
+    return (
+        offset,
+        limit,
+        min_price,
+        max_price,
+        show_deleted,
+        (after.key, after.id, after.price) if after is not None else None,
+    )
 
 
-async def get_items_list(
-    conn: Connection,
-    offset: int = 0,
-    limit: int = 10,
-    min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
-    show_deleted: bool = False,
-) -> List[ItemResponse]:
-    query = "SELECT * FROM items WHERE 1=1"
+def _items_page_query(
+    columns: str,
+    offset: int,
+    limit: int,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    show_deleted: bool,
+    after: Optional[PageCursor],
+) -> Tuple[str, tuple, str]:
+    """Запрос страницы товаров (limit + 1 строк), его параметры и ключ сортировки."""
+    key = sort_key(min_price, max_price)
+    query = f"SELECT {columns} FROM items WHERE 1=1"
     params = []
 
     if min_price is not None:
@@ -58,11 +124,70 @@ async def get_items_list(
         query += " AND deleted = ?"
         params.append(False)
 
-    query += " LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    if after is not None:
+        if after.key != key:
+            raise ValueError("Курсор не соответствует фильтрам запроса.")
+        condition, condition_params = keyset_condition(after, "items")
+        query += condition
+        params.extend(condition_params)
+
+    query += order_by(key, "items") + " LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+    return query, tuple(params), key
+
+
+async def get_items_list(
+    conn: Connection,
+    offset: int = 0,
+    limit: int = 10,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    show_deleted: bool = False,
+    after: Optional[PageCursor] = None,
+) -> Tuple[List[ItemResponse], Optional[PageCursor]]:
+    """Получение страницы товаров и курсора на следующую страницу (через кэш)."""
+    cache_key = _items_page_key(offset, limit, min_price, max_price, show_deleted, after)
+    page = item_cache.get_page(cache_key)
+    if page is not None:
+        return page
+    generation = item_cache.generation
+
+    query, params, key = _items_page_query(
+        "*", offset, limit, min_price, max_price, show_deleted, after
+    )
+    rows = await fetch_all(conn, query, params)
+    cursor = next_cursor(rows, key, limit)
+    page = ([ItemResponse(**row) for row in rows], cursor)
+    item_cache.put_page(cache_key, page, generation)
+    return page
+
+
+async def get_items_list_versions(
+    conn: Connection,
+    offset: int = 0,
+    limit: int = 10,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    show_deleted: bool = False,
+    after: Optional[PageCursor] = None,
+) -> Tuple[List[Tuple[int, int]], Optional[PageCursor]]:
+    """
+    Пары (id, version) страницы товаров и курсор для ETag без построения
+    моделей: страница из кэша берется готовой, иначе читаются три столбца.
+    """
+    page = item_cache.get_page(
+        _items_page_key(offset, limit, min_price, max_price, show_deleted, after)
+    )
+    if page is not None:
+        items, cursor = page
+        return [(item.id, item.version) for item in items], cursor
 
-    rows = await fetch_all(conn, query, tuple(params))
-    return [ItemResponse(**row) for row in rows]
+    query, params, key = _items_page_query(
+        "id, price, version", offset, limit, min_price, max_price, show_deleted, after
+    )
+    rows = await fetch_all(conn, query, params)
+    cursor = next_cursor(rows, key, limit)
+    return [(row["id"], row["version"]) for row in rows], cursor
 
 
 async def update_item(
@@ -71,11 +196,16 @@ async def update_item(
     query = """
         UPDATE items 
         SET name = COALESCE(?, name), 
-            price = COALESCE(?, price) 
+            price = COALESCE(?, price),
+            version = version + 1
         WHERE id = ? AND deleted = FALSE
     """
-    await conn.execute(query, (item_update.name, item_update.price, item_id))
+    cursor = await conn.execute(query, (item_update.name, item_update.price, item_id))
     await conn.commit()
+    item_cache.invalidate_item(item_id)
+    if cursor.rowcount == 0:
+        # Товар удален (возможно, другим процессом после проверки)
+        return None
     row = await fetch_one(conn, "SELECT * FROM items WHERE id = ?", (item_id,))
     if row is None:
         return None
@@ -83,8 +213,12 @@ async def update_item(
 
 
 async def delete_item(conn: Connection, item_id: int):
-    await conn.execute("UPDATE items SET deleted = TRUE WHERE id = ?", (item_id,))
+    await conn.execute(
+        "UPDATE items SET deleted = TRUE, version = version + 1 WHERE id = ?",
+        (item_id,),
+    )
     await conn.commit()
+    item_cache.invalidate_item(item_id)
 
 
 async def get_cart(conn: Connection, cart_id: int) -> Optional[CartResponse]:
@@ -93,9 +227,39 @@ async def get_cart(conn: Connection, cart_id: int) -> Optional[CartResponse]:
     if cart_row is None:
         return None  # Корзина не найдена
 
-    # Получаем товары в корзине
+    items = await _get_cart_items(conn, cart_id)
+    return CartResponse(
+        id=cart_row["id"], items=items, price=cart_row["price"], version=cart_row["version"]
+    )
+
+
+async def get_cart_version(conn: Connection, cart_id: int) -> Optional[Tuple[int, int]]:
+    """
+    Версия корзины для ETag без построения модели: версия строки корзины и
+    сумма версий ее товаров (версии только растут, поэтому сумма меняется
+    при любом изменении товаров корзины).
+    """
+    row = await fetch_one(
+        conn,
+        """
+        SELECT carts.version, COALESCE(SUM(items.version), 0) AS items_version
+        FROM carts
+        LEFT JOIN cart_items ON cart_items.cart_id = carts.id
+        LEFT JOIN items ON items.id = cart_items.item_id
+        WHERE carts.id = ?
+        GROUP BY carts.id
+        """,
+        (cart_id,),
+    )
+    if row is None:
+        return None
+    return row["version"], row["items_version"]
+
+
+async def _get_cart_items(conn: Connection, cart_id: int) -> List[CartItem]:
+    """Неудаленные товары корзины."""
     items_query = """
-        SELECT ci.item_id, ci.quantity, ci.available, i.name, i.price 
+        SELECT ci.item_id, ci.quantity, ci.available, i.name, i.price, i.version
         FROM cart_items ci 
         JOIN items i ON ci.item_id = i.id 
         WHERE ci.cart_id = ? AND i.deleted = FALSE
@@ -103,7 +267,7 @@ async def get_cart(conn: Connection, cart_id: int) -> Optional[CartResponse]:
     items_rows = await fetch_all(conn, items_query, (cart_id,))
 
     # Преобразование строк в объекты CartItem
-    items = [
+    return [
         CartItem(
             id=item_row["item_id"],
             item=ItemResponse(
@@ -111,6 +275,7 @@ async def get_cart(conn: Connection, cart_id: int) -> Optional[CartResponse]:
                 name=item_row["name"],
                 price=item_row["price"],
                 deleted=False,  # Предполагаем, что deleted = FALSE
+                version=item_row["version"],
             ),
             quantity=item_row["quantity"],
             available=item_row["available"],
@@ -118,123 +283,265 @@ async def get_cart(conn: Connection, cart_id: int) -> Optional[CartResponse]:
         for item_row in items_rows
     ]
 
-    return CartResponse(id=cart_row["id"], items=items, price=cart_row["price"])
 
-
-async def get_cart_list(
-    conn: Connection,
-    offset: int = 0,
-    limit: int = 10,
-    min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
-    min_quantity: Optional[int] = None,
-    max_quantity: Optional[int] = None,
-) -> List[CartResponse]:
-    query = "SELECT * FROM carts WHERE 1=1"
+def _carts_page_query(
+    columns: str,
+    offset: int,
+    limit: int,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    min_quantity: Optional[int],
+    max_quantity: Optional[int],
+    after: Optional[PageCursor],
+) -> Tuple[str, tuple, str]:
+    """Запрос страницы корзин (limit + 1 строк), его параметры и ключ сортировки."""
+    key = sort_key(min_price, max_price)
+    query = f"SELECT {columns} FROM carts WHERE 1=1"
     params = []
 
     if min_price is not None:
-        query += " AND price >= ?"
+        query += " AND carts.price >= ?"
         params.append(min_price)
 
     if max_price is not None:
-        query += " AND price <= ?"
+        query += " AND carts.price <= ?"
         params.append(max_price)
 
-    query += " LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    # Количество товаров считается по индексу cart_items только для
+    # корзин-кандидатов, пока не наберется страница
+    total_quantity = (
+        "(SELECT COALESCE(SUM(quantity), 0) FROM cart_items"
+        " WHERE cart_items.cart_id = carts.id)"
+    )
+
+    if min_quantity is not None:
+        query += f" AND {total_quantity} >= ?"
+        params.append(min_quantity)
 
-    cart_rows = await fetch_all(conn, query, tuple(params))
-    carts = []
+    if max_quantity is not None:
+        query += f" AND {total_quantity} <= ?"
+        params.append(max_quantity)
 
-    for cart_row in cart_rows:
-        cart_id = cart_row["id"]
-        cart_price = cart_row["price"]
+    if after is not None:
+        if after.key != key:
+            raise ValueError("Курсор не соответствует фильтрам запроса.")
+        condition, condition_params = keyset_condition(after, "carts")
+        query += condition
+        params.extend(condition_params)
 
-        items_query = """
-            SELECT cart_items.quantity, cart_items.available, items.id, items.name, items.price, items.deleted
-            FROM cart_items 
-            JOIN items ON cart_items.item_id = items.id 
-            WHERE cart_items.cart_id = ?
+    query += order_by(key, "carts") + " LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+    return query, tuple(params), key
+
+
+async def get_cart_list_versions(
+    conn: Connection,
+    offset: int = 0,
+    limit: int = 10,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_quantity: Optional[int] = None,
+    max_quantity: Optional[int] = None,
+    after: Optional[PageCursor] = None,
+) -> Tuple[List[Tuple[int, int, int]], Optional[PageCursor]]:
+    """
+    Версии страницы корзин для ETag одним запросом без построения моделей:
+    (id, версия корзины, сумма версий ее товаров), как в get_cart_version.
+    """
+    items_version = (
+        "(SELECT COALESCE(SUM(items.version), 0) FROM cart_items"
+        " JOIN items ON items.id = cart_items.item_id"
+        " WHERE cart_items.cart_id = carts.id) AS items_version"
+    )
+    query, params, key = _carts_page_query(
+        f"carts.id, carts.price, carts.version, {items_version}",
+        offset, limit, min_price, max_price, min_quantity, max_quantity, after,
+    )
+    rows = await fetch_all(conn, query, params)
+    cursor = next_cursor(rows, key, limit)
+    return [(row["id"], row["version"], row["items_version"]) for row in rows], cursor
+
+
+async def get_cart_list(
+    conn: Connection,
+    offset: int = 0,
+    limit: int = 10,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_quantity: Optional[int] = None,
+    max_quantity: Optional[int] = None,
+    after: Optional[PageCursor] = None,
+) -> Tuple[List[CartResponse], Optional[PageCursor]]:
+    """
+    Получение страницы корзин за два запроса: страница корзин с фильтрами
+    (включая фильтр по количеству товаров) и товары всех корзин страницы.
+    """
+    query, params, key = _carts_page_query(
+        "carts.id, carts.price, carts.version",
+        offset, limit, min_price, max_price, min_quantity, max_quantity, after,
+    )
+    cart_rows = await fetch_all(conn, query, params)
+    cursor = next_cursor(cart_rows, key, limit)
+    if not cart_rows:
+        return [], cursor
+
+    items_by_cart: Dict[int, List[CartItem]] = {row["id"]: [] for row in cart_rows}
+    cart_ids = list(items_by_cart)
+    items_rows = []
+    # Для больших страниц список id делится на части из-за лимита параметров SQLite
+    for start in range(0, len(cart_ids), MAX_SQL_PARAMS):
+        chunk = cart_ids[start : start + MAX_SQL_PARAMS]
+        placeholders = ", ".join("?" * len(chunk))
+        items_query = f"""
+            SELECT cart_items.cart_id, cart_items.quantity, cart_items.available,
+                   items.id, items.name, items.price, items.deleted, items.version
+            FROM cart_items
+            JOIN items ON cart_items.item_id = items.id
+            WHERE cart_items.cart_id IN ({placeholders})
         """
-        items_rows = await fetch_all(conn, items_query, (cart_id,))
+        items_rows.extend(await fetch_all(conn, items_query, tuple(chunk)))
 
-        items = [
+    for item_row in items_rows:
+        items_by_cart[item_row["cart_id"]].append(
             CartItem(
                 item=ItemResponse(
                     id=item_row["id"],
                     name=item_row["name"],
                     price=item_row["price"],
                     deleted=item_row["deleted"],
+                    version=item_row["version"],
                 ),
                 quantity=item_row["quantity"],
                 available=item_row["available"],
             )
-            for item_row in items_rows
-        ]
-
-        total_quantity = sum(item.quantity for item in items)
-        if (min_quantity is not None and total_quantity < min_quantity) or (
-            max_quantity is not None and total_quantity > max_quantity
-        ):
-            continue
-
-        carts.append(CartResponse(id=cart_id, items=items, price=cart_price))
+        )
 
-    return carts
+    carts = [
+        CartResponse(
+            id=cart_row["id"],
+            items=items_by_cart[cart_row["id"]],
+            price=cart_row["price"],
+            version=cart_row["version"],
+        )
+        for cart_row in cart_rows
+    ]
+    return carts, cursor
 
 
 async def add_item_to_cart(
     conn: Connection, cart_id: int, item_id: int, quantity: int
-) -> Optional[CartResponse]:
-    """Добавление товара в корзину с проверкой на удаление и подсчетом суммы."""
-    # Получаем товар и проверяем, не удален ли он
-    item = await fetch_one(conn, "SELECT * FROM items WHERE id = ?", (item_id,))
-    if item is None:
-        return None
-
-    if item["deleted"]:
-        raise ValueError(
-            f"Товар '{item['name']}' помечен как удаленный и не может быть добавлен в корзину."
+) -> CartResponse:
+    """
+    Добавление товара в корзину одной транзакцией BEGIN IMMEDIATE: проверка
+    корзины и товара, UPSERT строки корзины и инкремент суммы корзины.
+    Возвращает корзину, прочитанную в той же транзакции.
+    """
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Корзина и товар проверяются одним запросом
+        row = await fetch_one(
+            conn,
+            """
+            SELECT carts.id AS cart_id, items.id AS item_id, items.price, items.deleted
+            FROM carts
+            LEFT JOIN items ON items.id = ?
+            WHERE carts.id = ?
+            """,
+            (item_id, cart_id),
         )
+        if row is None:
+            raise CartNotFoundException(cart_id)
+        if row["item_id"] is None or row["deleted"]:
+            raise ItemNotFoundException(item_id)
 
-    # Проверка наличия товара в корзине
-    cart_item = await fetch_one(
-        conn,
-        "SELECT * FROM cart_items WHERE cart_id = ? AND item_id = ?",
-        (cart_id, item_id),
-    )
-
-    if cart_item:
-        # Если товар уже в корзине, увеличиваем его количество
-        new_quantity = cart_item["quantity"] + quantity
-        await conn.execute(
-            "UPDATE cart_items SET quantity = ?, price = ? * quantity WHERE cart_id = ? AND item_id = ?",
-            (new_quantity, item["price"], cart_id, item_id),
-        )
-    else:
-        # Иначе добавляем новый товар в корзину с расчетом общей стоимости
-        total_price = item["price"] * quantity
+        delta = row["price"] * quantity
         await conn.execute(
-            "INSERT INTO cart_items (cart_id, item_id, quantity, price) VALUES (?, ?, ?, ?)",
-            (cart_id, item_id, quantity, total_price),
+            """
+            INSERT INTO cart_items (cart_id, item_id, quantity, price)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (cart_id, item_id) DO UPDATE
+            SET quantity = cart_items.quantity + excluded.quantity,
+                price = cart_items.price + excluded.price
+            """,
+            (cart_id, item_id, quantity, delta),
         )
-
-    # Обновляем поле `price` в таблице `carts`
-    await conn.execute(
-        """
-        UPDATE carts
-        SET price = (
-            SELECT COALESCE(SUM(price), 0)
-            FROM cart_items
-            WHERE cart_id = ?
+        cart_row = await fetch_one(
+            conn,
+            """
+            UPDATE carts SET price = price + ?, version = version + 1
+            WHERE id = ? RETURNING id, price, version
+            """,
+            (delta, cart_id),
         )
-        WHERE id = ?
-        """,
-        (cart_id, cart_id),
+        items = await _get_cart_items(conn, cart_id)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+
+    return CartResponse(
+        id=cart_row["id"], items=items, price=cart_row["price"], version=cart_row["version"]
     )
 
-    await conn.commit()
 
-    # Возвращаем обновленную корзину
-    return await get_cart(conn, cart_id)
+async def add_items_to_cart_bulk(
+    conn: Connection, cart_id: int, rows: Sequence[Tuple[int, int]]
+) -> Tuple[CartResponse, List[Optional[str]]]:
+    """
+    Пакетное добавление пар (item_id, quantity) в корзину одной транзакцией.
+    Возвращает обновленную корзину и для каждой строки None или текст ошибки.
+    """
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        if await fetch_one(conn, "SELECT id FROM carts WHERE id = ?", (cart_id,)) is None:
+            raise CartNotFoundException(cart_id)
+
+        prices: Dict[int, float] = {}
+        item_ids = list({item_id for item_id, _ in rows})
+        for start in range(0, len(item_ids), MAX_SQL_PARAMS):
+            chunk = item_ids[start : start + MAX_SQL_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            item_rows = await fetch_all(
+                conn,
+                f"SELECT id, price FROM items WHERE deleted = FALSE AND id IN ({placeholders})",
+                tuple(chunk),
+            )
+            prices.update((item_row["id"], item_row["price"]) for item_row in item_rows)
+
+        errors: List[Optional[str]] = []
+        upserts = []
+        for item_id, quantity in rows:
+            if item_id not in prices:
+                errors.append(f"Товар с ID {item_id} не найден или удален.")
+                continue
+            errors.append(None)
+            upserts.append((cart_id, item_id, quantity, prices[item_id] * quantity))
+
+        await conn.executemany(
+            """
+            INSERT INTO cart_items (cart_id, item_id, quantity, price)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (cart_id, item_id) DO UPDATE
+            SET quantity = cart_items.quantity + excluded.quantity,
+                price = cart_items.price + excluded.price
+            """,
+            upserts,
+        )
+        cart_row = await fetch_one(
+            conn,
+            """
+            UPDATE carts SET price = price + ?, version = version + 1
+            WHERE id = ? RETURNING id, price, version
+            """,
+            (sum(upsert[3] for upsert in upserts), cart_id),
+        )
+        items = await _get_cart_items(conn, cart_id)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+
+    cart = CartResponse(
+        id=cart_row["id"], items=items, price=cart_row["price"], version=cart_row["version"]
+    )
+    return cart, errors
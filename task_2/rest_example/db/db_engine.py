@@ -1,46 +1,52 @@
+from typing import AsyncIterator
+
 import aiosqlite
+from aiosqlite import Connection
+
+from ..errors import DatabaseUnavailableException
+from ..settings import DatabaseSettings
+from .migrations import run_migrations
+from .pool import ConnectionPool, PoolTimeoutError
+
+settings = DatabaseSettings.from_env()
+DATABASE_PATH = settings.path
+
+
+async def configure_connection(conn: Connection) -> None:
+    """Применяет профиль производительности SQLite к новому соединению."""
+    await conn.execute(f"PRAGMA busy_timeout = {settings.busy_timeout_ms}")
+    await conn.execute(f"PRAGMA journal_mode = {settings.journal_mode}")
+    await conn.execute(f"PRAGMA synchronous = {settings.synchronous}")
+    await conn.execute(f"PRAGMA mmap_size = {settings.mmap_size}")
+    await conn.execute(f"PRAGMA cache_size = {settings.cache_size}")
+    await conn.execute(f"PRAGMA temp_store = {settings.temp_store}")
+
 
-DATABASE_PATH = "./database.db"
+# Пул открывается и закрывается в lifespan приложения
+pool = ConnectionPool(
+    DATABASE_PATH,
+    max_size=settings.pool_max_size,
+    min_size=settings.pool_min_size,
+    acquire_timeout=settings.pool_acquire_timeout,
+    health_check_interval=settings.pool_health_check_interval,
+    init=configure_connection,
+)
 
 
-async def get_db_connection():
-    """Возвращает асинхронное соединение с базой данных."""
-    return await aiosqlite.connect(DATABASE_PATH)
+async def get_db_connection() -> AsyncIterator[Connection]:
+    """Выдает соединение из пула на время обработки запроса."""
+    try:
+        conn = await pool.acquire()
+    except PoolTimeoutError as exc:
+        raise DatabaseUnavailableException() from exc
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
 
 
 async def init_db():
-    """Инициализация базы данных, создание таблиц."""
-    async with aiosqlite.connect(
-        DATABASE_PATH
-    ) as conn:  # Используем явное создание подключения
-        # Создание таблицы товаров
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS items (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                deleted BOOLEAN DEFAULT FALSE
-            )
-        """)
-        # Создание таблицы корзин
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS carts (
-                id INTEGER PRIMARY KEY,
-                price REAL DEFAULT 0.0
-            )
-        """)
-        # Создание таблицы элементов корзины
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS cart_items (
-                id INTEGER PRIMARY KEY,
-                cart_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                available BOOLEAN DEFAULT TRUE,
-                price REAL NOT NULL,
-                FOREIGN KEY(cart_id) REFERENCES carts(id),
-                FOREIGN KEY(item_id) REFERENCES items(id)
-            )
-        """)
-        # Применение изменений в базе данных
-        await conn.commit()
+    """Инициализация базы данных: применение миграций схемы."""
+    async with aiosqlite.connect(DATABASE_PATH) as conn:
+        await configure_connection(conn)
+        await run_migrations(conn)
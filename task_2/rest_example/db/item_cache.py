@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple
+from ..cache import LRUCache
+from ..models.item import ItemResponse
+from ..models.pagination import PageCursor
+from ..settings import CacheSettings
+
+# Оценка накладных расходов на одну модель товара в памяти, байт
+ITEM_OVERHEAD_BYTES = 400
+
+ItemsPage = Tuple[List[ItemResponse], Optional[PageCursor]]
+
+
+def _item_size(item: ItemResponse) -> int:
+    return ITEM_OVERHEAD_BYTES + len(item.name)
+
+
+def _page_size(page: ItemsPage) -> int:
+    items, _ = page
+    return ITEM_OVERHEAD_BYTES + sum(_item_size(item) for item in items)
+
+
+class ItemCache:
+    """
+    Read-through кэш товаров и страниц списка товаров.
+
+    Записи сбрасываются при create_item, update_item и delete_item этого
+    процесса; изменения из других процессов видны не позже чем через TTL,
+    поэтому serve с несколькими воркерами кэш выключает, а проверки перед
+    записью читают базу напрямую (get_item(..., use_cache=False)).
+    Значение, прочитанное из базы до инвалидации, в кэш не кладется:
+    читатель запоминает поколение кэша до запроса и передает его в put_*.
+    """
+
+    def __init__(self, settings: CacheSettings) -> None:
+        self.enabled = settings.enabled
+        self.items: LRUCache[ItemResponse] = LRUCache(
+            "items",
+            max_entries=settings.max_entries,
+            max_bytes=settings.max_bytes // 2,
+            ttl=settings.ttl,
+            sizeof=_item_size,
+        )
+        self.lists: LRUCache[ItemsPage] = LRUCache(
+            "item_lists",
+            max_entries=settings.max_entries,
+            max_bytes=settings.max_bytes // 2,
+            ttl=settings.ttl,
+            sizeof=_page_size,
+        )
+        self.generation = 0
+
+    def get_item(self, item_id: int) -> Optional[ItemResponse]:
+        return self.items.get(item_id) if self.enabled else None
+
+    def put_item(self, item: ItemResponse, generation: int) -> None:
+        if self.enabled and generation == self.generation:
+            self.items.put(item.id, item)
+
+    def get_page(self, key: tuple) -> Optional[ItemsPage]:
+        return self.lists.get(key) if self.enabled else None
+
+    def put_page(self, key: tuple, page: ItemsPage, generation: int) -> None:
+        if self.enabled and generation == self.generation:
+            self.lists.put(key, page)
+
+    def invalidate_item(self, item_id: int) -> None:
+        """Товар изменился: сбрасываются он сам и все страницы списка."""
+        self.generation += 1
+        self.items.invalidate(item_id)
+        self.lists.clear()
+
+    def invalidate_lists(self) -> None:
+        self.generation += 1
+        self.lists.clear()
+
+
+item_cache = ItemCache(CacheSettings.from_env())
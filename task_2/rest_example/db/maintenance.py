@@ -0,0 +1,30 @@
+import asyncio
+import logging
+import sqlite3
+from aiosqlite import Connection
+from .pool import ConnectionPool, PoolClosedError, PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+async def checkpoint_and_optimize(conn: Connection) -> None:
+    """Переносит WAL в основной файл базы и обновляет статистику планировщика."""
+    await conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    await conn.execute("PRAGMA optimize")
+
+
+async def run_maintenance(pool: ConnectionPool, interval: float) -> None:
+    """Фоновая задача обслуживания базы, запускается и отменяется в lifespan."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            conn = await pool.acquire()
+        except (PoolTimeoutError, PoolClosedError):
+            logger.warning("Обслуживание базы пропущено: нет свободного соединения")
+            continue
+        try:
+            await checkpoint_and_optimize(conn)
+        except sqlite3.Error:
+            logger.exception("Ошибка обслуживания базы данных")
+        finally:
+            await pool.release(conn)
@@ -0,0 +1,124 @@
+from typing import List, NamedTuple
+from aiosqlite import Connection
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: List[str]
+
+
+# Миграции применяются строго по возрастанию версии, уже примененные пропускаются
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "initial schema",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                deleted BOOLEAN DEFAULT FALSE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS carts (
+                id INTEGER PRIMARY KEY,
+                price REAL DEFAULT 0.0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS cart_items (
+                id INTEGER PRIMARY KEY,
+                cart_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                available BOOLEAN DEFAULT TRUE,
+                price REAL NOT NULL,
+                FOREIGN KEY(cart_id) REFERENCES carts(id),
+                FOREIGN KEY(item_id) REFERENCES items(id)
+            )
+            """,
+        ],
+    ),
+    Migration(
+        2,
+        "indexes and unique cart item",
+        [
+            # Перед созданием уникального индекса схлопываем дубликаты товара в корзине
+            """
+            UPDATE cart_items
+            SET quantity = (
+                    SELECT SUM(dup.quantity) FROM cart_items dup
+                    WHERE dup.cart_id = cart_items.cart_id AND dup.item_id = cart_items.item_id
+                ),
+                price = (
+                    SELECT SUM(dup.price) FROM cart_items dup
+                    WHERE dup.cart_id = cart_items.cart_id AND dup.item_id = cart_items.item_id
+                )
+            WHERE id IN (
+                SELECT MIN(id) FROM cart_items
+                GROUP BY cart_id, item_id HAVING COUNT(*) > 1
+            )
+            """,
+            """
+            DELETE FROM cart_items
+            WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, item_id)
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_cart_items_cart_item ON cart_items (cart_id, item_id)",
+            "CREATE INDEX IF NOT EXISTS ix_items_deleted_price_id ON items (deleted, price, id)",
+            "CREATE INDEX IF NOT EXISTS ix_carts_price_id ON carts (price, id)",
+        ],
+    ),
+    Migration(
+        3,
+        "row versions for etags",
+        [
+            "ALTER TABLE items ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+            "ALTER TABLE carts ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        ],
+    ),
+]
+
+
+async def get_schema_version(conn: Connection) -> int:
+    """Текущая версия схемы (0 для пустой базы)."""
+    async with conn.execute("SELECT MAX(version) FROM schema_migrations") as cursor:
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def run_migrations(conn: Connection) -> int:
+    """
+    Применяет недостающие миграции, каждую в отдельной транзакции.
+    BEGIN IMMEDIATE не дает нескольким процессам применить миграцию дважды.
+    Возвращает итоговую версию схемы.
+    """
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.commit()
+
+    for migration in MIGRATIONS:
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            if migration.version <= await get_schema_version(conn):
+                await conn.rollback()
+                continue
+            for statement in migration.statements:
+                await conn.execute(statement)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (migration.version, migration.name),
+            )
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+
+    return await get_schema_version(conn)
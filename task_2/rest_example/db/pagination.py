@@ -0,0 +1,36 @@
+from typing import Any, Dict, List, Optional, Tuple
+from ..models.pagination import PageCursor
+
+
+def sort_key(min_price: Optional[float], max_price: Optional[float]) -> str:
+    """Страницы с фильтром по цене сортируются по (price, id), остальные по id."""
+    if min_price is not None or max_price is not None:
+        return "price"
+    return "id"
+
+
+def order_by(key: str, table: str) -> str:
+    if key == "price":
+        return f" ORDER BY {table}.price, {table}.id"
+    return f" ORDER BY {table}.id"
+
+
+def keyset_condition(cursor: PageCursor, table: str) -> Tuple[str, List[Any]]:
+    """Условие "строго после курсора" для WHERE в порядке сортировки страницы."""
+    if cursor.key == "price":
+        return f" AND ({table}.price, {table}.id) > (?, ?)", [cursor.price, cursor.id]
+    return f" AND {table}.id > ?", [cursor.id]
+
+
+def next_cursor(
+    rows: List[Dict[str, Any]], key: str, limit: int
+) -> Optional[PageCursor]:
+    """
+    Курсор на следующую страницу. Запрос выбирает limit + 1 строк: лишняя
+    строка означает, что следующая страница существует, и отбрасывается.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return PageCursor(key=key, id=last["id"], price=last["price"] if key == "price" else None)
@@ -0,0 +1,236 @@
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+import aiosqlite
+from aiosqlite import Connection
+
+from ..utils import (
+    DB_POOL_ACQUIRE_TIME,
+    DB_POOL_CONNECTIONS,
+    DB_POOL_HEALTH_CHECK_FAILURES,
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAITING,
+)
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class PoolClosedError(Exception):
+    """Пул соединений закрыт."""
+
+
+class ConnectionPool:
+    """
+    Пул соединений aiosqlite ограниченного размера.
+
+    Каждое соединение aiosqlite держит собственный поток, поэтому размер пула
+    ограничивает и число соединений, и число потоков независимо от нагрузки.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        max_size: int = 10,
+        min_size: int = 1,
+        acquire_timeout: float = 5.0,
+        health_check_interval: float = 30.0,
+        init: Optional[Callable[[Connection], Awaitable[None]]] = None,
+    ) -> None:
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError("Некорректные границы размера пула соединений.")
+        self.database = database
+        self.max_size = max_size
+        self.min_size = min_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        # Вызывается для каждого нового соединения (например, установка PRAGMA)
+        self.init = init
+
+        # Свободные соединения вместе с моментом возврата в пул
+        self._idle: Deque[Tuple[Connection, float]] = deque()
+        # Ожидающие соединения; результат None означает освободившийся слот
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    async def open(self) -> None:
+        """Открывает пул и заранее создает min_size соединений."""
+        self._closed = False
+        while self._size < self.min_size:
+            self._size += 1
+            try:
+                conn = await self._connect()
+            except BaseException:
+                self._size -= 1
+                raise
+            self._idle.append((conn, time.monotonic()))
+        self._update_metrics()
+
+    async def close(self) -> None:
+        """Закрывает свободные соединения; занятые закроются при возврате."""
+        self._closed = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(PoolClosedError("Пул соединений закрыт."))
+        while self._idle:
+            conn, _ = self._idle.popleft()
+            await self._discard(conn)
+        self._update_metrics()
+
+    async def acquire(self) -> Connection:
+        """Выдает соединение из пула, ожидая не дольше acquire_timeout."""
+        if self._closed:
+            raise PoolClosedError("Пул соединений закрыт.")
+        started = time.perf_counter()
+        conn = await self._get(started + self.acquire_timeout)
+        self._in_use += 1
+        DB_POOL_ACQUIRE_TIME.observe(time.perf_counter() - started)
+        self._update_metrics()
+        return conn
+
+    async def release(self, conn: Connection) -> None:
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию."""
+        self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+        except (sqlite3.Error, ValueError):
+            await self._discard(conn)
+            self._update_metrics()
+            return
+
+        if self._closed:
+            await self._discard(conn)
+        else:
+            # Передаем соединение напрямую ожидающему, минуя очередь свободных
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(conn)
+                    break
+            else:
+                self._idle.append((conn, time.monotonic()))
+        self._update_metrics()
+
+    async def _get(self, deadline: float) -> Connection:
+        while True:
+            while self._idle:
+                # LIFO: последнее возвращенное соединение самое "теплое"
+                conn, released_at = self._idle.pop()
+                if await self._is_healthy(conn, released_at):
+                    return conn
+                await self._discard(conn)
+
+            if self._size < self.max_size:
+                self._size += 1
+                try:
+                    return await self._connect()
+                except BaseException:
+                    self._size -= 1
+                    raise
+
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                DB_POOL_TIMEOUTS.inc()
+                raise PoolTimeoutError(
+                    f"Не удалось получить соединение за {self.acquire_timeout} с."
+                )
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            DB_POOL_WAITING.inc()
+            try:
+                conn = await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                await self._reclaim(waiter)
+                DB_POOL_TIMEOUTS.inc()
+                raise PoolTimeoutError(
+                    f"Не удалось получить соединение за {self.acquire_timeout} с."
+                ) from None
+            except asyncio.CancelledError:
+                await self._reclaim(waiter)
+                raise
+            finally:
+                DB_POOL_WAITING.dec()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+            if conn is not None:
+                return conn
+
+    async def _reclaim(self, waiter: asyncio.Future) -> None:
+        # Соединение или слот могли быть переданы уже после отмены ожидания
+        # (по таймауту или отмене задачи): иначе они потеряны для пула
+        if not waiter.done() or waiter.cancelled() or waiter.exception() is not None:
+            return
+        handed = waiter.result()
+        if handed is not None:
+            self._in_use += 1
+            await self.release(handed)
+        else:
+            self._wake_waiter()
+
+    async def _connect(self) -> Connection:
+        conn = aiosqlite.connect(self.database)
+        # Поток соединения не должен мешать завершению процесса, если
+        # приложение остановили без lifespan (например, в тестах)
+        conn.daemon = True
+        await conn
+        if self.init is not None:
+            try:
+                await self.init(conn)
+            except BaseException:
+                await conn.close()
+                raise
+        return conn
+
+    async def _is_healthy(self, conn: Connection, released_at: float) -> bool:
+        if time.monotonic() - released_at < self.health_check_interval:
+            return True
+        try:
+            async with conn.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+        except (sqlite3.Error, ValueError):
+            DB_POOL_HEALTH_CHECK_FAILURES.inc()
+            return False
+        return True
+
+    async def _discard(self, conn: Connection) -> None:
+        self._size -= 1
+        try:
+            await conn.close()
+        except (sqlite3.Error, ValueError):
+            pass
+        self._wake_waiter()
+
+    def _wake_waiter(self) -> None:
+        # Освободился слот: даем ожидающему создать новое соединение
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _update_metrics(self) -> None:
+        DB_POOL_CONNECTIONS.labels(state="idle").set(len(self._idle))
+        DB_POOL_CONNECTIONS.labels(state="in_use").set(self._in_use)
+
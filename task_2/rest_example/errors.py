@@ -35,6 +35,36 @@ class CartValidationException(HTTPException):
         super().__init__(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=detail)
 
 
+# Исключение для некорректного курсора пагинации
+class InvalidCursorException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=detail)
+
+
+# Исключение для некорректного тела пакетного запроса
+class BulkPayloadException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=detail)
+
+
+# Исключение при исчерпании пула соединений с базой данных
+class DatabaseUnavailableException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="База данных перегружена, повторите запрос позже.",
+        )
+
+
+# Исключение при достижении лимита комнат чата
+class ChatRoomsLimitException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Достигнут лимит комнат чата, повторите запрос позже.",
+        )
+
+
 # Обработчик исключений HTTPException
 async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
@@ -1,4 +1,5 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 import logging
 import os
 import random
@@ -8,19 +9,22 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
-from prometheus_fastapi_instrumentator import Instrumentator
 import uvicorn
 from fastapi import FastAPI, HTTPException, Response
 from opentelemetry.propagate import inject
-from .utils import PrometheusMiddleware, metrics, setting_otlp
+from .utils import setup_instrumentation
 from .routers import cart, item, chat, client
 from .errors import http_exception_handler, validation_exception_handler
 from opentelemetry.propagate import inject
-from .db.db_engine import init_db 
+from .db.db_engine import init_db, pool, settings as db_settings
+from .db.maintenance import run_maintenance
+from .chat_hub import hub
+from .settings import InstrumentationSettings
+from .multiprocess import multiproc_dir
+from prometheus_client.multiprocess import mark_process_dead
 
 APP_NAME = "fastapi_app"
 EXPOSE_PORT = 8000
-OTLP_GRPC_ENDPOINT = "http://tempo:4317"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -28,7 +32,24 @@ async def lifespan(app: FastAPI):
     inject(headers)
     logging.critical(headers)
     await init_db()
+    await pool.open()
+    await hub.start()
+    maintenance = None
+    if db_settings.maintenance_interval > 0:
+        maintenance = asyncio.create_task(
+            run_maintenance(pool, db_settings.maintenance_interval)
+        )
     yield
+    if maintenance is not None:
+        maintenance.cancel()
+        with suppress(asyncio.CancelledError):
+            await maintenance
+    await hub.close()
+    await pool.close()
+    path = multiproc_dir()
+    if path is not None:
+        # live-gauge этого воркера больше не учитываются в /metrics
+        mark_process_dead(os.getpid(), path)
 
 app = FastAPI(
     debug=False,
@@ -82,12 +103,8 @@ app.include_router(router=chat.router)
 app.include_router(router=item.router)
 app.include_router(router=cart.router)
 
-# Setting metrics middleware
-app.add_middleware(PrometheusMiddleware, app_name=APP_NAME)
-Instrumentator().instrument(app).expose(app)
-
-# Setting OpenTelemetry exporter
-setting_otlp(app, APP_NAME, OTLP_GRPC_ENDPOINT)
+# Метрики Prometheus и трассировка OpenTelemetry одной middleware
+setup_instrumentation(app, APP_NAME, InstrumentationSettings.from_env())
 
 
 class EndpointFilter(logging.Filter):
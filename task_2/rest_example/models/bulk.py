@@ -0,0 +1,25 @@
+from typing import Any, List, Optional
+from pydantic import BaseModel, Field
+from .cart import CartResponse
+
+
+class BulkRowResult(BaseModel):
+    """Результат обработки одной строки пакетного запроса."""
+
+    index: int = Field(..., description="Номер строки во входных данных")
+    status: int = Field(..., description="HTTP-статус обработки строки")
+    id: Optional[int] = Field(None, description="Идентификатор созданного/добавленного товара")
+    detail: Optional[Any] = Field(None, description="Описание ошибки")
+
+
+class BulkItemCreateResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkRowResult]
+
+
+class BulkCartAddResponse(BaseModel):
+    added: int
+    failed: int
+    results: List[BulkRowResult]
+    cart: CartResponse
@@ -42,5 +42,15 @@ class CartCreateRequest(BaseModel):
     pass
 
 
+class CartItemAddRequest(BaseModel):
+    """Строка пакетного добавления товаров в корзину."""
+
+    item_id: int = Field(..., description="Идентификатор товара")
+    quantity: int = Field(1, gt=0, description="Количество добавляемого товара")
+
+
 class CartResponse(CartBase):
     id: int = Field(..., description="Идентификатор корзины")
+    version: int = Field(
+        default=1, exclude=True, description="Версия строки для ETag (не сериализуется)"
+    )
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
 
 class CreateChatResponse(BaseModel):
@@ -11,5 +11,10 @@ class PublishMessageRequest(BaseModel):
     message: str
 
 
+class PublishBatchRequest(BaseModel):
+    messages: List[str] = Field(..., min_length=1, max_length=1000)
+
+
 class ChatListResponse(BaseModel):
     chat_ids: List[UUID]
+    next_after: Optional[UUID] = Field(None, description="Курсор следующей страницы")
@@ -27,3 +27,6 @@ class ItemResponse(ItemBase):
     """Ответ с информацией о товаре."""
 
     id: int = Field(..., description="Идентификатор товара")
+    version: int = Field(
+        default=1, exclude=True, description="Версия строки для ETag (не сериализуется)"
+    )
@@ -0,0 +1,28 @@
+import base64
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
+
+
+class PageCursor(BaseModel):
+    """Позиция последней записи страницы для keyset-пагинации."""
+
+    key: Literal["id", "price"] = Field(..., description="Ключ сортировки страницы")
+    id: int = Field(..., description="Идентификатор последней записи")
+    price: Optional[float] = Field(None, description="Цена последней записи")
+
+    def encode(self) -> str:
+        """Кодирует курсор в непрозрачную строку для клиента."""
+        raw = self.model_dump_json(exclude_none=True).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "PageCursor":
+        """Разбирает строку курсора; при ошибке выбрасывает ValueError."""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            cursor = cls.model_validate_json(raw)
+        except (ValueError, ValidationError) as exc:
+            raise ValueError("Некорректный курсор пагинации.") from exc
+        if cursor.key == "price" and cursor.price is None:
+            raise ValueError("Некорректный курсор пагинации.")
+        return cursor
@@ -0,0 +1,73 @@
+"""
+Режим multiprocess prometheus_client для нескольких воркеров uvicorn.
+
+Каждый воркер пишет значения метрик в свои файлы в PROMETHEUS_MULTIPROC_DIR,
+а /metrics собирает их через MultiProcessCollector. Модуль не объявляет
+метрик, поэтому его можно импортировать в родительском процессе до запуска
+воркеров.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+# Файлы значений prometheus_client: counter_<pid>.db, gauge_livesum_<pid>.db, ...
+METRIC_FILE = re.compile(r"^(counter|histogram|summary|gauge_[a-z]+)_(\d+)\.db$")
+LIVE_GAUGE_FILE = re.compile(r"^gauge_live[a-z]+_(\d+)\.db$")
+
+
+def multiproc_dir() -> Optional[str]:
+    """Каталог метрик или None, если режим multiprocess не включен."""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+
+
+def prepare_multiproc_dir(path: str) -> int:
+    """
+    Создает каталог и удаляет файлы метрик прошлых запусков. Вызывается
+    один раз до запуска воркеров; посторонние файлы в каталоге не трогает.
+    """
+    os.makedirs(path, exist_ok=True)
+    removed = 0
+    for name in os.listdir(path):
+        if METRIC_FILE.match(name):
+            os.remove(os.path.join(path, name))
+            removed += 1
+    return removed
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mark_dead_workers(path: str) -> List[int]:
+    """
+    Убирает live-gauge завершившихся воркеров, в том числе упавших без
+    корректной остановки. Счетчики и гистограммы мертвых воркеров остаются,
+    чтобы суммарные значения не уменьшались.
+    """
+    dead = set()
+    for name in os.listdir(path):
+        match = LIVE_GAUGE_FILE.match(name)
+        if match and not is_alive(int(match.group(1))):
+            dead.add(int(match.group(1)))
+    for pid in dead:
+        mark_process_dead(pid, path)
+    return sorted(dead)
+
+
+@lru_cache(maxsize=None)
+def multiprocess_registry(path: str) -> CollectorRegistry:
+    """Реестр, который при каждом сборе читает файлы всех воркеров."""
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=path)
+    return registry
@@ -0,0 +1,337 @@
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import aiosqlite
+from aiosqlite import Connection
+
+from .settings import ChatSettings
+from .utils import CHAT_DELIVERY_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Получатель сообщений комнаты в этом процессе: (комната, seq, текст)
+MessageHandler = Callable[[UUID, int, str], Awaitable[None]]
+
+
+class PubSubBackend(ABC):
+    """
+    Реестр комнат чата и доставка сообщений между процессами.
+
+    Backend доставляет каждое опубликованное сообщение обработчику,
+    переданному в start, во всех процессах, включая процесс публикации.
+    Сообщению присваивается seq, возрастающий в порядке доставки.
+
+    Для каждой комнаты реестр хранит время последней активности: комнаты,
+    которые никто не отметил через touch_rooms дольше ttl, удаляет
+    evict_idle_rooms.
+    """
+
+    def __init__(self) -> None:
+        self.handler: Optional[MessageHandler] = None
+
+    async def start(self, handler: MessageHandler) -> None:
+        self.handler = handler
+
+    async def close(self) -> None:
+        self.handler = None
+
+    @abstractmethod
+    async def create_room(self, room_id: UUID, max_rooms: int = 0) -> bool:
+        """Регистрирует комнату; False, если комнат уже max_rooms (0 - без ограничения)."""
+
+    @abstractmethod
+    async def room_exists(self, room_id: UUID) -> bool: ...
+
+    @abstractmethod
+    async def count_rooms(self) -> int: ...
+
+    @abstractmethod
+    async def list_rooms(self, after: Optional[UUID] = None, limit: Optional[int] = None) -> List[UUID]:
+        """Комнаты по возрастанию id, начиная после after."""
+
+    @abstractmethod
+    async def touch_rooms(self, room_ids: Iterable[UUID]) -> None: ...
+
+    @abstractmethod
+    async def evict_idle_rooms(self, ttl: float) -> List[UUID]:
+        """Удаляет комнаты без активности дольше ttl секунд и возвращает их id."""
+
+    async def publish(self, room_id: UUID, message: str) -> None:
+        await self.publish_many(room_id, [message])
+
+    @abstractmethod
+    async def publish_many(self, room_id: UUID, messages: List[str]) -> None:
+        """Публикует сообщения подряд, с последовательными seq."""
+
+
+class InMemoryBackend(PubSubBackend):
+    """Комнаты и сообщения в пределах одного процесса."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Комната -> время последней активности по time.monotonic
+        self._rooms: Dict[UUID, float] = {}
+        self._seq = itertools.count(1)
+
+    async def create_room(self, room_id: UUID, max_rooms: int = 0) -> bool:
+        if room_id not in self._rooms and max_rooms and len(self._rooms) >= max_rooms:
+            return False
+        self._rooms[room_id] = time.monotonic()
+        return True
+
+    async def room_exists(self, room_id: UUID) -> bool:
+        return room_id in self._rooms
+
+    async def count_rooms(self) -> int:
+        return len(self._rooms)
+
+    async def list_rooms(self, after: Optional[UUID] = None, limit: Optional[int] = None) -> List[UUID]:
+        rooms = sorted(room_id for room_id in self._rooms if after is None or room_id > after)
+        return rooms if limit is None else rooms[:limit]
+
+    async def touch_rooms(self, room_ids: Iterable[UUID]) -> None:
+        now = time.monotonic()
+        for room_id in room_ids:
+            if room_id in self._rooms:
+                self._rooms[room_id] = now
+
+    async def evict_idle_rooms(self, ttl: float) -> List[UUID]:
+        deadline = time.monotonic() - ttl
+        evicted = [room_id for room_id, last_active in self._rooms.items() if last_active < deadline]
+        for room_id in evicted:
+            del self._rooms[room_id]
+        return evicted
+
+    async def publish_many(self, room_id: UUID, messages: List[str]) -> None:
+        if self.handler is not None:
+            for message in messages:
+                await self.handler(room_id, next(self._seq), message)
+
+
+class SQLiteBackend(PubSubBackend):
+    """
+    Шина сообщений в общем файле SQLite для нескольких воркеров на одной машине.
+
+    Комнаты хранятся в таблице chat_rooms, сообщения дописываются в
+    chat_messages. Каждый процесс опрашивает журнал начиная с последнего
+    прочитанного seq; запись в SQLite сериализована, поэтому seq фиксируются
+    по возрастанию и все процессы видят сообщения в одном порядке. Старые
+    сообщения удаляются, в журнале остается не больше retention записей.
+
+    Одновременные publish объединяются в одну транзакцию (group commit):
+    пока идет запись, новые сообщения копятся и пишутся следующей пачкой.
+
+    Время активности комнат (last_active) хранится в chat_rooms по часам
+    time.time, общим для всех воркеров; вместе с комнатой удаляются и ее
+    сообщения в журнале.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.01, retention: int = 10_000) -> None:
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._conn: Optional[Connection] = None
+        # Опрос читает журнал через свое соединение: на общем с записью он
+        # видел бы строки незафиксированной пачки, которая еще может откатиться
+        self._reader: Optional[Connection] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._last_seq = 0
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # Запись пачки и очистка журнала идут через одно соединение
+        self._write_lock = asyncio.Lock()
+
+    async def start(self, handler: MessageHandler) -> None:
+        await super().start(handler)
+        # Транзакции открываются явно: запись всегда через BEGIN IMMEDIATE,
+        # чтобы ожидание блокировки шло через busy_timeout, а не падало
+        # при повышении блокировки чтения до записи
+        conn = aiosqlite.connect(self.path, isolation_level=None)
+        conn.daemon = True
+        self._conn = await conn
+        await self._conn.execute("PRAGMA busy_timeout = 5000")
+        await self._conn.execute("PRAGMA journal_mode = WAL")
+        await self._conn.execute("PRAGMA synchronous = NORMAL")
+        await self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_rooms (
+                id TEXT PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_active REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+        """)
+        async with self._conn.execute("SELECT name FROM pragma_table_info('chat_rooms')") as cursor:
+            columns = {row[0] for row in await cursor.fetchall()}
+        if "last_active" not in columns:
+            # Файл шины от прежней версии: комнаты считаются активными сейчас
+            await self._conn.execute("ALTER TABLE chat_rooms ADD COLUMN last_active REAL NOT NULL DEFAULT 0")
+            await self._conn.execute("UPDATE chat_rooms SET last_active = ?", (time.time(),))
+        reader = aiosqlite.connect(self.path, isolation_level=None)
+        reader.daemon = True
+        self._reader = await reader
+        await self._reader.execute("PRAGMA busy_timeout = 5000")
+        # Новый процесс начинает с самого старого сообщения в журнале, чтобы
+        # заполнить историю комнат
+        async with self._reader.execute("SELECT COALESCE(MIN(seq) - 1, 0) FROM chat_messages") as cursor:
+            (self._last_seq,) = await cursor.fetchone()
+        self._poller = asyncio.create_task(self._poll())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        if self._reader is not None:
+            await self._reader.close()
+            self._reader = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        await super().close()
+
+    async def create_room(self, room_id: UUID, max_rooms: int = 0) -> bool:
+        # Проверка лимита и вставка в одной транзакции: воркеры не превысят его вместе
+        async with self._transaction():
+            if max_rooms:
+                async with self._conn.execute("SELECT COUNT(*) FROM chat_rooms") as cursor:
+                    (count,) = await cursor.fetchone()
+                if count >= max_rooms and not await self.room_exists(room_id):
+                    return False
+            await self._conn.execute(
+                "INSERT INTO chat_rooms (id, last_active) VALUES (?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET last_active = excluded.last_active",
+                (str(room_id), time.time()),
+            )
+        return True
+
+    async def room_exists(self, room_id: UUID) -> bool:
+        async with self._conn.execute("SELECT 1 FROM chat_rooms WHERE id = ?", (str(room_id),)) as cursor:
+            return await cursor.fetchone() is not None
+
+    async def count_rooms(self) -> int:
+        async with self._conn.execute("SELECT COUNT(*) FROM chat_rooms") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def list_rooms(self, after: Optional[UUID] = None, limit: Optional[int] = None) -> List[UUID]:
+        # Канонический вид UUID в нижнем регистре сортируется как сам UUID
+        async with self._conn.execute(
+            "SELECT id FROM chat_rooms WHERE id > ? ORDER BY id LIMIT ?",
+            ("" if after is None else str(after), -1 if limit is None else limit),
+        ) as cursor:
+            return [UUID(row[0]) for row in await cursor.fetchall()]
+
+    async def touch_rooms(self, room_ids: Iterable[UUID]) -> None:
+        now = time.time()
+        parameters = [(now, str(room_id)) for room_id in room_ids]
+        if parameters:
+            await self._write("UPDATE chat_rooms SET last_active = ? WHERE id = ?", parameters)
+
+    async def evict_idle_rooms(self, ttl: float) -> List[UUID]:
+        deadline = time.time() - ttl
+        async with self._transaction():
+            async with self._conn.execute("SELECT id FROM chat_rooms WHERE last_active < ?", (deadline,)) as cursor:
+                evicted = [row[0] for row in await cursor.fetchall()]
+            parameters = [(room_id,) for room_id in evicted]
+            await self._conn.executemany("DELETE FROM chat_rooms WHERE id = ?", parameters)
+            await self._conn.executemany("DELETE FROM chat_messages WHERE room_id = ?", parameters)
+        return [UUID(room_id) for room_id in evicted]
+
+    async def publish_many(self, room_id: UUID, messages: List[str]) -> None:
+        # Пачка целиком попадает в одну транзакцию и получает seq подряд
+        written = asyncio.get_running_loop().create_future()
+        self._pending.extend((str(room_id), message, written) for message in messages)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        await written
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await self._write(
+                    "INSERT INTO chat_messages (room_id, message) VALUES (?, ?)",
+                    [(room_id, message) for room_id, message, _ in batch],
+                )
+            except Exception as e:
+                for _, _, written in batch:
+                    if not written.done():
+                        written.set_exception(e)
+            else:
+                for _, _, written in batch:
+                    if not written.done():
+                        written.set_result(None)
+
+    async def _poll(self) -> None:
+        polls = 0
+        while True:
+            rows = []
+            try:
+                async with self._reader.execute(
+                    "SELECT seq, room_id, message FROM chat_messages WHERE seq > ? ORDER BY seq LIMIT 1000",
+                    (self._last_seq,),
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                for seq, room_id, message in rows:
+                    self._last_seq = seq
+                    await self._deliver(UUID(room_id), seq, message)
+                polls += 1
+                if polls % 1000 == 0:
+                    await self._prune()
+            except sqlite3.Error:
+                logger.exception("Ошибка чтения шины сообщений чата")
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _deliver(self, room_id: UUID, seq: int, message: str) -> None:
+        # Ошибка доставки одного сообщения не должна останавливать опрос шины:
+        # иначе процесс молча перестанет получать сообщения других воркеров
+        try:
+            await self.handler(room_id, seq, message)
+        except Exception:
+            CHAT_DELIVERY_ERRORS.inc()
+            logger.exception("Ошибка доставки сообщения %d комнаты %s", seq, room_id)
+
+    async def _prune(self) -> None:
+        await self._write(
+            "DELETE FROM chat_messages WHERE seq <= (SELECT MAX(seq) FROM chat_messages) - ?",
+            [(self.retention,)],
+        )
+
+    async def _write(self, sql: str, parameters: List[tuple]) -> None:
+        async with self._transaction():
+            await self._conn.executemany(sql, parameters)
+
+    @asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[None]:
+        async with self._write_lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                await self._conn.execute("COMMIT")
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+
+
+def create_backend(settings: ChatSettings) -> PubSubBackend:
+    if settings.backend == "sqlite":
+        return SQLiteBackend(settings.bus_path, settings.bus_poll_interval, settings.bus_retention)
+    return InMemoryBackend()
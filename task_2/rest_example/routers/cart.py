@@ -1,11 +1,30 @@
-from fastapi import APIRouter, Depends, Response, Query
+from fastapi import APIRouter, Depends, Request, Response, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from aiosqlite import Connection
 from http import HTTPStatus
-from ..models.cart import CartResponse
+from ..models.bulk import BulkCartAddResponse
+from ..models.cart import CartItemAddRequest, CartResponse
 from ..db.db_engine import get_db_connection
-from ..db.crud import create_cart, get_cart, get_cart_list, add_item_to_cart, get_item
-from ..errors import CartNotFoundException, ItemNotFoundException
+from ..db.crud import (
+    add_item_to_cart,
+    add_items_to_cart_bulk,
+    create_cart,
+    get_cart,
+    get_cart_list,
+    get_cart_list_versions,
+    get_cart_version,
+)
+from ..errors import CartNotFoundException, InvalidCursorException
+from .utils import (
+    collect_bulk_rows,
+    decode_cursor,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    set_next_link,
+)
 
 router = APIRouter(prefix="/cart")
 
@@ -21,16 +40,31 @@ async def create_new_cart(
 
 
 @router.get("/{cart_id}", response_model=CartResponse, status_code=HTTPStatus.OK)
-async def get_cart_by_id(cart_id: int, conn: Connection = Depends(get_db_connection)):
-    """Получение корзины по id."""
+async def get_cart_by_id(
+    cart_id: int,
+    request: Request,
+    response: Response,
+    conn: Connection = Depends(get_db_connection),
+):
+    """Получение корзины по id (поддерживает If-None-Match)."""
+    version = await get_cart_version(conn, cart_id)
+    if version is None:
+        raise CartNotFoundException(cart_id)
+    etag = make_etag("cart", cart_id, *version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
     cart = await get_cart(conn, cart_id)
     if not cart:
         raise CartNotFoundException(cart_id)
+    response.headers["ETag"] = etag
     return cart
 
 
 @router.get("/", response_model=List[CartResponse], status_code=HTTPStatus.OK)
 async def get_carts(
+    request: Request,
+    response: Response,
     offset: int = Query(0, ge=0, description="Смещение по списку"),
     limit: int = Query(10, gt=0, description="Ограничение на количество"),
     min_price: Optional[float] = Query(
@@ -45,12 +79,32 @@ async def get_carts(
     max_quantity: Optional[int] = Query(
         None, ge=0, description="Максимальное общее количество товаров"
     ),
+    after: Optional[str] = Query(None, description="Курсор следующей страницы"),
     conn: Connection = Depends(get_db_connection),
 ):
     """Получение списка корзин с фильтрацией по цене и количеству товаров."""
-    carts = await get_cart_list(
-        conn, offset, limit, min_price, max_price, min_quantity, max_quantity
-    )
+    try:
+        page_args = (
+            offset,
+            limit,
+            min_price,
+            max_price,
+            min_quantity,
+            max_quantity,
+            decode_cursor(after),
+        )
+        # ETag считается по версиям корзин и их товаров: при 304 модели
+        # корзин и вложенных товаров не строятся
+        versions, cursor = await get_cart_list_versions(conn, *page_args)
+    except ValueError as exc:
+        raise InvalidCursorException(str(exc)) from exc
+    etag = make_etag("carts", versions, cursor.encode() if cursor else None)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    carts, cursor = await get_cart_list(conn, *page_args)
+    response.headers["ETag"] = etag
+    set_next_link(request, response, cursor)
     return carts
 
 
@@ -66,16 +120,37 @@ async def add_item_to_cart_endpoint(
     conn: Connection = Depends(get_db_connection),
 ):
     """Добавление товара с item_id в корзину с cart_id. Увеличивает количество товара, если он уже есть."""
-    # Получение корзины по id
-    cart = await get_cart(conn, cart_id)
-    if not cart:
-        raise CartNotFoundException(cart_id)
+    return await add_item_to_cart(conn, cart_id, item_id, quantity)
 
-    # Получение товара по id
-    item = await get_item(conn, item_id)
-    if not item or item.deleted:
-        raise ItemNotFoundException(item_id)
 
-    # Добавление товара в корзину
-    updated_cart = await add_item_to_cart(conn, cart_id, item_id, quantity)
-    return updated_cart
+@router.post(
+    "/{cart_id}/add-bulk", response_model=BulkCartAddResponse, status_code=HTTPStatus.OK
+)
+async def add_items_to_cart_in_bulk(
+    cart_id: int, request: Request, conn: Connection = Depends(get_db_connection)
+):
+    """
+    Пакетное добавление товаров в корзину. Тело - JSON-массив
+    CartItemAddRequest или поток application/x-ndjson. Все корректные строки
+    добавляются одной транзакцией, для каждой строки возвращается статус.
+    """
+    rows, positions, results = await collect_bulk_rows(
+        request, CartItemAddRequest, lambda row: (row.item_id, row.quantity), HTTPStatus.OK
+    )
+    for position, (item_id, _) in zip(positions, rows):
+        results[position]["id"] = item_id
+
+    cart, errors = await add_items_to_cart_bulk(conn, cart_id, rows)
+    for position, error in zip(positions, errors):
+        if error is not None:
+            results[position].update(status=HTTPStatus.NOT_FOUND, detail=error)
+
+    failed = sum(result["status"] != HTTPStatus.OK for result in results)
+    return JSONResponse(
+        {
+            "added": len(results) - failed,
+            "failed": failed,
+            "results": results,
+            "cart": jsonable_encoder(cart),
+        }
+    )
@@ -1,78 +1,86 @@
+from typing import Optional
 from uuid import uuid4, UUID
-from typing import Dict, List
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status
+from fastapi import APIRouter, Query, Request, Response, WebSocket, WebSocketDisconnect, HTTPException, status
 
-from ..models.chat import ChatListResponse, CreateChatResponse, PublishMessageRequest
+from ..chat_hub import hub
+from ..errors import ChatRoomsLimitException
+from ..models.chat import ChatListResponse, CreateChatResponse, PublishBatchRequest, PublishMessageRequest
+from .utils import set_next_link
 
 router = APIRouter(prefix="/chat")
 
 
-class Broadcaster:
-    def __init__(self):
-        self.subscribers: List[WebSocket] = []
-
-    async def subscribe(self, ws: WebSocket):
-        await ws.accept()
-        self.subscribers.append(ws)
-
-    async def unsubscribe(self, ws: WebSocket):
-        if ws in self.subscribers:
-            self.subscribers.remove(ws)
-
-    async def publish(self, message: str):
-        disconnected = []
-        for ws in self.subscribers:
-            try:
-                await ws.send_text(message)
-            except Exception:
-                disconnected.append(ws)
-        for ws in disconnected:
-            await self.unsubscribe(ws)
-
-
-# In-memory хранилище для чатов
-chat_rooms: Dict[UUID, Broadcaster] = {}
-
-
 @router.post(
     "/", response_model=CreateChatResponse, status_code=status.HTTP_201_CREATED
 )
 async def create_chat():
-    chat_id = uuid4()
-    chat_rooms[chat_id] = Broadcaster()
+    chat_id = await hub.create_room()
+    if chat_id is None:
+        raise ChatRoomsLimitException()
     return CreateChatResponse(chat_id=chat_id)
 
 
 @router.get("/", response_model=ChatListResponse)
-async def list_chats():
-    return ChatListResponse(chat_ids=list(chat_rooms.keys()))
+async def list_chats(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, gt=0, le=1000, description="Ограничение на количество"),
+    after: Optional[UUID] = Query(None, description="Курсор следующей страницы"),
+):
+    """Список комнат по возрастанию id с курсорной пагинацией."""
+    chat_ids = await hub.list_rooms(after, limit + 1)
+    next_after = None
+    if len(chat_ids) > limit:
+        chat_ids = chat_ids[:limit]
+        next_after = chat_ids[-1]
+        set_next_link(request, response, str(next_after))
+    return ChatListResponse(chat_ids=chat_ids, next_after=next_after)
 
 
 @router.post("/publish/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def publish_message(chat_id: UUID, payload: PublishMessageRequest):
-    broadcaster = chat_rooms.get(chat_id)
-    if not broadcaster:
+    if not await hub.has_room(chat_id):
         raise HTTPException(status_code=404, detail="Chat ID not found")
-    await broadcaster.publish(payload.message)
+    await hub.publish(chat_id, payload.message)
     return {"detail": "Message published"}
 
 
+@router.post("/publish/{chat_id}/batch", status_code=status.HTTP_204_NO_CONTENT)
+async def publish_batch(chat_id: UUID, payload: PublishBatchRequest):
+    """Публикует несколько сообщений подряд одной записью в шину."""
+    if not await hub.has_room(chat_id):
+        raise HTTPException(status_code=404, detail="Chat ID not found")
+    await hub.publish_many(chat_id, payload.messages)
+
+
 @router.websocket("/subscribe/{chat_id}")
-async def subscribe_chat(websocket: WebSocket, chat_id: UUID):
-    if chat_id not in chat_rooms:
+async def subscribe_chat(
+    websocket: WebSocket,
+    chat_id: UUID,
+    since: Optional[int] = Query(None, ge=0, description="Повторить сообщения с seq больше since"),
+):
+    if not await hub.has_room(chat_id):
         await websocket.close(code=1008)
         return
 
-    broadcaster = chat_rooms[chat_id]
     client_id = uuid4()
-    await broadcaster.subscribe(websocket)
-    await broadcaster.publish(f"Клиент {client_id} подключился к чату {chat_id}")
-
+    subscriber = await hub.subscribe(chat_id, websocket, since)
+    if subscriber is None:
+        # В комнате нет мест, соединение уже закрыто
+        return
+    disconnected = False
     try:
+        await hub.publish(chat_id, f"Клиент {client_id} подключился к чату {chat_id}")
         while True:
             data = await websocket.receive_text()
-            await broadcaster.publish(f"Клиент {client_id}: {data}")
-    except WebSocketDisconnect:
-        await broadcaster.unsubscribe(websocket)
-        await broadcaster.publish(f"Клиент {client_id} отключился от чата {chat_id}")
+            await hub.publish(chat_id, f"Клиент {client_id}: {data}")
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: сокет уже закрыт сервером как медленный подписчик
+        disconnected = True
+    finally:
+        # При любой ошибке (например, backend не принял сообщение) подписчик и
+        # его задача отправки не остаются в Broadcaster
+        await hub.unsubscribe(chat_id, subscriber)
+    if disconnected:
+        await hub.publish(chat_id, f"Клиент {client_id} отключился от чата {chat_id}")
@@ -1,14 +1,14 @@
 from uuid import UUID
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
-from .chat import chat_rooms
+from ..chat_hub import hub
 
 router = APIRouter(prefix="/client")
 
 
 @router.get("/{chat_id}", response_class=HTMLResponse)
 async def chat_page(chat_id: UUID):
-    if chat_id not in chat_rooms:
+    if not await hub.has_room(chat_id):
         return HTMLResponse(content="Chat not found", status_code=404)
 
     html_content = f"""
@@ -25,15 +25,47 @@ async def chat_page(chat_id: UUID):
             <button onclick="sendMessage()">Send</button>
         </div>
         <script>
-            var ws = new WebSocket(`ws://localhost:8000/chat/subscribe/{chat_id}`);
-            
-            ws.onmessage = function(event) {{
-                var messages = document.getElementById('messages');
-                var message = document.createElement('div');
-                message.textContent = event.data;
-                messages.appendChild(message);
-                messages.scrollTop = messages.scrollHeight;  // Scroll to bottom
-            }};
+            var lastSeq = null;
+            var retryDelay = 1000;
+            var ws = connect();
+
+            function connect() {{
+                // При переподключении сервер повторит пропущенные сообщения
+                var since = lastSeq === null ? '' : `?since=${{lastSeq}}`;
+                var socket = new WebSocket(`ws://localhost:8000/chat/subscribe/{chat_id}${{since}}`);
+                socket.onmessage = function(event) {{
+                    var data = JSON.parse(event.data);
+                    // Несколько сообщений, объединенных сервером, приходят массивом
+                    var batch = Array.isArray(data) ? data : [data];
+                    var messages = document.getElementById('messages');
+                    batch.forEach(function(item) {{
+                        lastSeq = item.seq;
+                        var message = document.createElement('div');
+                        message.textContent = item.text;
+                        messages.appendChild(message);
+                    }});
+                    messages.scrollTop = messages.scrollHeight;  // Scroll to bottom
+                }};
+                socket.onopen = function() {{
+                    retryDelay = 1000;
+                }};
+                socket.onclose = function(event) {{
+                    // 1000 - штатное закрытие, 1008 - комнаты нет (удалена за простой):
+                    // переподключение не поможет
+                    if (event.code === 1000 || event.code === 1008) {{
+                        var notice = document.createElement('div');
+                        notice.textContent = 'Disconnected from chat';
+                        document.getElementById('messages').appendChild(notice);
+                        return;
+                    }}
+                    // Остальные коды: повтор с растущей задержкой (до 30 с) и разбросом,
+                    // чтобы клиенты не переподключались одновременно
+                    var delay = retryDelay * (0.5 + Math.random() / 2);
+                    retryDelay = Math.min(retryDelay * 2, 30000);
+                    setTimeout(function() {{ ws = connect(); }}, delay);
+                }};
+                return socket;
+            }}
 
             function sendMessage() {{
                 var input = document.getElementById("messageText");
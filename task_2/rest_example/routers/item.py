@@ -1,11 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends, Response, Query
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from aiosqlite import Connection
 from http import HTTPStatus
+from ..models.bulk import BulkItemCreateResponse
 from ..models.item import ItemResponse, ItemCreateRequest, ItemUpdateRequest
 from ..db.db_engine import get_db_connection
-from ..db.crud import create_item, get_item, get_items_list, update_item, delete_item
-from ..errors import ItemNotFoundException, ItemNotModifiedException
+from ..db.crud import (
+    create_item,
+    create_items_bulk,
+    delete_item,
+    get_item,
+    get_items_list,
+    get_items_list_versions,
+    update_item,
+)
+from ..errors import InvalidCursorException, ItemNotFoundException, ItemNotModifiedException
+from .utils import (
+    collect_bulk_rows,
+    decode_cursor,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    set_next_link,
+)
 
 router = APIRouter(prefix="/item")
 
@@ -22,28 +40,73 @@ async def create_new_item(
     return created_item
 
 
+@router.post("/bulk", response_model=BulkItemCreateResponse, status_code=HTTPStatus.OK)
+async def create_items_in_bulk(
+    request: Request, conn: Connection = Depends(get_db_connection)
+):
+    """
+    Пакетное создание товаров. Тело - JSON-массив ItemCreateRequest или
+    поток application/x-ndjson. Корректные строки записываются одной
+    транзакцией, для каждой строки возвращается статус.
+    """
+    rows, positions, results = await collect_bulk_rows(
+        request, ItemCreateRequest, lambda item: (item.name, item.price), HTTPStatus.CREATED
+    )
+    ids = await create_items_bulk(conn, rows)
+    for position, item_id in zip(positions, ids):
+        results[position]["id"] = item_id
+
+    # Ответ собирается из словарей: на миллионах строк повторная
+    # валидация моделью ответа заняла бы больше времени, чем сама вставка
+    return JSONResponse(
+        {"created": len(ids), "failed": len(results) - len(ids), "results": results}
+    )
+
+
 @router.get("/{item_id}", response_model=ItemResponse, status_code=HTTPStatus.OK)
-async def get_item_by_id(item_id: int, conn: Connection = Depends(get_db_connection)):
-    """Получение товара по id."""
+async def get_item_by_id(
+    item_id: int,
+    request: Request,
+    response: Response,
+    conn: Connection = Depends(get_db_connection),
+):
+    """Получение товара по id (поддерживает If-None-Match)."""
     item = await get_item(conn, item_id)
     if not item or item.deleted:
         raise ItemNotFoundException(item_id)
-    return {"id": item.id, **item.dict()}  # Добавлено поле `id` в ответ
+    etag = make_etag("item", item.id, item.version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    response.headers["ETag"] = etag
+    return {"id": item.id, **item.model_dump()}  # Добавлено поле `id` в ответ
 
 
 @router.get("/", response_model=List[ItemResponse], status_code=HTTPStatus.OK)
 async def get_items(
+    request: Request,
+    response: Response,
     offset: int = Query(0, ge=0, description="Смещение по списку"),
     limit: int = Query(10, gt=0, description="Ограничение на количество"),
     min_price: Optional[float] = Query(None, ge=0.0, description="Минимальная цена"),
     max_price: Optional[float] = Query(None, ge=0.0, description="Максимальная цена"),
     show_deleted: bool = Query(False, description="Показывать ли удаленные товары"),
+    after: Optional[str] = Query(None, description="Курсор следующей страницы"),
     conn: Connection = Depends(get_db_connection),
 ):
-    """Получение списка товаров с фильтрацией."""
-    items = await get_items_list(
-        conn, offset, limit, min_price, max_price, show_deleted
-    )
+    """Получение списка товаров с фильтрацией и курсорной пагинацией."""
+    try:
+        page_args = (offset, limit, min_price, max_price, show_deleted, decode_cursor(after))
+        # ETag считается по версиям строк: при 304 модели страницы не строятся
+        versions, cursor = await get_items_list_versions(conn, *page_args)
+    except ValueError as exc:
+        raise InvalidCursorException(str(exc)) from exc
+    etag = make_etag("items", versions, cursor.encode() if cursor else None)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    items, cursor = await get_items_list(conn, *page_args)
+    response.headers["ETag"] = etag
+    set_next_link(request, response, cursor)
     return items
 
 
@@ -54,11 +117,14 @@ async def update_item_by_id(
     conn: Connection = Depends(get_db_connection),
 ):
     """Замена товара по id (создание запрещено, только замена существующего)."""
-    item = await get_item(conn, item_id)
+    item = await get_item(conn, item_id, use_cache=False)
     if not item:
         raise ItemNotFoundException(item_id)
 
     updated_item = await update_item(conn, item_id, item_update)
+    if updated_item is None:
+        # Удаленный товар не изменяется
+        raise ItemNotModifiedException(item_id)
     return updated_item
 
 
@@ -69,7 +135,7 @@ async def partial_update_item_by_id(
     conn: Connection = Depends(get_db_connection),
 ):
     """Частичное обновление товара по id (нельзя изменять поле deleted)."""
-    item = await get_item(conn, item_id)
+    item = await get_item(conn, item_id, use_cache=False)
     if not item:
         raise ItemNotModifiedException(item_id)
 
@@ -94,6 +160,9 @@ async def partial_update_item_by_id(
 
     # Выполняем обновление данных
     updated_item = await update_item(conn, item_id, item_update)
+    if updated_item is None:
+        # Товар удалили между проверкой и обновлением
+        raise ItemNotModifiedException(item_id)
     return updated_item
 
 
@@ -102,7 +171,7 @@ async def delete_item_by_id(
     item_id: int, conn: Connection = Depends(get_db_connection)
 ):
     """Удаление товара по id (товар помечается как удаленный)."""
-    item = await get_item(conn, item_id)
+    item = await get_item(conn, item_id, use_cache=False)
     if not item:
         raise ItemNotFoundException(item_id)
 
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type, Union
+from fastapi import Request, Response
+from pydantic import BaseModel, ValidationError
+from ..errors import BulkPayloadException
+from ..models.pagination import PageCursor
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def decode_cursor(after: Optional[str]) -> Optional[PageCursor]:
+    """Разбор параметра after; ValueError при некорректном курсоре."""
+    if after is None:
+        return None
+    return PageCursor.decode(after)
+
+
+def set_next_link(
+    request: Request, response: Response, cursor: Union[PageCursor, str, None]
+) -> None:
+    """Добавляет заголовок Link на следующую страницу (RFC 8288)."""
+    if cursor is None:
+        return
+    token = cursor if isinstance(cursor, str) else cursor.encode()
+    next_url = request.url.remove_query_params("offset").include_query_params(
+        after=token
+    )
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+def make_etag(*parts) -> str:
+    """Слабый ETag из версий строк: одинаковые версии дают одинаковый тег."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Проверка If-None-Match со слабым сравнением тегов (RFC 9110, 13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified_response(etag: str) -> Response:
+    """Ответ 304 без тела: модель ответа не строится и не сериализуется."""
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+
+
+async def iter_bulk_rows(request: Request) -> AsyncIterator[Tuple[Any, Optional[str]]]:
+    """
+    Строки пакетного запроса в виде пар (значение, ошибка разбора).
+    Тело application/x-ndjson читается потоково по одной строке JSON,
+    иначе ожидается JSON-массив.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError as exc:
+            raise BulkPayloadException("Тело запроса должно быть JSON-массивом.") from exc
+        if not isinstance(rows, list):
+            raise BulkPayloadException("Тело запроса должно быть JSON-массивом.")
+        for row in rows:
+            yield row, None
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> Tuple[Any, Optional[str]]:
+    try:
+        return json.loads(line), None
+    except ValueError:
+        return None, "Строка не является корректным JSON."
+
+
+async def collect_bulk_rows(
+    request: Request,
+    model: Type[BaseModel],
+    to_row: Callable[[Any], tuple],
+    ok_status: HTTPStatus,
+) -> Tuple[List[tuple], List[int], List[Dict[str, Any]]]:
+    """
+    Валидирует строки пакетного запроса моделью model. Возвращает корректные
+    строки (уже преобразованные to_row), позиции их результатов и список
+    результатов по всем строкам; ошибочные строки получают статус 422.
+    """
+    rows: List[tuple] = []
+    positions: List[int] = []
+    results: List[Dict[str, Any]] = []
+    index = 0
+    async for value, error in iter_bulk_rows(request):
+        detail = error
+        if detail is None:
+            try:
+                row = to_row(model.model_validate(value))
+            except ValidationError as exc:
+                detail = exc.errors(include_url=False, include_context=False)
+            else:
+                rows.append(row)
+                positions.append(len(results))
+        status = ok_status if detail is None else HTTPStatus.UNPROCESSABLE_ENTITY
+        results.append({"index": index, "status": status, "id": None, "detail": detail})
+        index += 1
+    return rows, positions, results
@@ -0,0 +1,49 @@
+"""
+Запуск Shop API в нескольких воркерах uvicorn.
+
+Если задан PROMETHEUS_MULTIPROC_DIR, каталог метрик очищается здесь, в
+родительском процессе, до старта воркеров: воркеры сами чистить его не могут,
+так как стерли бы файлы друг друга.
+
+Кэш товаров у каждого воркера свой и не видит изменений других воркеров,
+поэтому при нескольких воркерах он выключается, если ITEM_CACHE_ENABLED
+не задан явно.
+
+Запуск (PYTHONPATH указывает на каталог task_2):
+    python -m rest_example.serve --workers 4
+"""
+
+import argparse
+import logging
+import os
+
+import uvicorn
+
+from .multiprocess import multiproc_dir, prepare_multiproc_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)))
+    args = parser.parse_args()
+
+    path = multiproc_dir()
+    if path is not None:
+        removed = prepare_multiproc_dir(path)
+        logging.info("Удалено файлов метрик прошлого запуска: %d", removed)
+    elif args.workers > 1:
+        logging.warning(
+            "PROMETHEUS_MULTIPROC_DIR не задан: /metrics покажет метрики одного случайного воркера"
+        )
+
+    if args.workers > 1:
+        # Воркеры наследуют окружение родителя
+        os.environ.setdefault("ITEM_CACHE_ENABLED", "0")
+
+    uvicorn.run(f"{__package__}.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+from typing import ClassVar, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class EnvSettings(BaseModel):
+    """Базовый класс настроек: значения по умолчанию переопределяются окружением."""
+
+    env_prefix: ClassVar[str] = ""
+
+    @classmethod
+    def from_env(cls, prefix: Optional[str] = None):
+        """Читает переменные окружения вида PREFIX + ИМЯ_ПОЛЯ."""
+        prefix = cls.env_prefix if prefix is None else prefix
+        values = {
+            name: os.environ[prefix + name.upper()]
+            for name in cls.model_fields
+            if prefix + name.upper() in os.environ
+        }
+        return cls(**values)
+
+
+class DatabaseSettings(EnvSettings):
+    """Настройки SQLite и пула соединений, читаются из переменных окружения DB_*."""
+
+    env_prefix: ClassVar[str] = "DB_"
+
+    path: str = Field("./database.db", description="Путь к файлу базы данных")
+    pool_max_size: int = Field(10, ge=1, description="Максимум соединений в пуле")
+    pool_min_size: int = Field(1, ge=0, description="Соединений, открываемых при старте")
+    pool_acquire_timeout: float = Field(5.0, gt=0, description="Ожидание соединения, с")
+    pool_health_check_interval: float = Field(
+        30.0, ge=0, description="Простой соединения, после которого оно проверяется, с"
+    )
+
+    journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"] = "WAL"
+    synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    mmap_size: int = Field(256 * 1024 * 1024, ge=0, description="Размер mmap, байт")
+    cache_size: int = Field(
+        -64000, description="Размер кэша страниц: > 0 в страницах, < 0 в КиБ"
+    )
+    temp_store: Literal["DEFAULT", "FILE", "MEMORY"] = "MEMORY"
+    busy_timeout_ms: int = Field(5000, ge=0, description="Ожидание блокировки, мс")
+    maintenance_interval: float = Field(
+        300.0, ge=0, description="Период wal_checkpoint и PRAGMA optimize, с (0 - выкл.)"
+    )
+
+
+class CacheSettings(EnvSettings):
+    """Настройки кэша товаров, читаются из переменных окружения ITEM_CACHE_*."""
+
+    env_prefix: ClassVar[str] = "ITEM_CACHE_"
+
+    enabled: bool = True
+    ttl: float = Field(30.0, gt=0, description="Время жизни записи, с")
+    max_entries: int = Field(10_000, ge=1, description="Максимум записей")
+    max_bytes: int = Field(16 * 1024 * 1024, ge=1, description="Оценочный объем, байт")
+
+
+class InstrumentationSettings(EnvSettings):
+    """Настройки метрик и трассировки, читаются из переменных окружения INSTRUMENTATION_*."""
+
+    env_prefix: ClassVar[str] = "INSTRUMENTATION_"
+
+    metrics: bool = Field(True, description="Метрики запросов Prometheus")
+    tracing: bool = Field(True, description="Span OpenTelemetry на каждый запрос")
+    trace_sample_rate: float = Field(
+        1.0, ge=0, le=1, description="Доля трассируемых запросов (без входящего traceparent)"
+    )
+    otlp_endpoint: str = Field("http://tempo:4317", description="OTLP gRPC приемник span")
+    log_correlation: bool = Field(True, description="trace_id и span_id в логах")
+    route_cache_size: int = Field(1024, ge=1, description="Размер кэша шаблонов маршрутов")
+
+
+class ChatSettings(EnvSettings):
+    """Настройки рассылки чата, читаются из переменных окружения CHAT_*."""
+
+    env_prefix: ClassVar[str] = "CHAT_"
+
+    queue_size: int = Field(256, ge=1, description="Очередь исходящих сообщений подписчика")
+    slow_consumer_policy: Literal["drop_oldest", "disconnect"] = Field(
+        "drop_oldest", description="Что делать с подписчиком, чья очередь заполнена"
+    )
+    shards: int = Field(4, ge=1, description="Шардов рассылки на комнату")
+    history_max_messages: int = Field(
+        1000, ge=0, description="Сообщений в истории комнаты для ?since= (0 - без истории)"
+    )
+    history_max_bytes: int = Field(1024 * 1024, ge=0, description="Оценочный объем истории комнаты, байт")
+    backend: Literal["memory", "sqlite"] = Field(
+        "memory", description="memory - один процесс, sqlite - общая шина для нескольких воркеров"
+    )
+    bus_path: str = Field("./chat_bus.db", description="Файл шины сообщений для backend=sqlite")
+    bus_poll_interval: float = Field(0.01, gt=0, description="Период опроса шины, с")
+    bus_retention: int = Field(10_000, ge=1, description="Сообщений, хранимых в шине")
+    coalesce_window_ms: float = Field(
+        0, ge=0, description="Окно объединения сообщений в один кадр подписчику, мс (0 - без объединения)"
+    )
+    room_idle_ttl: float = Field(
+        600, ge=0, description="Через сколько секунд без подписчиков и сообщений комната удаляется (0 - никогда)"
+    )
+    room_sweep_interval: float = Field(30, gt=0, description="Период проверки простаивающих комнат, с")
+    max_rooms: int = Field(10_000, ge=0, description="Комнат в реестре (0 - без ограничения)")
+    max_subscribers_per_room: int = Field(
+        1000, ge=0, description="Подписчиков комнаты в одном воркере (0 - без ограничения)"
+    )
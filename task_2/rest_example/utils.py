@@ -1,28 +1,33 @@
+import re
 import time
-from typing import Tuple
+from collections import OrderedDict
+from typing import Optional, Tuple
 
-from opentelemetry import trace
+from fastapi import FastAPI
+from opentelemetry import context, propagate, trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import \
     OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.instrumentation.logging import LoggingInstrumentor
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
 from prometheus_client import REGISTRY, Counter, Gauge, Histogram
 from prometheus_client.openmetrics.exposition import (CONTENT_TYPE_LATEST,
                                                       generate_latest)
-from starlette.middleware.base import (BaseHTTPMiddleware,
-                                       RequestResponseEndpoint)
 from starlette.requests import Request
 from starlette.responses import Response
 from starlette.routing import Match
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .multiprocess import mark_dead_workers, multiproc_dir, multiprocess_registry
+from .settings import InstrumentationSettings
 
 INFO = Gauge(
     "fastapi_app_info", "FastAPI application information.", [
-        "app_name"]
+        "app_name"], multiprocess_mode="livemax"
 )
 REQUESTS = Counter(
     "fastapi_requests_total", "Total count of requests by method and path.", [
@@ -47,82 +52,280 @@ REQUESTS_IN_PROGRESS = Gauge(
     "fastapi_requests_in_progress",
     "Gauge of requests by method and path currently being processed",
     ["method", "path", "app_name"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Gauge of database pool connections by state (idle, in_use)",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAITING = Gauge(
+    "db_pool_waiting",
+    "Gauge of requests currently waiting for a database connection",
+    multiprocess_mode="livesum",
+)
+DB_POOL_ACQUIRE_TIME = Histogram(
+    "db_pool_acquire_duration_seconds",
+    "Histogram of time spent acquiring a database connection (in seconds)",
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts_total",
+    "Total count of database connection acquire timeouts",
+)
+DB_POOL_HEALTH_CHECK_FAILURES = Counter(
+    "db_pool_health_check_failures_total",
+    "Total count of pooled connections discarded by a failed health check",
+)
+INSTRUMENTATION_OVERHEAD = Counter(
+    "fastapi_instrumentation_overhead_seconds",
+    "Total time spent by the instrumentation middleware itself (in seconds)",
+    ["app_name"],
+)
+CHAT_MESSAGES_DROPPED = Counter(
+    "chat_messages_dropped_total",
+    "Total count of chat messages dropped from full subscriber queues by policy",
+    ["policy"],
+)
+CHAT_SLOW_CONSUMER_DISCONNECTS = Counter(
+    "chat_slow_consumer_disconnects_total",
+    "Total count of chat subscribers disconnected for a full outbound queue",
+)
+CHAT_ROOMS = Gauge(
+    "chat_rooms",
+    "Gauge of chat rooms in the room registry",
+    multiprocess_mode="livemax",
+)
+CHAT_LOCAL_ROOMS = Gauge(
+    "chat_local_rooms",
+    "Gauge of chat rooms with an in-process broadcaster and history",
+    multiprocess_mode="livesum",
+)
+CHAT_SUBSCRIBERS = Gauge(
+    "chat_subscribers",
+    "Gauge of connected chat websocket subscribers",
+    multiprocess_mode="livesum",
+)
+CHAT_ROOMS_EVICTED = Counter(
+    "chat_rooms_evicted_total",
+    "Total count of idle chat rooms removed from the room registry",
+)
+CHAT_LIMIT_REJECTIONS = Counter(
+    "chat_limit_rejections_total",
+    "Total count of chat requests rejected by a room limit",
+    ["limit"],
+)
+CHAT_DELIVERY_ERRORS = Counter(
+    "chat_delivery_errors_total",
+    "Total count of chat messages whose local delivery raised an error",
+)
+CACHE_HITS = Counter(
+    "cache_hits_total", "Total count of in-process cache hits by cache name", ["cache"]
+)
+CACHE_MISSES = Counter(
+    "cache_misses_total", "Total count of in-process cache misses by cache name", ["cache"]
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "Total count of in-process cache evictions by cache name and reason (lru, ttl, invalidation)",
+    ["cache", "reason"],
 )
 
 
-class PrometheusMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, app_name: str = "fastapi-app") -> None:
-        super().__init__(app)
+# Сегменты пути, которые считаются значениями параметров: числа и UUID
+DYNAMIC_SEGMENT = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12})$"
+)
+
+
+def path_shape(path: str) -> str:
+    """Форма пути: /item/42 и /item/43 дают одну и ту же форму /item/:."""
+    return "/".join(":" if DYNAMIC_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+class InstrumentationMiddleware:
+    """
+    Единая ASGI-middleware инструментирования запросов. Одно измерение
+    времени запроса используется и для метрик Prometheus, и для span
+    OpenTelemetry; любой из выходов можно отключить. Шаблон маршрута и
+    дочерние метрики с метками кэшируются по (method, форма пути).
+
+    Время, потраченное самой middleware, копится в счетчике
+    fastapi_instrumentation_overhead_seconds_total.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        app_name: str = "fastapi-app",
+        metrics: bool = True,
+        tracing: bool = True,
+        tracer_provider: Optional[TracerProvider] = None,
+        cache_size: int = 1024,
+    ) -> None:
+        self.app = app
         self.app_name = app_name
+        self.metrics = metrics
+        self.tracer = trace.get_tracer(__name__, tracer_provider=tracer_provider) if tracing else None
+        self.cache_size = cache_size
+        self._routes: "OrderedDict[Tuple[str, str], Optional[tuple]]" = OrderedDict()
+        self._overhead = INSTRUMENTATION_OVERHEAD.labels(app_name=self.app_name)
         INFO.labels(app_name=self.app_name).inc()
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        method = request.method
-        path, is_handled_path = self.get_path(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        method = scope["method"]
+        resolved = self.resolve(scope)
+        if resolved is None:
+            await self.app(scope, receive, send)
+            return
+
+        path, in_progress, requests, processing_time, responses = resolved
+        status_code = HTTP_500_INTERNAL_SERVER_ERROR
 
-        if not is_handled_path:
-            return await call_next(request)
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # Span получает ту же длительность, что и гистограмма: время его
+        # окончания считается от начала по perf_counter
+        start_time_ns = time.time_ns()
+        span = token = None
+        if self.tracer is not None:
+            span = self.tracer.start_span(
+                f"{method} {path}",
+                context=propagate.extract(
+                    {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+                ),
+                kind=SpanKind.SERVER,
+                attributes={"http.request.method": method, "http.route": path, "url.path": scope["path"]},
+                start_time=start_time_ns,
+            )
+            token = context.attach(trace.set_span_in_context(span))
+        if self.metrics:
+            in_progress.inc()
+            requests.inc()
 
-        REQUESTS_IN_PROGRESS.labels(
-            method=method, path=path, app_name=self.app_name).inc()
-        REQUESTS.labels(method=method, path=path, app_name=self.app_name).inc()
         before_time = time.perf_counter()
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except BaseException as e:
+            after_time = time.perf_counter()
             status_code = HTTP_500_INTERNAL_SERVER_ERROR
-            EXCEPTIONS.labels(method=method, path=path, exception_type=type(
-                e).__name__, app_name=self.app_name).inc()
+            if self.metrics:
+                EXCEPTIONS.labels(method=method, path=path, exception_type=type(
+                    e).__name__, app_name=self.app_name).inc()
+            if span is not None:
+                span.record_exception(e)
             raise e from None
         else:
-            status_code = response.status_code
             after_time = time.perf_counter()
-            # retrieve trace id for exemplar
-            span = trace.get_current_span()
-            trace_id = trace.format_trace_id(
-                span.get_span_context().trace_id)
-
-            REQUESTS_PROCESSING_TIME.labels(method=method, path=path, app_name=self.app_name).observe(
-                after_time - before_time, exemplar={'TraceID': trace_id}
-            )
+            if self.metrics:
+                # trace id for exemplar, only for sampled traces
+                exemplar = None
+                if span is not None and span.get_span_context().trace_flags.sampled:
+                    exemplar = {'TraceID': trace.format_trace_id(span.get_span_context().trace_id)}
+                processing_time.observe(after_time - before_time, exemplar=exemplar)
         finally:
-            RESPONSES.labels(method=method, path=path,
-                             status_code=status_code, app_name=self.app_name).inc()
-            REQUESTS_IN_PROGRESS.labels(
-                method=method, path=path, app_name=self.app_name).dec()
+            if self.metrics:
+                try:
+                    responses[status_code].inc()
+                except KeyError:
+                    responses[status_code] = RESPONSES.labels(
+                        method=method, path=path, status_code=status_code, app_name=self.app_name)
+                    responses[status_code].inc()
+                in_progress.dec()
+            if span is not None:
+                span.set_attribute("http.response.status_code", status_code)
+                if status_code >= HTTP_500_INTERNAL_SERVER_ERROR:
+                    span.set_status(Status(StatusCode.ERROR))
+                span.end(end_time=start_time_ns + int((after_time - before_time) * 1e9))
+                context.detach(token)
+            self._overhead.inc(time.perf_counter() - started - (after_time - before_time))
 
-        return response
+    def resolve(self, scope: Scope) -> Optional[tuple]:
+        """Шаблон маршрута и дочерние метрики или None для необработанного пути."""
+        key = (scope["method"], path_shape(scope["path"]))
+        try:
+            resolved = self._routes[key]
+        except KeyError:
+            pass
+        else:
+            self._routes.move_to_end(key)
+            return resolved
+
+        path, is_handled_path = self.get_path(scope)
+        resolved = None
+        if is_handled_path:
+            labels = {"method": scope["method"], "path": path, "app_name": self.app_name}
+            resolved = (
+                path,
+                REQUESTS_IN_PROGRESS.labels(**labels),
+                REQUESTS.labels(**labels),
+                REQUESTS_PROCESSING_TIME.labels(**labels),
+                {},  # RESPONSES по кодам ответа
+            )
+        self._routes[key] = resolved
+        if len(self._routes) > self.cache_size:
+            self._routes.popitem(last=False)
+        return resolved
 
     @staticmethod
-    def get_path(request: Request) -> Tuple[str, bool]:
-        for route in request.app.routes:
-            match, child_scope = route.matches(request.scope)
+    def get_path(scope: Scope) -> Tuple[str, bool]:
+        for route in scope["app"].routes:
+            match, child_scope = route.matches(scope)
             if match == Match.FULL:
                 return route.path, True
 
-        return request.url.path, False
+        return scope["path"], False
 
 
 def metrics(request: Request) -> Response:
-    return Response(generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+    registry = REGISTRY
+    path = multiproc_dir()
+    if path is not None:
+        # несколько воркеров: собираем значения из файлов всех процессов
+        mark_dead_workers(path)
+        registry = multiprocess_registry(path)
+    return Response(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 
-def setting_otlp(app: ASGIApp, app_name: str, endpoint: str, log_correlation: bool = True) -> None:
-    # Setting OpenTelemetry
-    # set the service name to show in traces
-    resource = Resource.create(attributes={
-        "service.name": app_name,
-        "compose_service": app_name
-    })
+def setup_instrumentation(app: FastAPI, app_name: str, settings: InstrumentationSettings) -> None:
+    """Подключает метрики, трассировку и /metrics согласно настройкам."""
+    tracer_provider = None
+    if settings.tracing:
+        # set the service name to show in traces
+        resource = Resource.create(attributes={
+            "service.name": app_name,
+            "compose_service": app_name
+        })
 
-    # set the tracer provider
-    tracer = TracerProvider(resource=resource)
-    trace.set_tracer_provider(tracer)
+        # входящий traceparent решает сам, иначе сэмплируется доля запросов
+        tracer_provider = TracerProvider(
+            resource=resource,
+            sampler=ParentBased(TraceIdRatioBased(settings.trace_sample_rate)),
+        )
+        trace.set_tracer_provider(tracer_provider)
 
-    tracer.add_span_processor(BatchSpanProcessor(
-        OTLPSpanExporter(endpoint=endpoint)))
+        tracer_provider.add_span_processor(BatchSpanProcessor(
+            OTLPSpanExporter(endpoint=settings.otlp_endpoint)))
 
-    if log_correlation:
+    if settings.log_correlation:
         LoggingInstrumentor().instrument(set_logging_format=True)
 
-    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer)
\ No newline at end of file
+    if settings.metrics or settings.tracing:
+        app.add_middleware(
+            InstrumentationMiddleware,
+            app_name=app_name,
+            metrics=settings.metrics,
+            tracing=settings.tracing,
+            tracer_provider=tracer_provider,
+            cache_size=settings.route_cache_size,
+        )
+    app.add_route("/metrics", metrics, include_in_schema=False)
@@ -1,10 +1,29 @@
+import asyncio
+import json
+import math
+import socket
+import sys
+from array import array
 from http import HTTPStatus
+from types import SimpleNamespace
 from typing import Any
 
 import pytest
 from async_asgi_testclient import TestClient
 
+from task_1.admission import AdmissionController
+from task_1.calculations import calculate_fibonacci, factorial_digits, fibonacci_digits
+from task_1.compute import ComputeService, ResultCache
+import task_1.main
+import task_1.stats
+import task_1.utils
 from task_1.main import app
+from task_1.math_api import MathAPI
+from task_1.routing import Router
+from task_1.server import bind_socket
+from task_1.settings import MathSettings
+from task_1.streaming import StreamingMean
+from task_1.utils import dumps, get_query_params, result_body
 
 
 @pytest.mark.xfail()
@@ -91,3 +110,470 @@ async def test_mean(json: dict[str, Any] | None, status_code: int):
     assert response.status_code == status_code
     if status_code == HTTPStatus.OK:
         assert "result" in response.json()
+
+
+def test_router_typed_params_and_static_priority():
+    router = Router()
+    router.add("/items/{item_id:int}", "item")
+    router.add("/items/latest", "latest")
+    router.add("/users/{name}/posts/{post:int}", "post", methods=("GET", "POST"))
+
+    node, params = router.resolve("/items/42")
+    assert node.handlers == {"GET": "item"} and params == {"item_id": 42}
+    assert router.resolve("/items/latest")[0].handlers == {"GET": "latest"}
+    assert router.resolve("/items/abc") is None
+    assert router.resolve("/items/42/extra") is None
+    assert router.resolve("/items") is None
+
+    node, params = router.resolve("/users/ann/posts/7")
+    assert params == {"name": "ann", "post": 7}
+    assert node.allow == b"GET, POST"
+
+    # Постоянный сегмент не подошел дальше по пути: возврат к параметру
+    router.add("/items/latest/{page:int}", "latest page")
+    router.add("/items/{item_id:int}/reviews", "reviews")
+    assert router.resolve("/items/latest/2")[1] == {"page": 2}
+    assert router.resolve("/items/5/reviews")[0].handlers == {"GET": "reviews"}
+    assert router.resolve("/items/latest/reviews") is None
+
+    with pytest.raises(ValueError):
+        router.add("/items/{other:int}", "conflict")
+    with pytest.raises(ValueError):
+        router.add("/items/{item_id:float}", "unknown converter")
+
+
+@pytest.mark.asyncio
+async def test_method_not_allowed():
+    async with TestClient(app) as client:
+        response = await client.post("/factorial", query_string={"n": 1})
+
+    assert response.status_code == HTTPStatus.METHOD_NOT_ALLOWED
+    assert response.headers["allow"] == "GET"
+    assert response.json() == {"error": "Method Not Allowed"}
+
+
+def test_fast_doubling_fibonacci():
+    a, b = 0, 1
+    for n in range(500):
+        assert calculate_fibonacci(n) == a
+        assert fibonacci_digits(n) == len(str(a))
+        a, b = b, a + b
+
+
+def test_result_cache_is_bounded():
+    cache = ResultCache(max_items=3, max_bytes=10)
+    for n in range(4):
+        cache.put(n, b"xx")
+    assert cache.get(0) is None and len(cache) == 3
+    cache.get(1)
+    cache.put("big", b"x" * 6)
+    # Вытеснены самые давно использованные записи
+    assert cache.get(2) is None and cache.get(1) == b"xx"
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
+
+
+@pytest.mark.asyncio
+async def test_large_fibonacci_runs_in_process_pool():
+    service = ComputeService(MathSettings(inline_max_digits=10, workers=1))
+    try:
+        decimal = await service.fibonacci(1000, fibonacci_digits(1000))
+        assert decimal == str(calculate_fibonacci(1000)).encode()
+        assert service._pool is not None
+        service.close()
+        # Повторный запрос отдается из кэша, без пула
+        assert await service.fibonacci(1000, fibonacci_digits(1000)) == decimal
+        assert service._pool is None
+    finally:
+        service.close()
+
+
+@pytest.mark.asyncio
+async def test_large_stats_body_runs_in_process_pool():
+    service = ComputeService(MathSettings(stats_inline_max_bytes=16, workers=1))
+    try:
+        body = array("d", [1.0, 2.0, 3.0, 4.0])
+        if sys.byteorder == "big":
+            body.byteswap()
+        result = await service.statistics(body.tobytes(), True, (50.0,))
+        assert result["mean"] == 2.5 and result["percentiles"] == {"50": 2.5}
+        assert service.stats["offloaded"] == 1 and service._pool is not None
+        # Ошибки разбора приходят из пула как есть
+        with pytest.raises(ValueError):
+            await service.statistics(b'[1, 2, 3, "4", 5, 6]', False, (50.0,))
+        assert await service.statistics(b"[1]", False, (50.0,)) == {
+            "count": 1, "mean": 1.0, "variance": 0.0, "min": 1.0, "max": 1.0, "percentiles": {"50": 1.0}
+        }
+        assert service.stats["inline"] == 1
+    finally:
+        service.close()
+
+
+@pytest.mark.asyncio
+async def test_fibonacci_limits():
+    async with TestClient(app) as client:
+        response = await client.get("/fibonacci/20000")
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()["result"] > 0
+        response = await client.get("/fibonacci/100000000")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_concurrent_factorials_share_one_computation():
+    service = ComputeService(MathSettings(inline_max_digits=100, workers=1))
+    try:
+        results = await asyncio.gather(*(service.factorial(3000, factorial_digits(3000)) for _ in range(3)))
+        assert results[0] == results[1] == results[2]
+        assert len(results[0]) == factorial_digits(3000)
+        assert service.stats["offloaded"] == 1 and service.stats["deduplicated"] == 2
+
+        # Дешевые n считаются в обработчике без пула
+        assert await service.factorial(10, factorial_digits(10)) == b"3628800"
+        assert service.stats["inline"] == 1
+    finally:
+        service.close()
+
+
+@pytest.mark.asyncio
+async def test_large_factorial_response():
+    async with TestClient(app) as client:
+        response = await client.get("/factorial", query_string={"n": 5000})
+        assert response.status_code == HTTPStatus.OK
+        assert response.content.startswith(b'{"result":4228577926')
+        assert len(response.content) == len(b'{"result":}') + factorial_digits(5000)
+        response = await client.get("/factorial", query_string={"n": 10**7})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+async def call_app(path, chunks, headers=(), query_string=b"", method="POST"):
+    """Запрос напрямую в ASGI с телом из нескольких сообщений (more_body)."""
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ] or [{"type": "http.request", "body": b""}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query_string, "headers": list(headers)}
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+async def test_mean_reads_chunked_body(chunk_size):
+    numbers = [1, 2.5, -3e2, 0, 17, 0.125] * 20
+    body = json.dumps(numbers).encode()
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    status, data = await call_app("/mean", chunks)
+    assert status == HTTPStatus.OK
+    assert data["result"] == pytest.approx(sum(numbers) / len(numbers))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "status_code"),
+    [
+        (b" [ 1 , 2 ]\n", HTTPStatus.OK),
+        (b"[ ]", HTTPStatus.BAD_REQUEST),
+        (b"[1,]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[,1]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1 2]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1]x", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[NaN]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'["1"]', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"{}", HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+async def test_mean_validates_stream(body, status_code):
+    status, _ = await call_app("/mean", [body[:2], body[2:]])
+    assert status == status_code
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "chunks",
+    [[b"[1e400]"], [b"[-1e400, 1]"], [b"[1e308,", b" 1e308]"], [b"[1" + b"0" * 400 + b"]"]],
+)
+async def test_mean_rejects_values_out_of_float_range(chunks):
+    # Как и /stats: переполнение - 422, а не null или Infinity в ответе
+    status, _ = await call_app("/mean", chunks)
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_mean_body_size_limit(monkeypatch):
+    monkeypatch.setattr(task_1.main, "settings", MathSettings(max_body_bytes=16))
+    status, data = await call_app("/mean", [b"[1, 2, 3, ", b"4, 5, 6, 7, 8]"])
+    assert status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert data == {"error": "Request Entity Too Large"}
+    # Заявленный Content-Length отклоняется до чтения тела
+    status, _ = await call_app("/mean", [b"[1]"], headers=[(b"content-length", b"1000")])
+    assert status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_streaming_mean_is_compensated():
+    accumulator = StreamingMean()
+    for chunk in [b"[1e16,", b"1.0,", b"-1e16]"]:
+        accumulator.feed(chunk)
+    # Простая сумма с плавающей точкой теряет 1.0
+    assert accumulator.result() == pytest.approx(1 / 3)
+    assert math.isclose(sum([1e16, 1.0, -1e16]) / 3, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_stats_json_and_binary():
+    numbers = [float(i) for i in range(1, 101)]
+    query = b"percentiles=0,50,90"
+    status, data = await call_app("/stats", [json.dumps(numbers).encode()], query_string=query)
+    assert status == HTTPStatus.OK
+    assert data["count"] == 100 and data["mean"] == pytest.approx(50.5)
+    assert data["variance"] == pytest.approx(833.25)
+    assert (data["min"], data["max"]) == (1.0, 100.0)
+    assert data["percentiles"] == {"0": 1.0, "50": pytest.approx(50.5), "90": pytest.approx(90.1)}
+
+    body = array("d", numbers)
+    if sys.byteorder == "big":
+        body.byteswap()
+    payload = body.tobytes()
+    status, binary = await call_app(
+        "/stats",
+        [payload[:100], payload[100:]],
+        headers=[(b"content-type", b"application/octet-stream")],
+        query_string=query,
+    )
+    assert status == HTTPStatus.OK
+    assert binary == data
+
+    async with TestClient(app) as client:
+        response = await client.post("/stats", json=numbers)
+        assert set(response.json()["percentiles"]) == {"50", "90", "95", "99"}
+        # Клиент экранирует запятые, %2C декодируется обратно
+        response = await client.post("/stats", json=numbers, query_string={"percentiles": "0,50,90"})
+        assert response.json() == data
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "content_type", "query", "status_code"),
+    [
+        (b"[]", "application/json", {}, HTTPStatus.BAD_REQUEST),
+        (b'[1, "2"]', "application/json", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, Infinity]", "application/json", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, true]", "application/json", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1e400]", "application/json", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"1234567", "application/octet-stream", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (array("d", [1.0, math.nan]).tobytes(), "application/octet-stream", {}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1]", "application/json", {"percentiles": "101"}, HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+async def test_stats_validation(body, content_type, query, status_code):
+    async with TestClient(app) as client:
+        response = await client.post("/stats", data=body, headers={"content-type": content_type}, query_string=query)
+    assert response.status_code == status_code
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("with_orjson", [True, False])
+@pytest.mark.parametrize("with_numpy", [True, False])
+async def test_stats_rejects_integers_out_of_float_range(monkeypatch, with_orjson, with_numpy):
+    if not with_orjson:
+        monkeypatch.setattr(task_1.utils, "orjson", None)
+    if with_numpy:
+        # numpy.asarray(..., dtype=float64) так же бросает OverflowError на 10**400
+        monkeypatch.setattr(task_1.stats, "np", SimpleNamespace(asarray=lambda values, dtype: array("d", values), float64=None))
+    else:
+        monkeypatch.setattr(task_1.stats, "np", None)
+    with pytest.raises(ValueError):
+        task_1.stats.summarize(b"[1, 1" + b"0" * 400 + b"]", False)
+    status, _ = await call_app("/stats", [b"[1, 1" + b"0" * 400 + b"]"])
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize(
+    ("query_string", "expected"),
+    [
+        (b"", {}),
+        (b"n=5", {"n": "5"}),
+        (b"a=1&&b", {"a": "1", "b": None}),
+        (b"q=a%20b+c&x%3Dy=%D0%BF", {"q": "a b c", "x=y": "п"}),
+        (b"k=1&k=2&k=", {"k": ""}),
+    ],
+)
+def test_query_params(query_string, expected):
+    params = get_query_params({"query_string": query_string})
+    assert params == expected
+    if query_string.startswith(b"k="):
+        assert params.getlist("k") == ["1", "2", ""]
+
+
+@pytest.mark.asyncio
+async def test_responses_are_json():
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    for scope in [
+        {"type": "websocket", "path": "/"},
+        {"type": "http", "path": "/"},
+        {"type": "http", "method": "DELETE", "path": "/mean", "query_string": b""},
+        {"type": "http", "method": "GET", "path": "/factorial", "query_string": b"n=x"},
+    ]:
+        sent = []
+
+        async def send(message, sent=sent):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        body = sent[1]["body"]
+        assert "error" in json.loads(body)
+        assert (b"content-length", str(len(body)).encode()) in sent[0]["headers"]
+
+    assert dumps({"result": 2**70, "text": "п"}) == '{"result":1180591620717411303424,"text":"п"}'.encode()
+    assert result_body(str(2**70).encode()) == dumps({"result": 2**70})
+
+
+@pytest.mark.asyncio
+async def test_lifespan_hooks():
+    api = MathAPI()
+    calls = []
+
+    @api.on_startup()
+    async def first():
+        calls.append("first")
+
+    @api.on_startup()
+    async def second():
+        calls.append("second")
+
+    @api.on_shutdown()
+    async def stop():
+        calls.append("stop")
+
+    async with TestClient(api):
+        assert calls == ["first", "second"]
+    assert calls == ["first", "second", "stop"]
+
+    @api.on_startup()
+    async def broken():
+        raise RuntimeError("warm-up failed")
+
+    # async_asgi_testclient поднимает Exception с самим сообщением lifespan.startup.failed
+    with pytest.raises(Exception) as failure:
+        async with TestClient(api):
+            pass
+    assert type(failure.value) is Exception
+    assert failure.value.args == (
+        {"type": "lifespan.startup.failed", "message": repr(RuntimeError("warm-up failed"))},
+    )
+
+
+@pytest.mark.asyncio
+async def test_health():
+    async with TestClient(app) as client:
+        response = await client.get("/health")
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["status"] == "ok"
+    assert set(response.json()["admission"]) == {"/factorial", "/fibonacci/{n}", "/stats"}
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("MATH_WARM_UP", "0")
+    monkeypatch.setenv("MATH_WORKERS", "3")
+    assert MathSettings.from_env() == MathSettings(workers=3, warm_up=False)
+    monkeypatch.setenv("MATH_WARM_UP", "true")
+    assert MathSettings.from_env().warm_up is True
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="нет SO_REUSEPORT")
+def test_workers_share_port():
+    first = bind_socket("127.0.0.1", 0, reuse_port=True)
+    second = bind_socket("127.0.0.1", first.getsockname()[1], reuse_port=True)
+    try:
+        assert first.getsockname() == second.getsockname()
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.asyncio
+async def test_admission_control():
+    release = asyncio.Event()
+
+    async def handler(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    controller = AdmissionController(lambda scope: scope["cost"], 1, 1, queue_timeout=5.0, cheap_cost=10)
+    admitted = controller.wrap(handler)
+
+    async def call(cost):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await admitted({"cost": cost}, None, send)
+        return sent[0]["status"], dict(sent[0]["headers"])
+
+    running = asyncio.create_task(call(100))
+    queued = asyncio.create_task(call(100))
+    await asyncio.sleep(0)
+    assert (controller.running, controller.queue_depth) == (1, 1)
+
+    # Очередь полна: сразу 503 с Retry-After, дешевый запрос проходит без очереди
+    status, headers = await call(100)
+    assert status == HTTPStatus.SERVICE_UNAVAILABLE and int(headers[b"retry-after"]) >= 1
+    release.set()
+    assert await call(5) == (200, {})
+    assert [await running, await queued] == [(200, {}), (200, {})]
+    assert controller.snapshot() == {
+        "admitted": 2,
+        "bypassed": 1,
+        "queued": 1,
+        "rejected": 1,
+        "timed_out": 0,
+        "running": 0,
+        "queue_depth": 0,
+        "queued_cost": 0,
+        "max_concurrency": 1,
+        "max_queue": 1,
+    }
+
+    # Истекшее ожидание в очереди тоже 503, место в очереди освобождается
+    release.clear()
+    controller.queue_timeout = 0.01
+    running = asyncio.create_task(call(100))
+    await asyncio.sleep(0)
+    assert (await call(100))[0] == HTTPStatus.SERVICE_UNAVAILABLE
+    assert controller.stats["timed_out"] == 1 and controller.queue_depth == 0
+    release.set()
+    await running
+    assert controller.seconds_per_cost > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("n", "status_code"),
+    [
+        ("007", HTTPStatus.OK),
+        ("-0", HTTPStatus.OK),
+        ("²", HTTPStatus.UNPROCESSABLE_ENTITY),
+        ("--5", HTTPStatus.UNPROCESSABLE_ENTITY),
+        ("1" * 5000, HTTPStatus.BAD_REQUEST),
+        ("1" + "0" * 400, HTTPStatus.BAD_REQUEST),
+    ],
+)
+async def test_rejects_hostile_n(n, status_code):
+    # Длинные и не-ASCII числа отклоняются до int() и до оценок через float
+    status, _ = await call_app(f"/fibonacci/{n}", [], method="GET")
+    assert status == status_code
+    status, _ = await call_app("/factorial", [], query_string=f"n={n}".encode(), method="GET")
+    assert status == status_code
@@ -1,22 +1,70 @@
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import aiosqlite
+from prometheus_client import REGISTRY
 from http import HTTPStatus
 from typing import Any
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import pytest
 from faker import Faker
+from fastapi import FastAPI, WebSocketDisconnect
 from fastapi.testclient import TestClient
-
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+from task_2.rest_example.db import crud
+from task_2.rest_example.db.db_engine import configure_connection, pool as db_pool, settings as db_settings
+from task_2.rest_example.db.item_cache import item_cache
+from task_2.rest_example.db.maintenance import checkpoint_and_optimize
+from task_2.rest_example.db.migrations import MIGRATIONS, get_schema_version, run_migrations
+from task_2.rest_example.db.pool import ConnectionPool, PoolTimeoutError
+from task_2.rest_example.broadcast import (
+    HISTORY_OVERHEAD_BYTES,
+    ROOM_FULL_CLOSE_CODE,
+    SLOW_CONSUMER_CLOSE_CODE,
+    Broadcaster,
+    RoomHistory,
+    encode_frame,
+)
+from task_2.rest_example.cache import LRUCache
+from task_2.rest_example.chat_hub import ChatHub, hub as chat_hub
+from task_2.rest_example.pubsub import InMemoryBackend, SQLiteBackend
 from task_2.rest_example.main import app
+from task_2.rest_example.multiprocess import mark_dead_workers, prepare_multiproc_dir
+from task_2.rest_example.settings import ChatSettings, DatabaseSettings
+from task_2.rest_example.utils import InstrumentationMiddleware, path_shape
 
 client = TestClient(app)
 faker = Faker()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def app_lifespan():
+    # lifespan применяет миграции схемы и открывает пул соединений
+    with client:
+        yield
+
+
 @pytest.fixture()
 def existing_empty_cart_id() -> int:
     return client.post("/cart").json()["id"]
 
 
+@pytest.fixture()
+def no_item_cache(monkeypatch):
+    # Тесты crud на временных базах не должны делить кэш товаров с приложением
+    monkeypatch.setattr(item_cache, "enabled", False)
+
+
 @pytest.fixture(scope="session")
 def existing_items() -> list[int]:
     items = [
@@ -159,6 +207,51 @@ def test_get_cart_list(query: dict[str, Any], status_code: int):
             assert quantity <= query["max_quantity"]
 
 
+def test_get_cart_list_quantity_filter_returns_full_pages() -> None:
+    response = client.get("/cart", params={"min_quantity": 1, "limit": 5})
+
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert len(data) == 5
+    for cart in data:
+        assert sum(item["quantity"] for item in cart["items"]) >= 1
+
+
+@pytest.mark.parametrize(
+    ("path", "query"),
+    [
+        ("/item", {}),
+        ("/item", {"min_price": 5.0}),
+        ("/cart", {}),
+        ("/cart", {"max_price": 10000.0}),
+    ],
+)
+def test_cursor_pagination_matches_offset(path: str, query: dict[str, Any]) -> None:
+    expected = client.get(path, params={**query, "limit": 6}).json()
+
+    seen = []
+    response = client.get(path, params={**query, "limit": 2})
+    while len(seen) < len(expected):
+        assert response.status_code == HTTPStatus.OK
+        seen.extend(response.json())
+        assert "link" in response.headers
+        next_url = response.headers["link"].split(">")[0].lstrip("<")
+        response = client.get(next_url)
+
+    assert [entity["id"] for entity in seen] == [entity["id"] for entity in expected]
+
+
+def test_cursor_pagination_rejects_bad_cursor() -> None:
+    response = client.get("/item", params={"after": "not-a-cursor"})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    first_page = client.get("/item", params={"limit": 1})
+    next_url = first_page.headers["link"].split(">")[0].lstrip("<")
+    # Курсор страницы без фильтров нельзя применять к сортировке по цене
+    response = client.get(next_url, params={"min_price": 1.0})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
 @pytest.mark.xfail()
 def test_post_item() -> None:
     item = {"name": "test item", "price": 9.99}
@@ -291,3 +384,949 @@ def test_delete_item(existing_item: dict[str, Any]) -> None:
 
     response = client.delete(f"/item/{item_id}")
     assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_pool_is_bounded_and_times_out(tmp_path) -> None:
+    pool = ConnectionPool(
+        str(tmp_path / "pool.db"), max_size=2, min_size=1, acquire_timeout=0.05
+    )
+    await pool.open()
+    assert pool.size == 1
+
+    first = await pool.acquire()
+    second = await pool.acquire()
+    assert pool.size == 2
+    assert pool.in_use == 2
+
+    with pytest.raises(PoolTimeoutError):
+        await pool.acquire()
+
+    await pool.release(first)
+    assert await pool.acquire() is first
+
+    await pool.release(first)
+    await pool.release(second)
+    await pool.close()
+    assert pool.size == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_hands_connection_to_waiter(tmp_path) -> None:
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, acquire_timeout=1.0)
+    await pool.open()
+    conn = await pool.acquire()
+
+    waiter = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await pool.release(conn)
+    assert await waiter is conn
+
+    await pool.release(conn)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_keeps_connection_handed_off_at_timeout(tmp_path, monkeypatch) -> None:
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, acquire_timeout=1.0)
+    await pool.open()
+    conn = await pool.acquire()
+
+    async def late_wait_for(waiter, timeout):
+        # release() успевает передать соединение, но таймаут срабатывает раньше
+        await pool.release(conn)
+        assert waiter.result() is conn
+        raise asyncio.TimeoutError
+
+    monkeypatch.setattr(asyncio, "wait_for", late_wait_for)
+    with pytest.raises(PoolTimeoutError):
+        await pool.acquire()
+    monkeypatch.undo()
+
+    assert pool.size == 1
+    assert pool.in_use == 0
+    assert await pool.acquire() is conn
+
+    await pool.release(conn)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_rolls_back_and_checks_health(tmp_path) -> None:
+    pool = ConnectionPool(
+        str(tmp_path / "pool.db"), max_size=1, health_check_interval=0.0
+    )
+    await pool.open()
+    conn = await pool.acquire()
+    await conn.execute("CREATE TABLE t (x INTEGER)")
+    await conn.commit()
+    await conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction
+    await pool.release(conn)
+    assert not conn.in_transaction
+
+    # Закрытое соединение не проходит проверку и заменяется новым
+    await conn.close()
+    fresh = await pool.acquire()
+    assert fresh is not conn
+    async with fresh.execute("SELECT COUNT(*) FROM t") as cursor:
+        assert (await cursor.fetchone())[0] == 0
+
+    await pool.release(fresh)
+    await pool.close()
+
+
+def test_pool_lifecycle_follows_lifespan() -> None:
+    # Общие пул и хаб чата открыты сессионным lifespan. Закрываем их в его
+    # event loop, чтобы вложенный lifespan начал с чистого состояния
+    client.portal.call(chat_hub.close)
+    client.portal.call(db_pool.close)
+    try:
+        with TestClient(app) as lifespan_client:
+            assert db_pool.size >= db_pool.min_size
+            assert lifespan_client.post("/cart").status_code == HTTPStatus.CREATED
+            assert db_pool.in_use == 0
+        assert db_pool.size == 0
+    finally:
+        # Снова открываем в loop сессионного lifespan: там работают
+        # остальные тесты и там же пул и хаб будут закрыты
+        client.portal.call(db_pool.open)
+        client.portal.call(chat_hub.start)
+    assert not chat_hub._sweeper.done()
+    assert client.post("/cart").status_code == HTTPStatus.CREATED
+
+
+@pytest.mark.asyncio
+async def test_migrations_record_schema_version(tmp_path) -> None:
+    async with aiosqlite.connect(tmp_path / "schema.db") as conn:
+        assert await run_migrations(conn) == MIGRATIONS[-1].version
+        # Повторный запуск ничего не применяет
+        assert await run_migrations(conn) == MIGRATIONS[-1].version
+        async with conn.execute("SELECT COUNT(*) FROM schema_migrations") as cursor:
+            assert (await cursor.fetchone())[0] == len(MIGRATIONS)
+        assert await get_schema_version(conn) == MIGRATIONS[-1].version
+
+
+def test_add_same_item_twice_keeps_one_row(existing_empty_cart_id: int, existing_item: dict[str, Any]) -> None:
+    cart_id, item_id = existing_empty_cart_id, existing_item["id"]
+    client.post(f"/cart/{cart_id}/add/{item_id}")
+    response = client.post(f"/cart/{cart_id}/add/{item_id}", params={"quantity": 2})
+
+    assert response.status_code == HTTPStatus.OK
+    items = response.json()["items"]
+    assert [entry["quantity"] for entry in items] == [3]
+    assert response.json()["price"] == pytest.approx(existing_item["price"] * 3)
+
+
+@pytest.mark.asyncio
+async def test_hot_queries_use_indexes(tmp_path, no_item_cache) -> None:
+    async with aiosqlite.connect(tmp_path / "plan.db") as conn:
+        await run_migrations(conn)
+        for i in range(1, 51):
+            await conn.execute("INSERT INTO items (name, price) VALUES (?, ?)", (f"item {i}", i))
+            await conn.execute("INSERT INTO carts (price) VALUES (0.0)")
+        await conn.commit()
+        await conn.execute("ANALYZE")
+
+        statements = []
+        await conn.set_trace_callback(statements.append)
+        await crud.get_items_list(conn, min_price=10.0, max_price=20.0)
+        _, cursor = await crud.get_items_list(conn, min_price=10.0, limit=2)
+        await crud.get_items_list(conn, min_price=10.0, limit=2, after=cursor)
+        await crud.get_cart_list(conn, min_price=0.0, min_quantity=1)
+        await crud.get_items_list_versions(conn, min_price=10.0, limit=2)
+        await crud.get_cart_list_versions(conn, min_price=0.0, min_quantity=1)
+        await crud.add_item_to_cart(conn, 1, 5, 2)
+        await crud.get_cart(conn, 1)
+        await conn.set_trace_callback(None)
+
+        hot = [sql for sql in statements if sql.lstrip().split()[0].upper() in ("SELECT", "INSERT", "UPDATE")]
+        assert hot
+        for sql in hot:
+            async with conn.execute(f"EXPLAIN QUERY PLAN {sql}") as plan:
+                details = [row[3] for row in await plan.fetchall()]
+            full_scans = [d for d in details if d.startswith("SCAN") and "INDEX" not in d]
+            assert not full_scans, f"{sql.strip()} -> {details}"
+
+
+@pytest.mark.asyncio
+async def test_pooled_connections_use_sqlite_profile(tmp_path) -> None:
+    pool = ConnectionPool(str(tmp_path / "profile.db"), init=configure_connection)
+    await pool.open()
+    conn = await pool.acquire()
+
+    async def pragma(name: str):
+        async with conn.execute(f"PRAGMA {name}") as cursor:
+            return (await cursor.fetchone())[0]
+
+    assert (await pragma("journal_mode")).upper() == db_settings.journal_mode
+    assert await pragma("synchronous") == 1  # NORMAL
+    assert await pragma("temp_store") == 2  # MEMORY
+    assert await pragma("busy_timeout") == db_settings.busy_timeout_ms
+    assert await pragma("cache_size") == db_settings.cache_size
+
+    await checkpoint_and_optimize(conn)
+    await pool.release(conn)
+    await pool.close()
+
+
+def test_database_settings_from_env(monkeypatch) -> None:
+    monkeypatch.setenv("DB_POOL_MAX_SIZE", "3")
+    monkeypatch.setenv("DB_SYNCHRONOUS", "FULL")
+    settings = DatabaseSettings.from_env()
+    assert settings.pool_max_size == 3
+    assert settings.synchronous == "FULL"
+    assert settings.journal_mode == "WAL"
+
+    monkeypatch.setenv("DB_JOURNAL_MODE", "WAL; DROP TABLE items")
+    with pytest.raises(ValueError):
+        DatabaseSettings.from_env()
+
+
+@pytest.mark.asyncio
+async def test_parallel_adds_to_same_cart_do_not_lose_updates(tmp_path, no_item_cache) -> None:
+    path = str(tmp_path / "concurrent.db")
+    async with aiosqlite.connect(path) as conn:
+        await configure_connection(conn)
+        await run_migrations(conn)
+        await conn.execute("INSERT INTO items (id, name, price) VALUES (1, 'item', 2.5)")
+        await conn.execute("INSERT INTO carts (id, price) VALUES (1, 0.0)")
+        await conn.commit()
+
+    pool = ConnectionPool(path, max_size=10, init=configure_connection)
+    await pool.open()
+
+    async def add_one() -> None:
+        conn = await pool.acquire()
+        try:
+            await crud.add_item_to_cart(conn, 1, 1, 1)
+        finally:
+            await pool.release(conn)
+
+    await asyncio.gather(*(add_one() for _ in range(50)))
+
+    conn = await pool.acquire()
+    cart = await crud.get_cart(conn, 1)
+    async with conn.execute("SELECT price FROM carts WHERE id = 1") as cursor:
+        stored_price = (await cursor.fetchone())[0]
+    await pool.release(conn)
+    await pool.close()
+
+    assert [entry.quantity for entry in cart.items] == [50]
+    assert stored_price == pytest.approx(125.0)
+
+
+def test_add_to_cart_rejects_missing_cart_and_item(existing_empty_cart_id: int, deleted_item: dict[str, Any]) -> None:
+    response = client.post(f"/cart/{10**9}/add/{deleted_item['id']}")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    response = client.post(f"/cart/{existing_empty_cart_id}/add/{deleted_item['id']}")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    response = client.post(f"/cart/{existing_empty_cart_id}/add/{10**9}")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert client.get(f"/cart/{existing_empty_cart_id}").json()["items"] == []
+
+
+def test_lru_cache_ttl_and_bounds() -> None:
+    now = [0.0]
+    cache = LRUCache("test", max_entries=2, max_bytes=10, ttl=5.0, sizeof=len, clock=lambda: now[0])
+
+    cache.put("a", "xxx")
+    cache.put("b", "yyy")
+    assert cache.get("a") == "xxx"
+    cache.put("c", "zzz")  # вытесняется давно не использованный "b"
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxx"
+
+    cache.put("d", "wwwwwww")  # превышен объем: вытесняется "c"
+    assert cache.size_bytes == 10
+    assert cache.get("c") is None
+    assert cache.get("d") == "wwwwwww"
+
+    now[0] = 6.0
+    assert cache.get("a") is None
+    assert cache.get("d") is None
+    assert len(cache) == 0
+
+
+def test_item_reads_are_cached_and_invalidated(existing_item: dict[str, Any]) -> None:
+    item_id = existing_item["id"]
+    hits = REGISTRY.get_sample_value("cache_hits_total", {"cache": "items"}) or 0.0
+
+    assert client.get(f"/item/{item_id}").status_code == HTTPStatus.OK
+    assert client.get(f"/item/{item_id}").json() == existing_item
+    assert REGISTRY.get_sample_value("cache_hits_total", {"cache": "items"}) > hits
+
+    updated = {"name": "cached name", "price": 42.0}
+    client.put(f"/item/{item_id}", json=updated)
+    assert client.get(f"/item/{item_id}").json() == {**existing_item, **updated}
+
+    client.delete(f"/item/{item_id}")
+    assert client.get(f"/item/{item_id}").status_code == HTTPStatus.NOT_FOUND
+
+    metrics = client.get("/metrics").text
+    assert "cache_hits_total" in metrics
+    assert "cache_evictions_total" in metrics
+
+
+def test_item_writes_ignore_stale_cache(existing_item: dict[str, Any]) -> None:
+    item_id = existing_item["id"]
+    assert client.get(f"/item/{item_id}").status_code == HTTPStatus.OK
+
+    # Другой воркер удаляет товар: в кэше этого процесса он остается живым
+    with sqlite3.connect(db_settings.path) as other_worker:
+        other_worker.execute(
+            "UPDATE items SET deleted = TRUE, version = version + 1 WHERE id = ?", (item_id,)
+        )
+
+    response = client.patch(f"/item/{item_id}", json={"price": existing_item["price"] + 1})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    response = client.put(f"/item/{item_id}", json={"name": "stale", "price": 1.0})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert "уже помечен" in client.delete(f"/item/{item_id}").json()["detail"]
+    assert client.get(f"/item/{item_id}").status_code == HTTPStatus.NOT_FOUND
+
+
+def test_serve_disables_item_cache_for_several_workers(monkeypatch) -> None:
+    from task_2.rest_example import serve
+
+    monkeypatch.setattr(serve.uvicorn, "run", lambda *args, **kwargs: None)
+    monkeypatch.delenv("ITEM_CACHE_ENABLED", raising=False)
+    monkeypatch.setattr(sys, "argv", ["serve", "--workers", "1"])
+    serve.main()
+    assert "ITEM_CACHE_ENABLED" not in os.environ
+
+    monkeypatch.setattr(sys, "argv", ["serve", "--workers", "4"])
+    serve.main()
+    assert os.environ["ITEM_CACHE_ENABLED"] == "0"
+
+    monkeypatch.setenv("ITEM_CACHE_ENABLED", "1")
+    serve.main()
+    assert os.environ["ITEM_CACHE_ENABLED"] == "1"
+
+
+def test_item_list_cache_sees_new_items() -> None:
+    params = {"min_price": 0.01, "limit": 10**6}
+    before = client.get("/item", params=params).json()
+    created = client.post("/item", json={"name": "fresh", "price": 1.0}).json()
+    after = client.get("/item", params=params).json()
+    assert len(after) == len(before) + 1
+    assert created in after
+
+
+def test_item_etag_and_conditional_get(existing_item: dict[str, Any]) -> None:
+    item_id = existing_item["id"]
+    response = client.get(f"/item/{item_id}")
+    etag = response.headers["etag"]
+    assert "version" not in response.json()
+
+    response = client.get(f"/item/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    client.patch(f"/item/{item_id}", json={"price": existing_item["price"] + 1})
+    response = client.get(f"/item/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] != etag
+
+
+def test_cart_etag_changes_with_contents(existing_empty_cart_id: int, existing_item: dict[str, Any]) -> None:
+    cart_id = existing_empty_cart_id
+    etag = client.get(f"/cart/{cart_id}").headers["etag"]
+    assert client.get(f"/cart/{cart_id}", headers={"If-None-Match": etag}).status_code == HTTPStatus.NOT_MODIFIED
+
+    client.post(f"/cart/{cart_id}/add/{existing_item['id']}")
+    response = client.get(f"/cart/{cart_id}", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    etag = response.headers["etag"]
+
+    # Изменение товара в корзине меняет и ETag корзины
+    client.put(f"/item/{existing_item['id']}", json={"name": "renamed", "price": 1.0})
+    assert client.get(f"/cart/{cart_id}", headers={"If-None-Match": etag}).status_code == HTTPStatus.OK
+
+
+@pytest.mark.parametrize(
+    ("path", "builder"),
+    [
+        ("/item", "task_2.rest_example.routers.item.get_items_list"),
+        ("/cart", "task_2.rest_example.routers.cart.get_cart_list"),
+    ],
+)
+def test_list_etag(path: str, builder: str, monkeypatch) -> None:
+    response = client.get(path, params={"limit": 3})
+    etag = response.headers["etag"]
+
+    # 304 решается по версиям строк, страница моделей не строится
+    def fail(*args, **kwargs):
+        raise AssertionError("страница построена для 304")
+
+    monkeypatch.setattr(builder, fail)
+    response = client.get(path, params={"limit": 3}, headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_cart_list_etag_follows_cart_items(existing_empty_cart_id: int, existing_item: dict[str, Any]) -> None:
+    client.post(f"/cart/{existing_empty_cart_id}/add/{existing_item['id']}")
+    price = client.get(f"/cart/{existing_empty_cart_id}").json()["price"]
+    params = {"min_price": price, "max_price": price}
+    etag = client.get("/cart", params=params).headers["etag"]
+    assert client.get("/cart", params=params, headers={"If-None-Match": etag}).status_code == HTTPStatus.NOT_MODIFIED
+
+    client.put(f"/item/{existing_item['id']}", json={"name": "renamed", "price": existing_item["price"]})
+    response = client.get("/cart", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert any(entry["item"]["name"] == "renamed" for cart in response.json() for entry in cart["items"])
+
+
+def test_bulk_item_create_json_and_ndjson() -> None:
+    response = client.post(
+        "/item/bulk",
+        json=[{"name": "bulk 1", "price": 1.5}, {"name": "bad", "price": -1}, {"name": "bulk 2", "price": 2.5}],
+    )
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert (data["created"], data["failed"]) == (2, 1)
+    assert [row["status"] for row in data["results"]] == [201, 422, 201]
+    first_id = data["results"][0]["id"]
+    assert client.get(f"/item/{first_id}").json()["name"] == "bulk 1"
+    assert client.get(f"/item/{data['results'][2]['id']}").json()["price"] == 2.5
+
+    body = b'{"name": "nd 1", "price": 3.0}\n{broken\n{"name": "nd 2", "price": 4.0}\n'
+    response = client.post("/item/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    data = response.json()
+    assert [row["status"] for row in data["results"]] == [201, 422, 201]
+    assert client.get(f"/item/{data['results'][2]['id']}").json()["name"] == "nd 2"
+
+    assert client.post("/item/bulk", json={"name": "x"}).status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_bulk_add_to_cart(existing_empty_cart_id: int, existing_items: list[int], deleted_item: dict[str, Any]) -> None:
+    cart_id = existing_empty_cart_id
+    body = [
+        {"item_id": existing_items[0], "quantity": 2},
+        {"item_id": deleted_item["id"]},
+        {"item_id": existing_items[0], "quantity": 1},
+        {"item_id": existing_items[1], "quantity": 0},
+    ]
+    response = client.post(f"/cart/{cart_id}/add-bulk", json=body)
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert [row["status"] for row in data["results"]] == [200, 404, 200, 422]
+    assert (data["added"], data["failed"]) == (2, 2)
+    assert [(entry["item"]["id"], entry["quantity"]) for entry in data["cart"]["items"]] == [(existing_items[0], 3)]
+    assert client.get(f"/cart/{cart_id}").json() == data["cart"]
+
+    assert client.post(f"/cart/{10**9}/add-bulk", json=body).status_code == HTTPStatus.NOT_FOUND
+
+
+def test_instrumentation_labels_route_templates(existing_item: dict[str, Any]) -> None:
+    assert path_shape(f"/item/{existing_item['id']}") == "/item/:"
+    assert path_shape(f"/chat/{uuid4()}") == "/chat/:"
+    assert path_shape("/item/bulk") == "/item/bulk"
+
+    labels = {"method": "GET", "path": "/item/{item_id}", "app_name": "fastapi_app"}
+    before = REGISTRY.get_sample_value("fastapi_requests_total", labels) or 0
+    responses = {**labels, "status_code": "200"}
+    before_responses = REGISTRY.get_sample_value("fastapi_responses_total", responses) or 0
+    for _ in range(3):
+        assert client.get(f"/item/{existing_item['id']}").status_code == HTTPStatus.OK
+    assert client.get("/item/not-a-number").status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    assert REGISTRY.get_sample_value("fastapi_requests_total", labels) == before + 4
+    assert REGISTRY.get_sample_value("fastapi_responses_total", responses) == before_responses + 3
+    assert REGISTRY.get_sample_value("fastapi_requests_in_progress", labels) == 0
+
+
+
+def test_instrumentation_route_cache_is_bounded() -> None:
+    middleware = InstrumentationMiddleware(app, app_name="route-cache-test", cache_size=2)
+
+    def scope(method: str, path: str) -> dict[str, Any]:
+        return {"type": "http", "method": method, "path": path, "root_path": "", "app": app}
+
+    first = middleware.resolve(scope("GET", "/item/1"))
+    assert first is not None and first[0] == "/item/{item_id}"
+    # Другое значение параметра берется из кэша вместе с дочерними метриками
+    assert middleware.resolve(scope("GET", "/item/2")) is first
+    assert middleware.resolve(scope("GET", "/no/such/path")) is None
+    assert middleware.resolve(scope("POST", "/item/1")) is None
+    assert len(middleware._routes) == 2
+
+
+def instrumented_app(app_name: str, sampler) -> tuple[TestClient, InMemorySpanExporter]:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=sampler)
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+    inner = FastAPI()
+
+    @inner.get("/ping/{n}")
+    async def ping(n: int) -> dict[str, int]:
+        return {"n": n}
+
+    @inner.get("/boom")
+    async def boom() -> None:
+        raise RuntimeError("boom")
+
+    inner.add_middleware(InstrumentationMiddleware, app_name=app_name, tracer_provider=provider)
+    return TestClient(inner, raise_server_exceptions=False), exporter
+
+
+def test_instrumentation_emits_spans_and_metrics_from_one_measurement() -> None:
+    test_client, exporter = instrumented_app("instrumentation-test", ALWAYS_ON)
+    assert test_client.get("/ping/1").status_code == HTTPStatus.OK
+    assert test_client.get("/boom").status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+
+    ping_span, boom_span = exporter.get_finished_spans()
+    assert ping_span.name == "GET /ping/{n}"
+    assert ping_span.attributes["http.route"] == "/ping/{n}"
+    assert ping_span.attributes["http.response.status_code"] == 200
+    assert boom_span.status.status_code == StatusCode.ERROR
+    assert boom_span.events[0].name == "exception"
+
+    labels = {"method": "GET", "path": "/ping/{n}", "app_name": "instrumentation-test"}
+    duration = REGISTRY.get_sample_value("fastapi_requests_duration_seconds_sum", labels)
+    assert duration == pytest.approx((ping_span.end_time - ping_span.start_time) / 1e9, abs=1e-6)
+    exemplars = [
+        sample.exemplar.labels["TraceID"]
+        for metric in REGISTRY.collect() if metric.name == "fastapi_requests_duration_seconds"
+        for sample in metric.samples if sample.exemplar and sample.labels.get("app_name") == "instrumentation-test"
+    ]
+    assert exemplars == [trace.format_trace_id(ping_span.context.trace_id)]
+    assert REGISTRY.get_sample_value(
+        "fastapi_exceptions_total", {**labels, "path": "/boom", "exception_type": "RuntimeError"}
+    ) == 1
+    assert REGISTRY.get_sample_value(
+        "fastapi_instrumentation_overhead_seconds_total", {"app_name": "instrumentation-test"}
+    ) > 0
+
+
+def test_instrumentation_trace_sampling() -> None:
+    test_client, exporter = instrumented_app("sampling-test", ParentBased(TraceIdRatioBased(0.0)))
+    for i in range(5):
+        test_client.get(f"/ping/{i}")
+    assert exporter.get_finished_spans() == ()
+    labels = {"method": "GET", "path": "/ping/{n}", "app_name": "sampling-test"}
+    assert REGISTRY.get_sample_value("fastapi_requests_total", labels) == 5
+
+    # Входящий сэмплированный traceparent продолжает трассу
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    test_client.get("/ping/1", headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    (span,) = exporter.get_finished_spans()
+    assert trace.format_trace_id(span.context.trace_id) == trace_id
+
+
+def run_with_multiproc_dir(path, code: str) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(path), "PYTHONPATH": os.getcwd()}
+    return subprocess.run(
+        [sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def test_prepare_multiproc_dir_removes_only_metric_files(tmp_path) -> None:
+    for name in ["counter_1.db", "gauge_livesum_2.db", "histogram_3.db", "other.db", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"")
+    assert prepare_multiproc_dir(str(tmp_path)) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["notes.txt", "other.db"]
+    assert prepare_multiproc_dir(str(tmp_path / "new")) == 0
+
+
+def test_multiprocess_metrics_aggregate_workers(tmp_path) -> None:
+    worker = (
+        "from task_2.rest_example.utils import REQUESTS, REQUESTS_IN_PROGRESS, INFO\n"
+        "labels = dict(method='GET', path='/item/{item_id}', app_name='mp-test')\n"
+        "REQUESTS.labels(**labels).inc(3)\n"
+        "REQUESTS_IN_PROGRESS.labels(**labels).inc()\n"
+        "INFO.labels(app_name='mp-test').inc()\n"
+        "import os; print(os.getpid())\n"
+    )
+    # Два воркера завершаются, не сняв свои live-gauge (как при падении)
+    pids = [run_with_multiproc_dir(tmp_path, worker).strip() for _ in range(2)]
+    assert all((tmp_path / f"gauge_livesum_{pid}.db").exists() for pid in pids)
+
+    scrape = (
+        "from task_2.rest_example.utils import metrics\n"
+        "print(metrics(None).body.decode())\n"
+    )
+    body = run_with_multiproc_dir(tmp_path, scrape)
+    lines = [line for line in body.splitlines() if "mp-test" in line]
+    assert 'fastapi_requests_total{app_name="mp-test",method="GET",path="/item/{item_id}"} 6.0' in lines
+    # Мертвые воркеры не учитываются в live-gauge
+    assert not any(line.startswith(("fastapi_requests_in_progress", "fastapi_app_info")) for line in lines)
+    assert not any(list(tmp_path.glob(f"gauge_live*_{pid}.db")) for pid in pids)
+    assert (tmp_path / f"counter_{pids[0]}.db").exists()
+    # Файлы процесса, собиравшего метрики, тоже уходят: он уже завершился
+    assert mark_dead_workers(str(tmp_path)) != []
+    assert list(tmp_path.glob("gauge_live*_*.db")) == []
+
+
+class FakeWebSocket:
+    def __init__(self, blocked: bool = False) -> None:
+        self.frames: list[str] = []
+        self.seqs: list[int] = []
+        self.closed_with = None
+        self.sends = 0
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def accept(self) -> None:
+        pass
+
+    async def send(self, message: dict[str, Any]) -> None:
+        await self.unblocked.wait()
+        self.sends += 1
+        data = json.loads(message["text"])
+        for item in data if isinstance(data, list) else [data]:
+            self.seqs.append(item["seq"])
+            self.frames.append(item["text"])
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+async def settle() -> None:
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_slow_subscriber_drops_oldest() -> None:
+    broadcaster = Broadcaster(queue_size=2, policy="drop_oldest", shards=2)
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    await broadcaster.subscribe(fast)
+    slow_subscriber = await broadcaster.subscribe(slow)
+
+    for i in range(5):
+        await broadcaster.publish(f"m{i}")
+        await settle()
+    # Быстрый подписчик получил все, пока медленный висит на первом send
+    assert fast.frames == [f"m{i}" for i in range(5)]
+    assert slow_subscriber.dropped == 2
+
+    slow.unblocked.set()
+    await settle()
+    assert slow.frames == ["m0", "m3", "m4"]
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_disconnects_slow_subscriber() -> None:
+    broadcaster = Broadcaster(queue_size=1, policy="disconnect", shards=1)
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    await broadcaster.subscribe(fast)
+    await broadcaster.subscribe(slow)
+
+    for i in range(3):
+        await broadcaster.publish(f"m{i}")
+        await settle()
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert len(broadcaster) == 1
+    assert fast.frames == ["m0", "m1", "m2"]
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_publish_does_not_touch_subscribers() -> None:
+    broadcaster = Broadcaster(shards=4)
+    sockets = [FakeWebSocket() for _ in range(1000)]
+    subscribers = [await broadcaster.subscribe(ws) for ws in sockets]
+
+    await broadcaster.publish("hello")
+    # publish только кладет кадр в очереди шардов, рассылка идет в их задачах
+    assert all(subscriber.pending == 0 for subscriber in subscribers)
+    await settle()
+    assert all(ws.frames == ["hello"] for ws in sockets)
+
+    await broadcaster.unsubscribe(sockets[0])
+    await broadcaster.publish("bye")
+    await settle()
+    assert sockets[0].frames == ["hello"] and sockets[1].frames == ["hello", "bye"]
+    await broadcaster.close()
+
+
+def test_chat_publish_reaches_websocket_subscriber() -> None:
+    chat_id = client.post("/chat/").json()["chat_id"]
+    with client.websocket_connect(f"/chat/subscribe/{chat_id}") as ws:
+        assert "подключился" in ws.receive_json()["text"]
+        response = client.post(f"/chat/publish/{chat_id}", json={"message": "привет"})
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        assert ws.receive_json()["text"] == "привет"
+        ws.send_text("эхо")
+        assert ws.receive_json()["text"].endswith(": эхо")
+
+
+def test_chat_subscriber_is_removed_on_publish_error(monkeypatch) -> None:
+    chat_id = client.post("/chat/").json()["chat_id"]
+    publish = chat_hub.publish
+
+    async def failing_publish(room_id, message):
+        if message.endswith(": сбой"):
+            raise sqlite3.OperationalError("database is locked")
+        await publish(room_id, message)
+
+    monkeypatch.setattr(chat_hub, "publish", failing_publish)
+    with pytest.raises(sqlite3.OperationalError):
+        with client.websocket_connect(f"/chat/subscribe/{chat_id}") as ws:
+            ws.receive_json()
+            ws.send_text("сбой")
+            ws.receive_json()
+    # Подписчик и его задача отправки не остались в комнате
+    assert len(chat_hub.local_rooms[UUID(chat_id)]) == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pubsub_shares_rooms_and_messages(tmp_path) -> None:
+    # Два backend на одном файле изображают два воркера
+    path = str(tmp_path / "bus.db")
+    settings = ChatSettings()
+    first = ChatHub(SQLiteBackend(path, poll_interval=0.001), settings)
+    second = ChatHub(SQLiteBackend(path, poll_interval=0.001), settings)
+    await first.start()
+    await second.start()
+    try:
+        room_id = await first.create_room()
+        assert await second.has_room(room_id)
+        assert await second.list_rooms() == [room_id]
+
+        ws_first, ws_second = FakeWebSocket(), FakeWebSocket()
+        await first.subscribe(room_id, ws_first)
+        await second.subscribe(room_id, ws_second)
+        for i in range(3):
+            await first.publish(room_id, f"first {i}")
+            await second.publish(room_id, f"second {i}")
+
+        for _ in range(200):
+            if len(ws_first.frames) == len(ws_second.frames) == 6:
+                break
+            await asyncio.sleep(0.005)
+        # Все воркеры получают сообщения в одном и том же порядке
+        assert len(ws_first.frames) == 6
+        assert ws_first.frames == ws_second.frames
+    finally:
+        await first.close()
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pubsub_survives_handler_error(tmp_path) -> None:
+    backend = SQLiteBackend(str(tmp_path / "bus.db"), poll_interval=0.001)
+    delivered = []
+
+    async def handler(room_id, seq, message):
+        if message == "сбой":
+            raise ValueError(message)
+        delivered.append(message)
+
+    errors_before = REGISTRY.get_sample_value("chat_delivery_errors_total") or 0
+    await backend.start(handler)
+    try:
+        room_id = uuid4()
+        await backend.create_room(room_id)
+        await backend.publish(room_id, "сбой")
+        await backend.publish(room_id, "дальше")
+        for _ in range(200):
+            if delivered:
+                break
+            await asyncio.sleep(0.005)
+        # Опрос шины продолжился после ошибки обработчика
+        assert delivered == ["дальше"]
+        assert REGISTRY.get_sample_value("chat_delivery_errors_total") == errors_before + 1
+    finally:
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pubsub_polls_only_committed_messages(tmp_path) -> None:
+    backend = SQLiteBackend(str(tmp_path / "bus.db"), poll_interval=0.001)
+    delivered = []
+
+    async def handler(room_id, seq, message):
+        delivered.append((seq, message))
+
+    await backend.start(handler)
+    try:
+        room_id = uuid4()
+        await backend.create_room(room_id)
+        # Пачка пишется, но откатывается: опрос не должен ее увидеть
+        with pytest.raises(RuntimeError):
+            async with backend._transaction():
+                await backend._conn.execute(
+                    "INSERT INTO chat_messages (room_id, message) VALUES (?, ?)", (str(room_id), "откат")
+                )
+                await asyncio.sleep(0.05)
+                raise RuntimeError("откат пачки")
+        await backend.publish(room_id, "после отката")
+        for _ in range(200):
+            if delivered:
+                break
+            await asyncio.sleep(0.005)
+        # seq откатившейся пачки переиспользован и не пропущен
+        assert [message for _, message in delivered] == ["после отката"]
+    finally:
+        await backend.close()
+
+
+def test_room_history_is_bounded() -> None:
+    history = RoomHistory(max_messages=3, max_bytes=10_000)
+    for seq in range(1, 6):
+        history.append(seq, encode_frame(seq, f"m{seq}"))
+    assert [seq for seq, _ in history.since(0)] == [3, 4, 5]
+    assert [seq for seq, _ in history.since(4)] == [5]
+    assert history.since(5) == []
+
+    small = RoomHistory(max_messages=100, max_bytes=2 * HISTORY_OVERHEAD_BYTES + 100)
+    for seq in range(1, 4):
+        small.append(seq, encode_frame(seq, "x" * 40))
+    assert len(small) == 1 and small.first_seq == 3
+    assert small.size_bytes <= small.max_bytes
+
+
+@pytest.mark.asyncio
+async def test_subscribe_since_replays_without_duplicates() -> None:
+    broadcaster = Broadcaster(history=RoomHistory(max_messages=100), shards=1)
+    live = FakeWebSocket()
+    await broadcaster.subscribe(live)
+    for i in range(3):
+        await broadcaster.publish(f"m{i}")
+    # Сообщения еще во входной очереди шарда в момент подписки
+    late = FakeWebSocket()
+    await broadcaster.subscribe(late, since=1)
+    await broadcaster.publish("m3")
+    await settle()
+    assert live.frames == ["m0", "m1", "m2", "m3"]
+    assert late.frames == ["m1", "m2", "m3"]
+    assert late.seqs == sorted(set(late.seqs))
+    await broadcaster.close()
+
+
+def test_chat_reconnect_replays_missed_messages() -> None:
+    chat_id = client.post("/chat/").json()["chat_id"]
+    with client.websocket_connect(f"/chat/subscribe/{chat_id}") as ws:
+        last_seq = ws.receive_json()["seq"]
+    for i in range(3):
+        client.post(f"/chat/publish/{chat_id}", json={"message": f"пропущено {i}"})
+
+    with client.websocket_connect(f"/chat/subscribe/{chat_id}?since={last_seq}") as ws:
+        texts = [ws.receive_json()["text"] for _ in range(5)]
+    assert "отключился" in texts[0]
+    assert texts[1:4] == [f"пропущено {i}" for i in range(3)]
+    assert "подключился" in texts[4]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+async def test_idle_rooms_are_evicted(backend: str, tmp_path) -> None:
+    settings = ChatSettings(room_idle_ttl=0.2)
+    if backend == "memory":
+        hub = ChatHub(InMemoryBackend(), settings)
+    else:
+        hub = ChatHub(SQLiteBackend(str(tmp_path / "bus.db"), poll_interval=0.001), settings)
+    await hub.start()
+    try:
+        idle, busy = await hub.create_room(), await hub.create_room()
+        await hub.publish(idle, "одно сообщение")
+        await hub.subscribe(busy, FakeWebSocket())
+        await asyncio.sleep(0.5)
+        await hub.sweep()
+        # Комната с подписчиком остается, пустая удаляется вместе с историей
+        assert not await hub.has_room(idle)
+        assert await hub.has_room(busy)
+        assert set(hub.local_rooms) == {busy}
+    finally:
+        await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_chat_room_and_subscriber_limits() -> None:
+    hub = ChatHub(InMemoryBackend(), ChatSettings(max_rooms=2, max_subscribers_per_room=1))
+    await hub.start()
+    try:
+        room_id = await hub.create_room()
+        assert await hub.create_room() is not None
+        assert await hub.create_room() is None
+
+        first, second = FakeWebSocket(), FakeWebSocket()
+        assert await hub.subscribe(room_id, first) is not None
+        assert await hub.subscribe(room_id, second) is None
+        assert second.closed_with == ROOM_FULL_CLOSE_CODE
+        assert len(hub.local_rooms[room_id]) == 1
+    finally:
+        await hub.close()
+
+
+def test_list_chats_is_paginated() -> None:
+    created = {client.post("/chat/").json()["chat_id"] for _ in range(3)}
+    listed, after, pages = [], None, 0
+    while True:
+        params = {"limit": 2} if after is None else {"limit": 2, "after": after}
+        response = client.get("/chat/", params=params)
+        assert response.status_code == HTTPStatus.OK
+        page = response.json()
+        assert len(page["chat_ids"]) <= 2
+        listed += page["chat_ids"]
+        pages += 1
+        after = page["next_after"]
+        if after is None:
+            assert "Link" not in response.headers
+            break
+        assert 'rel="next"' in response.headers["Link"]
+    assert pages >= 2
+    assert listed == sorted(listed) and created <= set(listed)
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_coalesces_messages_within_window() -> None:
+    broadcaster = Broadcaster(history=RoomHistory(max_messages=100), shards=2, coalesce_window=0.05)
+    early = FakeWebSocket()
+    await broadcaster.subscribe(early)
+    for i in range(10):
+        await broadcaster.publish(f"m{i}")
+    # Подписка посреди окна: ранние сообщения уходят без нее, повтор только из истории
+    late = FakeWebSocket()
+    await broadcaster.subscribe(late, since=5)
+    for i in range(10, 20):
+        await broadcaster.publish(f"m{i}")
+    await asyncio.sleep(0.1)
+    await settle()
+
+    assert early.frames == [f"m{i}" for i in range(20)]
+    assert early.sends == 2
+    assert late.frames == [f"m{i}" for i in range(5, 20)]
+    assert late.seqs == sorted(set(late.seqs))
+    assert len(broadcaster.history) == 20
+    await broadcaster.close()
+
+
+def test_chat_publish_batch() -> None:
+    chat_id = client.post("/chat/").json()["chat_id"]
+    with client.websocket_connect(f"/chat/subscribe/{chat_id}") as ws:
+        first = ws.receive_json()["seq"]
+        response = client.post(f"/chat/publish/{chat_id}/batch", json={"messages": ["a", "b", "c"]})
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        received = [ws.receive_json() for _ in range(3)]
+    assert [item["text"] for item in received] == ["a", "b", "c"]
+    assert [item["seq"] for item in received] == [first + 1, first + 2, first + 3]
+
+    assert client.post(f"/chat/publish/{chat_id}/batch", json={"messages": []}).status_code == (
+        HTTPStatus.UNPROCESSABLE_ENTITY
+    )
+    assert client.post(f"/chat/publish/{uuid4()}/batch", json={"messages": ["a"]}).status_code == (
+        HTTPStatus.NOT_FOUND
+    )
+
+
+def test_client_page_stops_reconnecting_for_unknown_room() -> None:
+    chat_id = client.post("/chat/").json()["chat_id"]
+    page = client.get(f"/client/{chat_id}").text
+    # Неизвестная комната - окончательный отказ, медленный подписчик переподключается
+    assert "event.code === 1008" in page and "retryDelay * 2" in page
+    assert SLOW_CONSUMER_CLOSE_CODE != 1008
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(f"/chat/subscribe/{uuid4()}"):
+            pass
+    assert closed.value.code == 1008